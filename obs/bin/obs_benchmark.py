@@ -0,0 +1,107 @@
+#!/usr/bin/python
+
+# Copyright (C) 2020-2021 OpenBikeSensor Contributors
+# Contact: https://openbikesensor.org
+#
+# This file is part of the OpenBikeSensor Scripts Collection.
+#
+# The OpenBikeSensor Scripts Collection is free software: you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public License as
+# published by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# The OpenBikeSensor Scripts Collection is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Lesser
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with the OpenBikeSensor Scripts Collection.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+import argparse
+import json
+import logging
+import sys
+import tempfile
+
+import coloredlogs
+
+from obs.face.benchmark import Benchmark, compare_results
+
+log = logging.getLogger(__name__)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='measures the throughput of the processing stages on synthetic '
+                                                 'OpenBikeSensor tracks and a synthetic road network')
+    parser.add_argument('-o', '--output', action='store',
+                        help='filename of the JSON file the results are written to')
+    parser.add_argument('-c', '--compare', action='store',
+                        help='filename of a previous results JSON file the results are compared to')
+    parser.add_argument('--max-slowdown', action='store', type=float, default=None,
+                        help='fail if the throughput of any stage is lower than the one of the compared results by '
+                             'more than this fraction, e.g. 0.2')
+    parser.add_argument('-p', '--path', action='store', default=None,
+                        help='directory for the generated data, default: a temporary directory')
+    parser.add_argument('-t', '--tracks', action='store', type=int, default=4,
+                        help='number of synthetic tracks, default: 4')
+    parser.add_argument('-n', '--samples', action='store', type=int, default=1800,
+                        help='number of samples per track, recorded at 1Hz, default: 1800')
+    parser.add_argument('-f', '--format', action='store', choices=["2", "1.3"], default="2",
+                        help='CSV format version of the tracks, default: 2')
+    parser.add_argument('--raw-measurements', action='store', type=int, default=10,
+                        help='maximum number of raw measurements per line in format 2, default: 10')
+    parser.add_argument('--gps-noise', action='store', type=float, default=3.0,
+                        help='standard deviation of the GPS noise in meters, default: 3.0')
+    parser.add_argument('--streets', action='store', type=int, default=12,
+                        help='number of streets in each direction of the road grid, default: 12')
+    parser.add_argument('--stop-probability', action='store', type=float, default=0.0,
+                        help='probability of the cyclist stopping at an intersection for 30s on average, default: 0.0')
+    parser.add_argument('--seed', action='store', type=int, default=0,
+                        help='seed of the random generator, default: 0')
+    parser.add_argument('-r', '--repeat', action='store', type=int, default=3,
+                        help='number of runs, the fastest run of each stage is reported, default: 3')
+    parser.add_argument('-v', '--verbose', action='store_true', help='be verbose')
+
+    args = parser.parse_args()
+
+    coloredlogs.install(level=logging.DEBUG if args.verbose else logging.INFO,
+                        fmt="%(asctime)s %(name)s %(levelname)s %(message)s")
+
+    # the per-track statistics of the processing stages are not of interest here
+    if not args.verbose:
+        logging.getLogger("obs.face").setLevel(logging.WARNING)
+        logging.getLogger("obs.face.benchmark").setLevel(logging.INFO)
+
+    with tempfile.TemporaryDirectory() as path_temporary:
+        benchmark = Benchmark(args.path or path_temporary, n_tracks=args.tracks, n_samples=args.samples,
+                              format_version=args.format, raw_measurements=args.raw_measurements,
+                              gps_noise=args.gps_noise, n_streets=args.streets,
+                              stop_probability=args.stop_probability, seed=args.seed)
+        results = benchmark.run(repeat=args.repeat)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        log.info("wrote results to %s", args.output)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        changes = compare_results(results, baseline)
+
+        log.info("throughput compared to %s (commit %s):", args.compare, baseline.get("commit"))
+        failed = False
+        for name, change in changes.items():
+            log.info("%-14s %+8.1f%%", name, change * 100.0)
+            if args.max_slowdown is not None and change < -args.max_slowdown:
+                log.error("stage %s is slower than allowed", name)
+                failed = True
+
+        if failed:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -20,63 +20,127 @@
 # <http://www.gnu.org/licenses/>.
 
 import argparse
+import json
 import pathlib
+import queue as thread_queue
+import threading
 from multiprocessing import Process, Queue
 import logging
 import os
 import sys
 import time
 
-import jsons
 import coloredlogs
 
-from obs.face.importer import ImportMeasurementsCsv
-from obs.face.annotate import AnnotateMeasurements
-from obs.face.filter import RequiredFieldsFilter, ChainFilter, DistanceMeasuredFilter
-from obs.face.geojson import ExportMeasurements, ExportRoadAnnotation
-from obs.face.osm import DataSource as OSMDataSource
-from obs.face.filter import PrivacyFilter, AnonymizationMode
+# the annotation, export and download code and its dependencies are imported where they are needed, so that
+# obs-face starts quickly
+from obs.face.filter import AnonymizationMode
+from obs.face.instrumentation import instrumentation, DatasetProfiler
 
 log = logging.getLogger(__name__)
 
 
 def collect_datasets(path, exclusion_list):
     datasets = []
-    path_absolute = os.path.abspath(path)
 
     for root, dirs, files in os.walk(path):
-        unused, user_id = os.path.split(root)
         for filename in files:
-            filename_no_extension, extension = os.path.splitext(filename)
-            if extension == ".csv":
-                filename_absolute = os.path.abspath(os.path.join(root, filename))
-                filename_relative = os.path.relpath(filename_absolute, start=path_absolute)
-
-                # test against exclusion list
-                keep = True
-                for p in exclusion_list:
-                    hit = filename_relative.startswith(p)
-                    if hit:
-                        keep = False
-                        break
-
-                if keep:
-                    dataset = {
-                        "format": "CSV",
-                        "filename": filename_absolute,
-                        "filename_relative": filename_relative,
-                        "user_id": user_id,
-                    }
-                    datasets.append(dataset)
-                    log.debug("adding %s", filename_relative)
-                else:
-                    log.debug("excluding %s", filename_relative)
+            dataset = create_dataset(os.path.join(root, filename), path, exclusion_list)
+            if dataset is not None:
+                datasets.append(dataset)
 
     return datasets
 
 
+def create_dataset(filename, path, exclusion_list):
+    """
+    Creates the dataset description of a CSV file below the input directory path. The name of the directory containing
+    the file is used as user id. Returns None for other files and files matching the exclusion list.
+    """
+    filename_no_extension, extension = os.path.splitext(filename)
+    if extension != ".csv":
+        return None
+
+    unused, user_id = os.path.split(os.path.dirname(filename))
+    filename_absolute = os.path.abspath(filename)
+    filename_relative = os.path.relpath(filename_absolute, start=os.path.abspath(path))
+
+    # test against exclusion list
+    for p in exclusion_list:
+        if filename_relative.startswith(p):
+            log.debug("excluding %s", filename_relative)
+            return None
+
+    log.debug("adding %s", filename_relative)
+    return {
+        "format": "CSV",
+        "filename": filename_absolute,
+        "filename_relative": filename_relative,
+        "user_id": user_id,
+    }
+
+
+class DownloadSource:
+    def __init__(self, download_args, addresses, path, exclusion_list):
+        """
+        Downloads the files of the given devices to the input directory path in a background thread, and provides each
+        file as dataset as soon as its download is complete (see poll). Once all downloads are finished, the remaining
+        files in the input directory are provided as well, so each file is processed exactly once, in its final state.
+        """
+        self.path = path
+        self.exclusion_list = exclusion_list
+        self.filenames = thread_queue.Queue()
+        self.filenames_seen = set()
+        self.errors = None
+        self.done = False
+
+        download_args.target_directory = path
+        self.thread = threading.Thread(target=self.download, args=(download_args, addresses), daemon=True)
+        self.thread.start()
+
+    def download(self, download_args, addresses):
+        import asyncio
+        from obs.bin.obs_provision import download_from_devices
+
+        self.errors = asyncio.run(download_from_devices(download_args, addresses, on_download=self.filenames.put))
+        if self.errors:
+            log.error("Download failed for %s devices", len(self.errors))
+
+    def poll(self):
+        """
+        Returns the datasets which became available since the last call.
+        """
+        finished = not self.thread.is_alive()
+        filenames = []
+        while not self.filenames.empty():
+            filenames.append(self.filenames.get())
+
+        if finished and not self.done:
+            # add the files already present, e.g. from devices not available now
+            filenames += [dataset["filename"] for dataset in collect_datasets(self.path, self.exclusion_list)]
+            self.done = True
+
+        datasets = []
+        for filename in filenames:
+            dataset = create_dataset(filename, self.path, self.exclusion_list)
+            if dataset is not None and dataset["filename"] not in self.filenames_seen:
+                self.filenames_seen.add(dataset["filename"])
+                datasets.append(dataset)
+        return datasets
+
+
 def process_datasets(datasets, path_annotated, osm, skip_if_json_exists=True, path_cache='./cache',
-                     n_worker_processes=1, process_parallel=True, right_hand_traffic=True):
+                     n_worker_processes=1, process_parallel=True, right_hand_traffic=True, dataset_source=None,
+                     profiler=None):
+    """
+    Annotates the datasets. If dataset_source is given, further datasets are taken from its poll() method until it is
+    done, while the datasets available so far are already being processed. If a DatasetProfiler is given, the
+    processing of each dataset is profiled.
+    """
+
+    from obs.face.importer import ImportMeasurementsCsv
+    from obs.face.annotate import AnnotateMeasurements
+    from obs.face.filter import RequiredFieldsFilter, ChainFilter, DistanceMeasuredFilter
 
     log.info("annotating datasets")
 
@@ -101,7 +165,7 @@ def process_datasets(datasets, path_annotated, osm, skip_if_json_exists=True, pa
     else:
         processes = []
         dummy_process = AnnotationProcess(0, input_queue, output_queue, importer, annotator, measurement_filter,
-                                          path_annotated, skip_if_json_exists)
+                                          path_annotated, skip_if_json_exists, profiler)
 
     finished = False
     measurements = []
@@ -120,12 +184,19 @@ def process_datasets(datasets, path_annotated, osm, skip_if_json_exists=True, pa
 
     n_out = 0
     while not finished:
+        # add datasets as they become available
+        if dataset_source is not None:
+            for dataset in dataset_source.poll():
+                input_queue.put(dataset)
+                n_in += 1
+
         # analyze
         n_alive = 0
         for p in processes:
             n_alive += (p is not None) and p.is_alive()
 
-        finished = output_queue.empty() and input_queue.empty() and (n_out == n_in)
+        finished = output_queue.empty() and input_queue.empty() and (n_out == n_in) \
+            and (dataset_source is None or dataset_source.done)
 
         try:
             input_queue_size = input_queue.qsize()
@@ -142,20 +213,25 @@ def process_datasets(datasets, path_annotated, osm, skip_if_json_exists=True, pa
 
         if process_parallel:
             # (re)spawn processes
-            if not finished:
+            if not finished and not input_queue.empty():
                 for [process_id, p] in enumerate(processes):
                     if p is None or not p.is_alive():
                         q = AnnotationProcess(process_id, input_queue, output_queue, importer, annotator,
-                                              measurement_filter, path_annotated, skip_if_json_exists)
+                                              measurement_filter, path_annotated, skip_if_json_exists, profiler)
                         q.start()
                         processes[process_id] = q
                 time.sleep(1)
         elif not input_queue.empty():
             dummy_process.dequeue_and_process()
+        elif not finished:
+            # waiting for further datasets
+            time.sleep(0.1)
 
         # empty output queue
         while not output_queue.empty():
-            dataset = output_queue.get()
+            dataset, instrumentation_state = output_queue.get()
+            if instrumentation_state is not None:
+                instrumentation.merge(instrumentation_state)
             if dataset is not None:
                 measurements += dataset["measurements"]
                 statistics = combine_statistics(statistics, dataset["statistics"])
@@ -165,6 +241,9 @@ def process_datasets(datasets, path_annotated, osm, skip_if_json_exists=True, pa
         if p is not None:
             p.join()
 
+    if not process_parallel:
+        dummy_process.write_profile()
+
     if n_out != n_in:
         raise ValueError("parallel processing failed")
 
@@ -200,7 +279,7 @@ class PrefixLogFilter:
 
 class AnnotationProcess(Process):
     def __init__(self, process_id, job_queue, result_queue, importer, annotator, measurement_filter, path_annotated,
-                 skip_if_json_exists):
+                 skip_if_json_exists, profiler=None):
         Process.__init__(self, name=process_id)
 
         self.process_id = process_id
@@ -212,17 +291,42 @@ class AnnotationProcess(Process):
         self.path_annotated = path_annotated
         self.process_name = "AnnotationProcess" + str(process_id)
         self.skip_if_json_exists = skip_if_json_exists
+        self.instrumented = instrumentation.enabled
+        self.profiler = profiler
 
     def run(self):
+        # start from scratch, the state of the parent process is merged separately
+        instrumentation.reset()
+        instrumentation.enable(self.instrumented)
+
         while not self.job_queue.empty():
             self.dequeue_and_process()
 
+        self.write_profile()
+
+    def write_profile(self):
+        # a profile of all datasets processed by this worker
+        if self.profiler is not None:
+            self.profiler.merge(self.profiler.filenames, os.path.join(
+                self.profiler.directory, "workers",
+                "{}-{}{}".format(self.process_name, os.getpid(), self.profiler.extension)))
+
     def dequeue_and_process(self):
-        dataset = self.job_queue.get()
-        measurements = self.annotate(dataset)
-        self.result_queue.put(measurements)
+        try:
+            dataset = self.job_queue.get(timeout=1)
+        except thread_queue.Empty:
+            # another process took the last dataset
+            return
+        if self.profiler is not None:
+            name = os.path.splitext(dataset["filename_relative"])[0]
+            measurements = self.profiler.profile(name, self.annotate, dataset)
+        else:
+            measurements = self.annotate(dataset)
+        self.result_queue.put((measurements, instrumentation.pop_state()))
 
     def annotate(self, dataset):
+        import jsons
+
         filename_json = os.path.join(self.path_annotated,
                                      os.path.splitext(dataset["filename_relative"])[0] + '.json')
 
@@ -236,8 +340,9 @@ class AnnotationProcess(Process):
 
             if t1 <= t2:
                 log.debug("[%s] using cached result from %s ", self.process_name, filename_json)
-                with open(filename_json, 'r') as infile:
+                with instrumentation.timer("AnnotationProcess.load_json"), open(filename_json, 'r') as infile:
                     dataset_annotated = jsons.loads(infile.read())
+                instrumentation.count("datasets_cached")
                 do_annotate = False
             else:
                 log.debug("[%s] cached result in %s is outdated, recomputing ", self.process_name, filename_json)
@@ -279,8 +384,9 @@ class AnnotationProcess(Process):
                 }
                 # write out
                 os.makedirs(os.path.dirname(filename_json), exist_ok=True)
-                with open(filename_json, "w") as outfile:
+                with instrumentation.timer("AnnotationProcess.write_json"), open(filename_json, "w") as outfile:
                     outfile.write(jsons.dumps(dataset_annotated))
+                instrumentation.count("datasets_annotated")
                 file_log.debug(
                     "[%s] wrote annotated results to %s",
                     self.process_name,
@@ -296,6 +402,21 @@ class AnnotationProcess(Process):
         return dataset_annotated
 
 
+def write_profile_report(filename, wall_time, n_worker_processes):
+    log.info("time spent per stage (total wall time %.3fs), including all worker processes:\n%s",
+             wall_time, instrumentation.get_summary())
+
+    report = {
+        "wall_time": wall_time,
+        "n_worker_processes": n_worker_processes,
+        **instrumentation.get_state(),
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(filename)), exist_ok=True)
+    with open(filename, 'w') as f:
+        json.dump(report, f, indent=2)
+    log.info("wrote profile report to %s", filename)
+
+
 def main():
     parser = argparse.ArgumentParser(description='annotates, filters, aggregates OpenBikeSensor files, and exports '
                                                  'them for visualization')
@@ -312,6 +433,14 @@ def main():
     parser.add_argument('-e', '--input-exclude', required=False, action='append', default=[],
                         help='data to be excluded, given by path prefix in the input directory tree')
 
+    parser.add_argument('--download', required=False, action='store', nargs='*', default=None, metavar='ADDRESS',
+                        help='download the files of the given devices (default: all devices of the devices file) to '
+                             'the input directory, and annotate each file as soon as its download is complete')
+    parser.add_argument('--devices-file', required=False, action='store', default='devices.txt',
+                        help='path to a file that contains list of devices, see obs-provision')
+    parser.add_argument('--download-concurrency', required=False, action='store', default=2, type=int,
+                        help='maximum number of parallel requests to each device')
+
     parser.add_argument('-b', '--base-path', required=False, action='store', default='./data/',
                         help='base path to where all data is stored')
     parser.add_argument('--no-base-path', action='store_const', const=None, dest='base_path',
@@ -326,6 +455,41 @@ def main():
     parser.add_argument('--output-geojson-measurements', required=False, action='store', default=None,
                         help='filename for storing measurement visualization GeoJson data')
 
+    parser.add_argument('--output-geojson-measurements-line-delimited', required=False, action='store_true',
+                        default=False,
+                        help='write measurement visualization data as newline-delimited GeoJSON (one feature per '
+                             'line) instead of a FeatureCollection')
+    parser.add_argument('--output-measurement-properties', required=False, action='store', default=None,
+                        help='comma-separated list of measurement properties exported for visualization '
+                             '(default: all)')
+    parser.add_argument('--output-coordinate-precision', required=False, action='store', default=None, type=int,
+                        help='number of decimal places of exported measurement coordinates (default: full precision)')
+
+    parser.add_argument('--binary', required=False, action='store_true', default=False,
+                        help='export measurement visualization data in a compact binary format with typed columns '
+                             'instead of GeoJson')
+    parser.add_argument('--output-binary-measurements', required=False, action='store', default=None,
+                        help='filename for storing binary measurement visualization data')
+
+    parser.add_argument('--vector-tiles', required=False, action='store_true', default=False,
+                        help='export visualization data as pyramid of vector tiles instead of GeoJson files')
+    parser.add_argument('--output-tiles-measurements', required=False, action='store', default=None,
+                        help='directory for storing measurement visualization vector tiles')
+    parser.add_argument('--output-tiles-roads', required=False, action='store', default=None,
+                        help='directory for storing roads visualization vector tiles')
+
+    parser.add_argument('--bins', required=False, action='store_true', default=False,
+                        help='additionally export the measurements aggregated into grid bins at several zoom levels, '
+                             'shown by the visualization when zoomed out')
+    parser.add_argument('--bins-grid', required=False, action='store', default='hex', choices=['hex', 'square'],
+                        help='shape of the grid bins, default: hex')
+    parser.add_argument('--output-bins-measurements', required=False, action='store', default=None,
+                        help='directory for storing the binned measurement visualization data')
+
+    parser.add_argument('--path-road-statistics', required=False, action='store', default=None,
+                        help='filename for storing the aggregated road statistics; if given, only datasets not '
+                             'contained yet are added to the stored statistics')
+
     parser.add_argument('--path-cache', required=False, action='store', default='./cache',
                         help='path where the visualization data will be stored')
 
@@ -354,6 +518,23 @@ def main():
     parser.add_argument('--anonymization-hash-salt', action='store', type=str,
                         help='A salt/seed for use when hashing user or measurement IDs. Arbitrary string, but kept secret.')
 
+    parser.add_argument('--path-pseudonyms', required=False, action='store', default=None,
+                        help='filename of the persistent table of hashed user and dataset IDs; it maps the hashes back '
+                             'to the IDs, so keep it secret')
+
+    parser.add_argument('--profile-report', required=False, action='store', default=None,
+                        help='measure the time spent in each processing stage, across all worker processes, and '
+                             'write the results as JSON to this file')
+
+    parser.add_argument('--profile', required=False, action='store', default=None, metavar='DIR',
+                        help='profile the annotation of each dataset, and write the per-dataset, per-worker and '
+                             'merged profiles to this directory')
+    parser.add_argument('--profile-sampling', required=False, action='store_true', default=False,
+                        help='profile by sampling the call stack instead of tracing all calls, which has less '
+                             'overhead on long runs; the profiles are written as folded stacks for flame graphs')
+    parser.add_argument('--profile-interval', required=False, action='store', default=0.005, type=float,
+                        help='sampling interval in seconds, default: 0.005')
+
     parser.add_argument('-v', '--verbose', action='store_true', help='be verbose')
 
     args = parser.parse_args()
@@ -368,10 +549,20 @@ def main():
             args.path_annotated = os.path.join(args.base_path, 'annotated')
         if args.path_output_collected is None:
             args.path_output_collected = os.path.join(args.base_path, 'collected', 'measurements.json')
+        if args.path_pseudonyms is None:
+            args.path_pseudonyms = os.path.join(args.base_path, 'collected', 'pseudonyms.json')
         if args.output_geojson_roads is None:
             args.output_geojson_roads = os.path.join(args.base_path, 'visualization', 'roads.json')
         if args.output_geojson_measurements is None:
             args.output_geojson_measurements = os.path.join(args.base_path, 'visualization', 'measurements.json')
+        if args.output_binary_measurements is None:
+            args.output_binary_measurements = os.path.join(args.base_path, 'visualization', 'measurements.bin')
+        if args.output_tiles_roads is None:
+            args.output_tiles_roads = os.path.join(args.base_path, 'visualization', 'tiles', 'roads')
+        if args.output_tiles_measurements is None:
+            args.output_tiles_measurements = os.path.join(args.base_path, 'visualization', 'tiles', 'measurements')
+        if args.output_bins_measurements is None:
+            args.output_bins_measurements = os.path.join(args.base_path, 'visualization', 'bins', 'measurements')
 
     if args.anonymize_user_id == AnonymizationMode.HASHED and args.anonymization_hash_salt is None:
         raise ValueError("--anonymization-hash-salt is required for --anonymize-user-id=hashed")
@@ -382,6 +573,10 @@ def main():
     if args.district:
         log.warning('--district parameter is deprecated; required map parts are now selected automatically')
 
+    if args.profile_report:
+        instrumentation.enable()
+    t_start = time.perf_counter()
+
     log.debug("parameter list:")
     log.debug("input=%s", args.input)
     log.debug("path_annotated=%s", args.path_annotated)
@@ -391,6 +586,8 @@ def main():
     log.debug("traffic=%s hand", "right" if args.right_hand_traffic else "left")
 
     if args.annotate or args.collect or args.visualization:
+        from obs.face.osm import DataSource as OSMDataSource
+
         logging.info('Loading OpenStreetMap data')
         map_source = OSMDataSource(cache_dir=args.path_cache)
 
@@ -403,15 +600,35 @@ def main():
             logging.error('--path-annotated or --base-path required')
             sys.exit(1)
 
-        log.info('Collecting datasets')
-        datasets = collect_datasets(args.input, args.input_exclude)
+        if args.download is not None:
+            from obs.bin.obs_provision import DevicesContainer
+
+            addresses = args.download or DevicesContainer(args.devices_file).addresses
+            log.info('Downloading files from %s devices', len(addresses))
+            download_args = argparse.Namespace(concurrency=args.download_concurrency, keep_directory_structure=False)
+            dataset_source = DownloadSource(download_args, addresses, args.input, args.input_exclude)
+            datasets = []
+        else:
+            log.info('Collecting datasets')
+            dataset_source = None
+            datasets = collect_datasets(args.input, args.input_exclude)
+
+        profiler = None
+        if args.profile:
+            profiler = DatasetProfiler(args.profile, sampling=args.profile_sampling, interval=args.profile_interval)
+        t_annotation_start = time.time()
 
         log.info('Annotating and filtering CSV files')
         measurements, statistics = process_datasets(datasets, args.path_annotated, map_source,
                                                     path_cache=args.path_cache,
                                                     skip_if_json_exists=not args.recompute,
                                                     n_worker_processes=args.parallel,
-                                                    process_parallel=args.parallel > 0)
+                                                    process_parallel=args.parallel > 0,
+                                                    dataset_source=dataset_source,
+                                                    profiler=profiler)
+
+        if profiler is not None:
+            profiler.write_summary(newer_than=t_annotation_start)
 
         log.info("Statistics:")
         log.info("number of files:        %s", statistics["n_files"])
@@ -428,11 +645,13 @@ def main():
             log.error('--path-output-collected or --base-path required')
             sys.exit(1)
 
+        import jsons
+
         log.info("exporting collected measurements")
 
         # write out
         os.makedirs(os.path.dirname(args.path_output_collected), exist_ok=True)
-        with open(args.path_output_collected, 'w') as outfile:
+        with instrumentation.timer("collect.write_json"), open(args.path_output_collected, 'w') as outfile:
             outfile.write(jsons.dumps({"measurements": measurements, "statistics": statistics}))
 
     if args.visualization:
@@ -440,38 +659,123 @@ def main():
             log.error('--path-output-collected or --base-path required')
             sys.exit(1)
 
-        if not args.output_geojson_measurements:
-            log.error('--output-geojson-measurements or --base-path required')
-            sys.exit(1)
-
-        if not args.output_geojson_roads:
-            log.error('--output-geojson-roads or --base-path required')
+        if args.vector_tiles:
+            if not args.output_tiles_measurements:
+                log.error('--output-tiles-measurements or --base-path required')
+                sys.exit(1)
+
+            if not args.output_tiles_roads:
+                log.error('--output-tiles-roads or --base-path required')
+                sys.exit(1)
+        else:
+            if args.binary and not args.output_binary_measurements:
+                log.error('--output-binary-measurements or --base-path required')
+                sys.exit(1)
+
+            if not args.binary and not args.output_geojson_measurements:
+                log.error('--output-geojson-measurements or --base-path required')
+                sys.exit(1)
+
+            if not args.output_geojson_roads:
+                log.error('--output-geojson-roads or --base-path required')
+                sys.exit(1)
+
+        if args.bins and not args.output_bins_measurements:
+            log.error('--output-bins-measurements or --base-path required')
             sys.exit(1)
 
+        import jsons
+        from obs.face.filter import PrivacyFilter, PseudonymTable
+        from obs.face.geojson import ExportMeasurements, ExportRoadAnnotation, ExportMeasurementTiles, \
+            ExportRoadAnnotationTiles, ExportMeasurementBins, ExportMeasurementsBinary
+        from obs.face.osm import WayGeometryCache
 
         log.info("exporting visualization data")
 
-        with open(args.path_output_collected, 'r') as infile:
+        with instrumentation.timer("visualization.load_json"), open(args.path_output_collected, 'r') as infile:
             data = jsons.loads(infile.read())
-        measurements = data["measurements"]
+        measurements_collected = data["measurements"]
+
+        # keep hashed IDs in a persistent table, so only new IDs are hashed
+        pseudonym_table = None
+        if args.path_pseudonyms and AnonymizationMode.HASHED in [args.anonymize_user_id,
+                                                                  args.anonymize_measurement_id]:
+            pseudonym_table = PseudonymTable(args.path_pseudonyms, args.anonymization_hash_salt)
 
         # always filter for privacy
-        measurements = PrivacyFilter(
+        privacy_filter = PrivacyFilter(
             user_id_mode=args.anonymize_user_id,
             measurement_id_mode=args.anonymize_measurement_id,
             hash_salt=args.anonymization_hash_salt,
-          ).filter(measurements)
-
-        log.info("exporting GeoJson measurements")
-        exporter = ExportMeasurements(args.output_geojson_measurements, do_filter=True)
-        exporter.add_measurements(measurements)
+            pseudonym_table=pseudonym_table,
+          )
+
+        measurement_properties = args.output_measurement_properties.split(',') \
+            if args.output_measurement_properties else None
+
+        if args.vector_tiles:
+            log.info("exporting measurement vector tiles")
+            exporter = ExportMeasurementTiles(args.output_tiles_measurements, do_filter=True,
+                                              properties=measurement_properties)
+        elif args.binary:
+            log.info("exporting binary measurements")
+            exporter = ExportMeasurementsBinary(args.output_binary_measurements, do_filter=True,
+                                                properties=measurement_properties,
+                                                coordinate_precision=args.output_coordinate_precision)
+        else:
+            log.info("exporting GeoJson measurements")
+            exporter = ExportMeasurements(args.output_geojson_measurements, do_filter=True,
+                                          properties=measurement_properties,
+                                          coordinate_precision=args.output_coordinate_precision,
+                                          line_delimited=args.output_geojson_measurements_line_delimited)
+        # each exporter filters the collected measurements lazily, so no filtered copy of all of them is kept
+        exporter.add_measurements(privacy_filter.filter_iter(measurements_collected))
         exporter.finalize()
 
-        log.info("exporting GoeJson roads")
-        exporter = ExportRoadAnnotation(args.output_geojson_roads, map_source, right_hand_traffic=args.right_hand_traffic)
+        if args.bins:
+            log.info("exporting binned measurements")
+            exporter = ExportMeasurementBins(args.output_bins_measurements, do_filter=True, grid=args.bins_grid)
+            exporter.add_measurements(privacy_filter.filter_iter(measurements_collected))
+            exporter.finalize()
+
+        if args.vector_tiles:
+            log.info("exporting road vector tiles")
+            exporter = ExportRoadAnnotationTiles(args.output_tiles_roads, map_source,
+                                                 right_hand_traffic=args.right_hand_traffic,
+                                                 geometry_cache=WayGeometryCache(args.path_cache))
+        else:
+            log.info("exporting GoeJson roads")
+            exporter = ExportRoadAnnotation(args.output_geojson_roads, map_source,
+                                            right_hand_traffic=args.right_hand_traffic,
+                                            geometry_cache=WayGeometryCache(args.path_cache))
+
+        measurements = privacy_filter.filter_iter(measurements_collected)
+        if args.path_road_statistics:
+            if os.path.isfile(args.path_road_statistics) and not args.recompute:
+                exporter.load_statistics(args.path_road_statistics)
+
+            # only add datasets which are not contained in the stored statistics yet
+            dataset_ids = set(exporter.get_dataset_id(m) for m in measurements_collected)
+            dataset_ids_new = dataset_ids - exporter.datasets
+            log.info("adding %s of %s datasets to road statistics", len(dataset_ids_new), len(dataset_ids))
+
+            measurements = privacy_filter.filter_iter(m for m in measurements_collected
+                                                      if exporter.get_dataset_id(m) in dataset_ids_new)
+            exporter.add_datasets(dataset_ids_new)
+
         exporter.add_measurements(measurements)
+
+        if args.path_road_statistics:
+            exporter.save_statistics(args.path_road_statistics)
+
         exporter.finalize()
 
+        if pseudonym_table is not None:
+            pseudonym_table.save()
+
+    if args.profile_report:
+        write_profile_report(args.profile_report, time.perf_counter() - t_start, args.parallel)
+
     log.info("done")
 
 
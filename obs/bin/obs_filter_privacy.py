@@ -27,16 +27,22 @@ import logging
 import random
 
 import coloredlogs
-from haversine import haversine, Unit
 
 import argparse
+import glob
+import itertools
 import struct
 import urllib.parse
+from multiprocessing import Pool
+
+from obs.face.filter import PrivacyZonesFilter, PrivacyZone
 
 
 log = logging.getLogger(__name__)
 
-def filter_csv_privacy(input, output, filter):
+def filter_csv_privacy(input, output, filter, chunk_size=10000):
+    zones_filter = PrivacyZonesFilter([PrivacyZone(f["lat"], f["lon"], f["radius"]) for f in filter], exact=False)
+
     with open(input) as file_in:
         reader = csv.reader(file_in, delimiter=';')
 
@@ -49,52 +55,98 @@ def filter_csv_privacy(input, output, filter):
             data_count = 0
             metadata = None
 
+            # metadata and header lines
             for line_count, line in enumerate(reader):
-                keep_line = True
-                if not header_verified:
-                    if line_count >= 2:
-                        raise ValueError('could not verify file header')
-
-                    line_identified = False
-                    if metadata is None:
-                        try:
-                            metadata = urllib.parse.parse_qs(line[0], strict_parsing=True)
-                            line_identified = True
-                        except ValueError:
-                            pass
-
-                    if not line_identified:
-                        # we did not find valid metadata, so check if this is a header line
-                        if "Latitude" in line and "Longitude" in line:
-                            ix_lat = line.index("Latitude")
-                            ix_lon = line.index("Longitude")
-                            header_verified = True
-                        else:
-                            raise ValueError("header line does not contain 'Longitude' and 'Latitude' fields")
-                else:
-                    data_count += 1
-                    valid_coordinates = True
+                if line_count >= 2:
+                    raise ValueError('could not verify file header')
+
+                line_identified = False
+                if metadata is None:
                     try:
-                        lon = float(line[ix_lon])
-                        lat = float(line[ix_lat])
+                        metadata = urllib.parse.parse_qs(line[0], strict_parsing=True)
+                        line_identified = True
                     except ValueError:
-                        valid_coordinates = False
-
-                    if valid_coordinates:
-                        for f in filter:
-                            d = haversine((lat, lon),
-                                          (f["lat"], f["lon"]), unit=Unit.METERS)
-                            if d <= f["radius"]:
-                                log.debug("deleting measurement at %s %s, distance to %s %s is %s and below limit of %s", lat, lon, f["lat"], f["lon"], d, f["radius"])
-                                keep_line = False
-                                filter_count += 1
-
-                if keep_line:
+                        pass
+
+                if line_identified:
                     writer.writerow(line)
+                else:
+                    # we did not find valid metadata, so check if this is a header line
+                    if "Latitude" in line and "Longitude" in line:
+                        ix_lat = line.index("Latitude")
+                        ix_lon = line.index("Longitude")
+                        header_verified = True
+                        writer.writerow(line)
+                        break
+                    else:
+                        raise ValueError("header line does not contain 'Longitude' and 'Latitude' fields")
+
+            if not header_verified:
+                # the file ended before the header, e.g. an empty file, so there are no data lines to filter
+                log.debug("no data lines in %s", input)
+                return
+
+            # data lines, processed in blocks
+            while True:
+                lines = list(itertools.islice(reader, chunk_size))
+                if not lines:
+                    break
+
+                in_zone = zones_filter.contains([parse_float(line, ix_lat) for line in lines],
+                                                [parse_float(line, ix_lon) for line in lines])
+
+                writer.writerows(line for line, line_in_zone in zip(lines, in_zone.tolist()) if not line_in_zone)
+
+                data_count += len(lines)
+                filter_count += int(in_zone.sum())
 
         log.debug("filtered %s data lines, removed %s lines", data_count, filter_count)
 
 
+def parse_float(line, ix):
+    try:
+        return float(line[ix])
+    except (ValueError, IndexError):
+        return math.nan
+
+
+def collect_input_files(input):
+    """
+    Returns the CSV files given by a filename, a directory (searched recursively) or a glob pattern.
+    """
+    if os.path.isdir(input):
+        filenames = glob.glob(os.path.join(input, '**', '*.csv'), recursive=True)
+    elif os.path.isfile(input):
+        return [input]
+    else:
+        filenames = glob.glob(input, recursive=True)
+
+    # skip results of previous runs
+    return sorted(f for f in filenames if not os.path.splitext(f)[0].endswith('_cleaned'))
+
+
+def get_output_filename(input, input_base, output):
+    if output is None:
+        base, ext = os.path.splitext(input)
+        return base + "_cleaned" + ext
+    if input_base is None:
+        return output
+    # keep the directory structure below the input directory
+    return os.path.join(output, os.path.relpath(input, input_base))
+
+
+def filter_file(job):
+    input, output, zones = job
+    log.info("filtering %s", input)
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    try:
+        filter_csv_privacy(input, output, zones)
+    except (ValueError, IOError) as e:
+        log.error("filtering %s failed: %s", input, str(e))
+        return False
+    return True
+
+
 def move_lat_lon(lat1, lon1, bearing, d):
     # source: https://www.movable-type.co.uk/scripts/latlong.html
     R = 6371e3
@@ -174,9 +226,13 @@ def move_zone(zone, secret):
 def main():
     parser = argparse.ArgumentParser(description='filters a OpenBikeSensor CSV file')
     parser.add_argument('-i', '--input', required=True, action='store',
-                        help='input filename, must be a semicolon-separated text file')
+                        help='input filename, must be a semicolon-separated text file; may also be a directory, '
+                             'which is searched recursively for CSV files, or a glob pattern')
     parser.add_argument('-o', '--output', required=False, action='store',
-                        help='output filename, will be the filtered semicolon-separated text file')
+                        help='output filename, will be the filtered semicolon-separated text file; if several files '
+                             'are filtered, the output directory')
+    parser.add_argument('-p', '--parallel', action='store', type=int, default=0,
+                        help='number of worker processes used for filtering several files, default: 0 (sequential)')
     parser.add_argument('-s', '--secret', required=False, action='store', help='secret')
     parser.add_argument('-z', '--zones', action='store', help='filename of privacy zone list')
     parser.add_argument('-a', '--lat', action='append', type=float, default=[],
@@ -199,10 +255,6 @@ def main():
                   "random offsetting of the zone center using -R 0")
         sys.exit(-1)
 
-    if args.output is None:
-        base, ext = os.path.splitext(args.input)
-        args.output = base + "_cleaned" + ext
-
     if not len(args.lat) == len(args.lon):
         log.error("Same number of LAT and LON arguments expected.")
         sys.exit(-1)
@@ -236,7 +288,22 @@ def main():
 
         zones.append(zone_moved)
 
-    filter_csv_privacy(args.input, args.output, zones)
+    filenames = collect_input_files(args.input)
+    if not filenames:
+        log.error("no input files found for %s", args.input)
+        sys.exit(-1)
+
+    input_base = None if os.path.isfile(args.input) else os.path.commonpath([os.path.dirname(f) for f in filenames])
+    jobs = [(f, get_output_filename(f, input_base, args.output), zones) for f in filenames]
+
+    if args.parallel > 0 and len(jobs) > 1:
+        with Pool(args.parallel) as pool:
+            results = pool.map(filter_file, jobs)
+    else:
+        results = [filter_file(job) for job in jobs]
+
+    if not all(results):
+        sys.exit(-1)
 
 
 if __name__ == "__main__":
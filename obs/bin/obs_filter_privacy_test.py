@@ -0,0 +1,34 @@
+import os
+
+import pytest
+
+from .obs_filter_privacy import filter_csv_privacy
+
+ZONES = [{"lat": 48.7784, "lon": 9.18, "radius": 100.0}]
+
+
+def filter_lines(tmp_path, lines):
+    input = os.path.join(str(tmp_path), "track.csv")
+    output = os.path.join(str(tmp_path), "track_cleaned.csv")
+    with open(input, "w") as f:
+        f.writelines(line + "\n" for line in lines)
+    filter_csv_privacy(input, output, ZONES)
+    with open(output) as f:
+        return f.read().splitlines()
+
+
+def test_filter_csv_privacy(tmp_path):
+    lines = ["OBSDataFormat=2&OBSFirmwareVersion=v0.8", "Date;Time;Latitude;Longitude",
+             "01.06.2021;08:00:00;48.7784;9.1800", "01.06.2021;08:00:01;48.7884;9.1800", "01.06.2021;08:00:02;;"]
+    assert filter_lines(tmp_path, lines) == lines[:2] + lines[3:]
+
+
+def test_empty_file(tmp_path):
+    assert filter_lines(tmp_path, []) == []
+    assert filter_lines(tmp_path, ["OBSDataFormat=2&OBSFirmwareVersion=v0.8"]) == \
+        ["OBSDataFormat=2&OBSFirmwareVersion=v0.8"]
+
+
+def test_invalid_header(tmp_path):
+    with pytest.raises(ValueError):
+        filter_lines(tmp_path, ["Date;Time", "01.06.2021;08:00:00"])
@@ -21,6 +21,7 @@
 
 import argparse
 import asyncio
+import email.utils
 import ipaddress
 import logging
 import os
@@ -28,7 +29,9 @@ import re
 import sys
 
 import coloredlogs
-import httpx
+
+# httpx is imported in the functions talking to devices, so that managing the
+# device list does not pay for importing it
 
 log = logging.getLogger(__name__)
 
@@ -64,22 +67,40 @@ class DevicesContainer:
         with open(self.filename, 'w') as f:
             f.write('\n'.join(self._addresses) + '\n')
 
-async def get_host_info(address, timeout=5):
+def create_device_client(concurrency=2, transport=None):
+    """
+    Creates a HTTP client for talking to a single device, which keeps at most
+    `concurrency` connections open and reuses them for subsequent requests.
+    """
+    import httpx
+
+    return httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency),
+        timeout=httpx.Timeout(5, pool=None),
+        transport=transport,
+    )
+
+async def get_host_info(address, timeout=5, client=None):
     """
     Probes a host for whether it is a OpenBikeSensor device. Returns `None` if
     the devices does not appear to be an OpenBikeSensor device. Returns a dict
     with information about the device otherwise. The device has to be in server
     mode.
     """
-    async with httpx.AsyncClient() as client:
-        try:
-            log.debug('[%s] Request information', address)
-            response = await client.get(f'http://{address}/about', timeout=timeout)
-            text = response.text
+    import httpx
 
-        except httpx.ConnectError:
-            log.debug('[%s] Connection failed', address)
-            return None
+    if client is None:
+        async with httpx.AsyncClient() as client:
+            return await get_host_info(address, timeout=timeout, client=client)
+
+    try:
+        log.debug('[%s] Request information', address)
+        response = await client.get(f'http://{address}/about', timeout=timeout)
+        text = response.text
+
+    except httpx.ConnectError:
+        log.debug('[%s] Connection failed', address)
+        return None
 
     firmware_match = re.search(r'Firmware version: (v\d+\.\d+\.\d+)', text)
     if not firmware_match:
@@ -97,15 +118,62 @@ async def get_host_info(address, timeout=5):
     return {"address": address, "firmware": firmware, "chip_id": chip_id}
 
 
+async def is_port_open(address, port=80, timeout=0.5):
+    """
+    Checks whether a TCP connection to the given port can be established
+    within `timeout` seconds. This is much faster than waiting for a HTTP
+    request to time out on addresses without any host.
+    """
+    try:
+        _, writer = await asyncio.wait_for(asyncio.open_connection(address, port), timeout)
+    except (OSError, asyncio.TimeoutError):
+        return False
+    writer.close()
+    return True
+
+async def scan_hosts(ips, concurrency=256, connect_timeout=0.5, timeout=5, port=80, transport=None):
+    """
+    Probes the given IPs for OpenBikeSensor devices, at most `concurrency` at
+    the same time, and yields the information of each device (see
+    `get_host_info`) as soon as it is found. Only hosts accepting a TCP
+    connection are asked for their `/about` page, using a shared client.
+    """
+    import httpx
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with httpx.AsyncClient(limits=httpx.Limits(max_connections=concurrency),
+                                 timeout=httpx.Timeout(timeout, pool=None), transport=transport) as client:
+        async def probe(ip):
+            async with semaphore:
+                if not await is_port_open(ip, port, timeout=connect_timeout):
+                    return None
+                address = ip if port == 80 else f'{ip}:{port}'
+                try:
+                    return await get_host_info(address, timeout=timeout, client=client)
+                except httpx.HTTPError as e:
+                    log.debug('[%s] Request failed: %s', address, e)
+                    return None
+
+        for result in asyncio.as_completed([probe(ip) for ip in ips]):
+            host = await result
+            if host is not None:
+                yield host
+
 def list_ips(ip_ranges):
     for ip_range in ip_ranges:
         for address in ipaddress.ip_network(ip_range):
             yield str(address)
 
-async def list_sd_dir(address, path='/'):
-    async with httpx.AsyncClient() as client:
-        response = await client.get(f'http://{address}/sd?path={path}', timeout=5)
-        text = response.text
+async def list_sd_dir(address, path='/', client=None):
+    import httpx
+
+    if client is None:
+        async with httpx.AsyncClient() as client:
+            return await list_sd_dir(address, path, client=client)
+
+    response = await client.get(f'http://{address}/sd?path={path}', timeout=5)
+    text = response.text
 
     directories = set()
     for m in re.finditer(r'<li class="directory"><a href="/sd\?path=([^"]+)">', text):
@@ -118,45 +186,170 @@ async def list_sd_dir(address, path='/'):
     return directories, files
         # '<li class="file"><a href="/sd?path=/current_14d.alp">&#x1F4C4;current_14d.alp</a></li>'
 
-async def list_sd_dir_deep(address):
+async def list_sd_dir_deep(address, client=None):
+    import httpx
+
+    if client is None:
+        async with httpx.AsyncClient() as client:
+            return await list_sd_dir_deep(address, client=client)
+
+    # list all directories of one level at once, the client limits the number
+    # of concurrent requests
     paths = ['/']
     all_files = []
     while paths:
-        path = paths.pop()
-        directories, files = await list_sd_dir(address, path)
-        paths += list(directories)
-        all_files += list(files)
+        results = await asyncio.gather(*(list_sd_dir(address, path, client=client) for path in paths))
+        paths = []
+        for directories, files in results:
+            paths += list(directories)
+            all_files += list(files)
     return all_files
 
-async def download_file(address, path, target_directory, keep_directory_structure=False):
+def parse_content_range(value):
+    """
+    Parses a `Content-Range` header like `bytes 100-199/200` or `bytes */200`
+    into the first byte position and the total size, each `None` if unknown.
+    """
+    m = re.match(r'bytes (?:(\d+)-\d+|\*)/(\d+|\*)', value or '')
+    if not m:
+        return None, None
+    start = int(m.group(1)) if m.group(1) is not None else None
+    total = int(m.group(2)) if m.group(2) != '*' else None
+    return start, total
+
+def parse_last_modified(value):
+    try:
+        return email.utils.parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+def get_last_modified_file(target_file):
+    """
+    Returns the name of the hidden file storing the modification time reported by the device for target_file. The
+    local file keeps the time of the download as its own modification time, as the clock of the device may be wrong,
+    and the annotation cache of obs-face relies on it.
+    """
+    directory, name = os.path.split(target_file)
+    return os.path.join(directory, '.' + name + '.last-modified')
+
+def read_last_modified(target_file):
+    try:
+        with open(get_last_modified_file(target_file)) as f:
+            return float(f.read())
+    except (IOError, ValueError):
+        return None
+
+def write_last_modified(target_file, last_modified):
+    filename = get_last_modified_file(target_file)
+    if last_modified is None:
+        if os.path.isfile(filename):
+            os.remove(filename)
+    else:
+        with open(filename, 'w') as f:
+            f.write(repr(last_modified))
+
+def get_target_file(path, target_directory, keep_directory_structure=False):
     target_file = path.strip('/')
     if not keep_directory_structure:
         target_file = os.path.basename(target_file)
 
-    target_file = os.path.join(target_directory, target_file)
+    return os.path.join(target_directory, target_file)
 
-    os.makedirs(os.path.dirname(target_file), exist_ok=True)
+async def download_file(address, path, target_directory, keep_directory_structure=False, client=None):
+    """
+    Downloads a file from the device, unless the local copy is up to date.
+    Data is written to a `.part` file, which is renamed when the download is
+    complete. Existing local files and leftover `.part` files are continued
+    with a HTTP range request. If the device reports a modification time
+    different from the one of the previous download, the file is downloaded
+    completely. A complete local file is kept as it is if the download fails.
+    Returns the number of bytes transferred.
+    """
+    import httpx
+
+    if client is None:
+        async with httpx.AsyncClient() as client:
+            return await download_file(address, path, target_directory, keep_directory_structure, client=client)
+
+    target_file = get_target_file(path, target_directory, keep_directory_structure)
+    partial_file = target_file + '.part'
 
-    log.debug("[%s] Downloading %s to %s", address, path, target_file)
+    os.makedirs(os.path.dirname(target_file), exist_ok=True)
 
-    async with httpx.AsyncClient() as client:
-        async with client.stream('GET', f'http://{address}/sd?path={path}') as response:
-            with open(target_file, 'wb') as f:
-                async for chunk in response.aiter_bytes():
-                    f.write(chunk)
+    # continue from the local copy, if any; a complete one stays in place until new data arrives
+    if os.path.isfile(target_file):
+        local_file = target_file
+    elif os.path.isfile(partial_file):
+        local_file = partial_file
+    else:
+        local_file = None
+    offset = os.path.getsize(local_file) if local_file else 0
+    last_modified_local = read_last_modified(target_file) if offset else None
+
+    log.debug("[%s] Downloading %s to %s, starting at byte %s", address, path, target_file, offset)
+
+    n_bytes = 0
+    last_modified = None
+    while True:
+        headers = {'Range': f'bytes={offset}-'} if offset else {}
+        async with client.stream('GET', f'http://{address}/sd?path={path}', headers=headers) as response:
+            last_modified = parse_last_modified(response.headers.get('last-modified'))
+            start, total = parse_content_range(response.headers.get('content-range'))
+            length = response.headers.get('content-length')
+
+            if offset and last_modified_local is not None and last_modified is not None \
+                    and abs(last_modified - last_modified_local) > 1:
+                # the file was changed on the device, start over
+                log.debug("[%s] %s was modified on the device", address, path)
+                offset = 0
+                last_modified_local = None
+                continue
+
+            if response.status_code == 416 and total in (None, offset) \
+                    or response.status_code == 200 and offset and length is not None and int(length) == offset:
+                # nothing new on the device
+                break
+
+            if response.status_code == 206 and start == offset:
+                mode = 'ab'
+            elif response.status_code == 200:
+                mode = 'wb'
+            elif offset:
+                # the device does not support the range, or the file got smaller, start over
+                offset = 0
+                continue
+            else:
+                raise ValueError(f"Download of {path} failed with status {response.status_code}")
+
+            # data is appended to a complete local file as a partial file, which is restored if the transfer fails
+            restore = mode == 'ab' and local_file == target_file
+            if restore:
+                os.replace(target_file, partial_file)
+            try:
+                with open(partial_file, mode) as f:
+                    async for chunk in response.aiter_bytes():
+                        f.write(chunk)
+                        n_bytes += len(chunk)
+            except BaseException:
+                if restore:
+                    with open(partial_file, 'r+b') as f:
+                        f.truncate(offset)
+                    os.replace(partial_file, target_file)
+                raise
+            local_file = partial_file
+            break
+
+    if local_file == partial_file:
+        os.replace(partial_file, target_file)
+    write_last_modified(target_file, last_modified)
+
+    return n_bytes
 
 async def command_download(args):
     addresses = args.addresses or args.devices.addresses
     log.info("Downloading files from %s devices", len(addresses))
 
-    # Run downloads asynchronously. We use one task for each device, to not
-    # overload it. We avoid parallel requests to the same device by using a
-    # sequential logic (see download_from_device) for each device, but we can
-    # easily process multiple devices simultaneously.
-    results = await asyncio.gather(*map(lambda address: download_from_device(args, address), addresses),
-            return_exceptions=True)
-
-    errors = [r for r in results if isinstance(r, Exception)]
+    errors = await download_from_devices(args, addresses)
 
     if len(errors):
         log.error("Download failed for %s devices", len(errors))
@@ -164,38 +357,77 @@ async def command_download(args):
     else:
         log.info("Download from %s devices successful.", len(addresses))
 
-async def download_from_device(args, address):
+async def download_from_devices(args, addresses, on_download=None):
+    """
+    Downloads the files from all given devices, see `download_from_device`, and
+    returns the list of errors.
+    """
+    # Run downloads asynchronously. We use one task for each device, to not
+    # overload it. The number of parallel requests to the same device is
+    # limited (see download_from_device), but we can easily process multiple
+    # devices simultaneously.
+    results = await asyncio.gather(*map(lambda address: download_from_device(args, address, on_download=on_download),
+            addresses), return_exceptions=True)
+
+    return [r for r in results if isinstance(r, Exception)]
+
+async def download_from_device(args, address, transport=None, on_download=None):
+    """
+    Downloads all `.obsdata.csv` files from the device at `address` to a
+    subdirectory of `args.target_directory` named after the chip ID. If given,
+    `on_download` is called with the local filename as soon as a file is
+    complete, even if it was up to date already.
+    """
     log.info("[%s] Starting download", address)
-    host = await get_host_info(address)
 
-    if host is None:
-        log.error("[%s] Failed to download from this device, no information available", address)
-        raise ValueError("No compatible device found at %s" % address)
+    # All requests to this device share one client, and at most
+    # `args.concurrency` requests are sent to the device at the same time.
+    async with create_device_client(args.concurrency, transport=transport) as client:
+        host = await get_host_info(address, client=client)
+
+        if host is None:
+            log.error("[%s] Failed to download from this device, no information available", address)
+            raise ValueError("No compatible device found at %s" % address)
 
-    # TODO: Map from Chip ID to some other alias
-    target_directory = os.path.join(args.target_directory, host['chip_id'])
-    log.debug("[%s] Storing files in %s", address, target_directory)
+        # TODO: Map from Chip ID to some other alias
+        target_directory = os.path.join(args.target_directory, host['chip_id'])
+        log.debug("[%s] Storing files in %s", address, target_directory)
 
-    log.debug("[%s] Reading file index", address)
-    file_paths = await list_sd_dir_deep(address)
+        log.debug("[%s] Reading file index", address)
+        file_paths = await list_sd_dir_deep(address, client=client)
 
-    for path in file_paths:
-        if path.endswith('.obsdata.csv'):
-            await download_file(address, path, target_directory, keep_directory_structure=args.keep_directory_structure)
+        semaphore = asyncio.Semaphore(args.concurrency)
 
+        async def download(path):
+            async with semaphore:
+                n_bytes = await download_file(address, path, target_directory,
+                        keep_directory_structure=args.keep_directory_structure, client=client)
+            if on_download is not None:
+                on_download(get_target_file(path, target_directory, args.keep_directory_structure))
+            return n_bytes
+
+        file_paths = [path for path in file_paths if path.endswith('.obsdata.csv')]
+        n_bytes = await asyncio.gather(*map(download, file_paths))
+
+    log.info("[%s] Checked %s files, downloaded %s bytes", address, len(file_paths), sum(n_bytes))
 
 
 async def command_scan(args):
     ips = list(list_ips(args.ip_ranges))
 
-    if len(ips) > 256:
-        log.error("Please do not scan more than 256 IPs at once.")
+    if len(ips) > args.max_addresses:
+        log.error("Please do not scan more than %s IPs at once, or raise the limit with --max-addresses.",
+                  args.max_addresses)
         sys.exit(1)
 
     log.info("Scanning %s addresses", len(ips))
 
-    results = await asyncio.gather(*map(get_host_info, ips))
-    hosts = [r for r in results if r is not None]
+    hosts = []
+    async for host in scan_hosts(ips, concurrency=args.concurrency, connect_timeout=args.connect_timeout):
+        log.info("[%s] Found device %s with firmware %s", host['address'], host['chip_id'], host['firmware'])
+        if not (args.append or args.write):
+            print(host['address'], flush=True)
+        hosts.append(host)
 
     log.info("Found %s devices", len(hosts))
 
@@ -207,8 +439,6 @@ async def command_scan(args):
     elif args.write:
         args.devices.set_addresses(new_devices)
         args.devices.write()
-    else:
-        print('\n'.join(new_devices))
 
 async def command_devices_list(args):
     print('\n'.join(args.devices.addresses))
@@ -248,11 +478,15 @@ def main():
     parser_scan.add_argument('ip_ranges', nargs='+', help='IP range(s) to use for scanning, in CIDR notation, e.g. 172.16.0.0/24')
     parser_scan.add_argument('-a', '--append', action='store_true', help='append found devices to device file')
     parser_scan.add_argument('-w', '--write', action='store_true', help='write found devices to device file (overwrite existing)')
+    parser_scan.add_argument('-c', '--concurrency', default=256, type=int, help='maximum number of addresses probed at the same time (default: 256)')
+    parser_scan.add_argument('--connect-timeout', default=0.5, type=float, help='timeout for connecting to an address, in seconds (default: 0.5)')
+    parser_scan.add_argument('--max-addresses', default=1024, type=int, help='maximum number of addresses to scan (default: 1024)')
     parser_scan.set_defaults(func=command_scan)
 
     parser_download = subparsers.add_parser('download', help='download files from all devices')
     parser_download.add_argument('--keep-directory-structure', action='store_true', default=False, help='keep directory structure from device, do not flatten')
     parser_download.add_argument('-t', '--target-directory', default='data/download', help='where to store target files')
+    parser_download.add_argument('-c', '--concurrency', default=2, type=int, help='maximum number of parallel requests to each device (default: 2)')
     parser_download.add_argument('addresses', nargs='*', help='which devices to download data from (leave empty to use devices file)')
     parser_download.set_defaults(func=command_download)
 
@@ -0,0 +1,162 @@
+import argparse
+import asyncio
+import os
+import re
+import time
+from urllib.parse import unquote
+
+import httpx
+import pytest
+
+from .obs_provision import download_from_device, scan_hosts
+
+
+class FakeDevice:
+    """
+    Simulates the web server of an OpenBikeSensor device in server mode, including range requests.
+    """
+
+    def __init__(self, files, last_modified=None):
+        self.files = files
+        self.last_modified = last_modified or {}
+        self.requests = []
+        self.failure = None
+
+    def handle(self, request):
+        self.requests.append(request)
+        if request.url.path == "/about":
+            return httpx.Response(200, text="<p>Firmware version: v0.4.123</p><p>Chip id:</b> 1A2B3C</p>")
+
+        path = unquote(request.url.params["path"])
+        if path in self.files and self.failure == "timeout":
+            raise httpx.ConnectTimeout("timed out", request=request)
+        if path in self.files and self.failure == "error":
+            return httpx.Response(500)
+        if path in self.files and self.failure == "interrupted":
+            async def interrupted():
+                yield b"x"
+                raise httpx.ReadError("connection lost", request=request)
+            start = int(re.match(r"bytes=(\d+)-", request.headers["range"]).group(1))
+            size = len(self.files[path])
+            return httpx.Response(206, content=interrupted(),
+                                  headers={"Content-Range": f"bytes {start}-{size - 1}/{size}"})
+        if path in self.files:
+            data = self.files[path]
+            headers = {"Last-Modified": self.last_modified[path]} if path in self.last_modified else {}
+            m = re.match(r"bytes=(\d+)-", request.headers.get("range", ""))
+            if m is None:
+                return httpx.Response(200, content=data, headers=headers)
+            start = int(m.group(1))
+            if start >= len(data):
+                return httpx.Response(416, headers=dict(headers, **{"Content-Range": f"bytes */{len(data)}"}))
+            return httpx.Response(206, content=data[start:], headers=dict(
+                headers, **{"Content-Range": f"bytes {start}-{len(data) - 1}/{len(data)}"}))
+
+        # directory listing
+        prefix = path.rstrip("/") + "/"
+        entries = {p[len(prefix):].split("/")[0] for p in self.files if p.startswith(prefix)}
+        text = "<ul>"
+        for entry in sorted(entries):
+            kind = "file" if prefix + entry in self.files else "directory"
+            text += f'<li class="{kind}"><a href="/sd?path={prefix + entry}">{entry}</a></li>'
+        return httpx.Response(200, text=text + "</ul>")
+
+
+def download(device, target_directory):
+    args = argparse.Namespace(target_directory=target_directory, keep_directory_structure=True, concurrency=2)
+    asyncio.run(download_from_device(args, "device", transport=httpx.MockTransport(device.handle)))
+
+
+def test_download_from_device(tmp_path):
+    device = FakeDevice({
+        "/uploaded/1.obsdata.csv": b"a" * 1000,
+        "/2.obsdata.csv": b"b" * 500,
+        "/3.obsdata.csv": b"c" * 100,
+        "/settings.json": b"{}",
+    })
+    target = os.path.join(str(tmp_path), "1A2B3C")
+
+    download(device, str(tmp_path))
+    assert sorted(os.listdir(target)) == ["2.obsdata.csv", "3.obsdata.csv", "uploaded"]
+    with open(os.path.join(target, "uploaded", "1.obsdata.csv"), "rb") as f:
+        assert f.read() == b"a" * 1000
+
+    # an interrupted download, a grown file and an unchanged file
+    os.replace(os.path.join(target, "2.obsdata.csv"), os.path.join(target, "2.obsdata.csv.part"))
+    with open(os.path.join(target, "2.obsdata.csv.part"), "r+b") as f:
+        f.truncate(200)
+    device.files["/3.obsdata.csv"] += b"d" * 50
+
+    device.requests = []
+    download(device, str(tmp_path))
+
+    ranges = {unquote(r.url.params["path"]): r.headers.get("range") for r in device.requests
+              if r.url.params.get("path", "").endswith(".csv")}
+    assert ranges == {"/uploaded/1.obsdata.csv": "bytes=1000-", "/2.obsdata.csv": "bytes=200-",
+                      "/3.obsdata.csv": "bytes=100-"}
+    for path, data in device.files.items():
+        if path.endswith(".obsdata.csv"):
+            with open(os.path.join(target, path.strip("/")), "rb") as f:
+                assert f.read() == data
+    assert not os.path.exists(os.path.join(target, "2.obsdata.csv.part"))
+
+
+def test_download_last_modified(tmp_path):
+    # a device without a real time clock reports a time long ago
+    device = FakeDevice({"/1.obsdata.csv": b"a" * 100}, {"/1.obsdata.csv": "Thu, 01 Jan 1970 00:01:00 GMT"})
+    target = os.path.join(str(tmp_path), "1A2B3C", "1.obsdata.csv")
+    t = time.time()
+
+    download(device, str(tmp_path))
+    # the local modification time is the time of the download, so obs-face annotates the file again
+    assert os.path.getmtime(target) >= t - 1
+
+    # appended data is downloaded with a range request
+    device.files["/1.obsdata.csv"] += b"b" * 10
+    device.requests = []
+    download(device, str(tmp_path))
+    assert [r.headers.get("range") for r in device.requests
+            if r.url.params.get("path", "").endswith(".csv")] == ["bytes=100-"]
+
+    # a file with a different modification time on the device is downloaded completely
+    device.files["/1.obsdata.csv"] = b"c" * 120
+    device.last_modified["/1.obsdata.csv"] = "Thu, 01 Jan 1970 00:02:00 GMT"
+    download(device, str(tmp_path))
+    with open(target, "rb") as f:
+        assert f.read() == b"c" * 120
+
+
+@pytest.mark.parametrize("failure", ["timeout", "error", "interrupted"])
+def test_download_failure_keeps_file(tmp_path, failure):
+    device = FakeDevice({"/1.obsdata.csv": b"a" * 100})
+    target = os.path.join(str(tmp_path), "1A2B3C", "1.obsdata.csv")
+    download(device, str(tmp_path))
+
+    # a failed download does not remove the complete local copy
+    device.files["/1.obsdata.csv"] += b"b" * 10
+    device.failure = failure
+    with pytest.raises((httpx.TransportError, ValueError)):
+        download(device, str(tmp_path))
+    assert os.listdir(os.path.dirname(target)) == ["1.obsdata.csv"]
+    with open(target, "rb") as f:
+        assert f.read() == b"a" * 100
+
+
+async def scan_local_device(ips):
+    async def handle(reader, writer):
+        await reader.readuntil(b"\r\n\r\n")
+        body = b"<p>Firmware version: v0.4.123</p><p>Chip id:</b> 1A2B3C</p>"
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: %d\r\n\r\n%s" % (len(body), body))
+        await writer.drain()
+        writer.close()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    async with server:
+        return [host async for host in scan_hosts(ips, connect_timeout=0.2, port=port)], port
+
+
+def test_scan_hosts():
+    # the second address is reserved for documentation, so nothing answers there
+    hosts, port = asyncio.run(scan_local_device(["127.0.0.1", "192.0.2.1"]))
+    assert hosts == [{"address": f"127.0.0.1:{port}", "firmware": "v0.4.123", "chip_id": "1A2B3C"}]
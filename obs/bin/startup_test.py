@@ -0,0 +1,16 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+# dependencies which take long to import and are only needed by some code paths
+HEAVY_MODULES = ["geopy", "gpstime", "httpx", "jsons", "requests", "tzwhere", "aabbtree", "haversine"]
+
+
+@pytest.mark.parametrize("module", ["obs.bin.obs_face", "obs.bin.obs_filter_privacy", "obs.bin.obs_provision"])
+def test_no_heavy_imports(module):
+    code = "import sys, {}; print(' '.join(m for m in {!r} if m in sys.modules))".format(module, HEAVY_MODULES)
+    root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    result = subprocess.run([sys.executable, "-c", code], cwd=root, capture_output=True, text=True, check=True)
+    assert result.stdout.split() == []
@@ -21,6 +21,7 @@ import numpy as np
 import datetime
 
 from obs.face.mapping import Roads
+from obs.face.instrumentation import instrumentation, timed
 from .BeliefPropagationChain import BeliefPropagationChain as BP
 
 
@@ -109,6 +110,18 @@ class AnnotateMeasurements:
 
     def add_osm_way_id_filtered(self, measurements):
         measurements_annotated = []
+        for chain in self.find_matching_candidates(measurements):
+            measurements_annotated += self.solve_chain(chain)
+
+        return measurements_annotated
+
+    @timed()
+    def find_matching_candidates(self, measurements):
+        """
+        Adds the candidate ways to each measurement, and splits the measurements into chains which are solved
+        independently by solve_chain().
+        """
+        chains = []
 
         m_prev = None
         matching_id_prev = ['none']
@@ -143,9 +156,9 @@ class AnnotateMeasurements:
             # do_split = m["discontinuity"]
             do_split = (m_prev is not None) and (m["user_id"] != m_prev["user_id"])
 
-            # the chain ends here, now solve for the best solution
+            # the chain ends here
             if do_split:
-                measurements_annotated += self.solve_chain(chain)
+                chains.append(chain)
                 chain = []
 
             # add the current entry
@@ -155,15 +168,17 @@ class AnnotateMeasurements:
             m_prev = m
             matching_id_prev = matching_id
 
-        measurements_annotated += self.solve_chain(chain)
+        chains.append(chain)
 
-        return measurements_annotated
+        return chains
 
+    @timed()
     def solve_chain(self, chain):
         # http://helper.ipam.ucla.edu/publications/gss2013/gss2013_11344.pdf
         n = len(chain)
         if n == 0:
             return []
+        instrumentation.count("measurements_matched", n)
 
         # construct chain
         p_way_id_constant = 0.999
@@ -228,6 +243,7 @@ class AnnotateMeasurements:
 
         return chain
 
+    @timed()
     def add_osm_annotations(self, measurements):
         measurements_annotated = []
         for m in measurements:
@@ -0,0 +1,219 @@
+# Copyright (C) 2020-2021 OpenBikeSensor Contributors
+# Contact: https://openbikesensor.org
+#
+# This file is part of the OpenBikeSensor Scripts Collection.
+#
+# The OpenBikeSensor Scripts Collection is free software: you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public License as
+# published by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# The OpenBikeSensor Scripts Collection is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Lesser
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with the OpenBikeSensor Scripts Collection.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+import contextlib
+import datetime
+import logging
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from obs.face.annotate import AnnotateMeasurements
+from obs.face.filter import ChainFilter, RequiredFieldsFilter, DistanceMeasuredFilter, PrivacyFilter
+from obs.face.geojson import ExportMeasurements, ExportRoadAnnotation
+from obs.face.importer import ImportMeasurementsCsv
+from obs.face.osm import DataSource
+from .SyntheticData import SyntheticRoadNetwork, create_track, write_track_csv
+
+log = logging.getLogger(__name__)
+
+STAGES = ["import", "map_matching", "bp_solve", "filter", "export"]
+
+# the command line tools, whose startup time is measured by running them with --help
+STARTUP_MODULES = {
+    "startup_obs_face": "obs.bin.obs_face",
+    "startup_obs_filter_privacy": "obs.bin.obs_filter_privacy",
+    "startup_obs_provision": "obs.bin.obs_provision",
+}
+
+
+class Benchmark:
+    """
+    Measures the throughput of the processing stages on synthetic tracks and a synthetic road network, without any
+    network access. All data is written to path.
+    """
+
+    def __init__(self, path, n_tracks=4, n_samples=1800, format_version="2", raw_measurements=10, gps_noise=3.0,
+                 n_streets=12, stop_probability=0.0, seed=0):
+        self.path = path
+        self.parameters = {
+            "n_tracks": n_tracks,
+            "n_samples": n_samples,
+            "format_version": format_version,
+            "raw_measurements": raw_measurements,
+            "gps_noise": gps_noise,
+            "n_streets": n_streets,
+            "stop_probability": stop_probability,
+            "seed": seed,
+        }
+        self.path_cache = os.path.join(path, "cache")
+        self.filenames = []
+
+        self.seconds = {}
+        self.items = {}
+        self.candidate_cache_hit_rate = None
+
+    def prepare(self):
+        p = self.parameters
+        network = SyntheticRoadNetwork(n_streets=p["n_streets"], seed=p["seed"])
+        network.write_tile_cache(self.path_cache)
+
+        os.makedirs(os.path.join(self.path, "tracks"), exist_ok=True)
+        self.filenames = []
+        for i in range(p["n_tracks"]):
+            filename = os.path.join(self.path, "tracks", "track{:03d}.csv".format(i))
+            samples = create_track(network, p["n_samples"], gps_noise=p["gps_noise"],
+                                   stop_probability=p["stop_probability"], seed=p["seed"] + i)
+            write_track_csv(filename, samples, format_version=p["format_version"],
+                            raw_measurements=p["raw_measurements"], seed=p["seed"] + i)
+            self.filenames.append(filename)
+
+        log.info("generated %s tracks of %s samples in %s", p["n_tracks"], p["n_samples"], self.path)
+
+    @contextlib.contextmanager
+    def stage(self, name, n_items):
+        t = time.perf_counter()
+        yield
+        self.seconds[name] = self.seconds.get(name, 0.0) + time.perf_counter() - t
+        self.items[name] = self.items.get(name, 0) + n_items
+
+    def run_once(self):
+        self.seconds = {}
+        self.items = {}
+
+        importer = ImportMeasurementsCsv()
+        map_source = DataSource(cache_dir=self.path_cache)
+        annotator = AnnotateMeasurements(map_source, cache_dir=self.path_cache)
+        measurement_filter = ChainFilter(RequiredFieldsFilter(), DistanceMeasuredFilter())
+
+        measurements = []
+        for i, filename in enumerate(self.filenames):
+            with self.stage("import", self.parameters["n_samples"]):
+                m, _ = importer.read(filename, user_id="user{}".format(i), dataset_id=os.path.basename(filename))
+
+            with self.stage("map_matching", len(m)):
+                annotator.ensure_map_coverage(m)
+                chains = annotator.find_matching_candidates(m)
+
+            with self.stage("bp_solve", len(m)):
+                m = [c for chain in chains for c in annotator.solve_chain(chain)]
+
+            with self.stage("map_matching", 0):
+                m = annotator.add_osm_annotations(m)
+
+            with self.stage("filter", len(m)):
+                m = measurement_filter.filter(m)
+
+            measurements += m
+
+        with self.stage("filter", 0):
+            measurements = PrivacyFilter().filter(measurements)
+
+        path_export = os.path.join(self.path, "export")
+        os.makedirs(path_export, exist_ok=True)
+        with self.stage("export", len(measurements)):
+            exporter = ExportMeasurements(os.path.join(path_export, "measurements.json"))
+            exporter.add_measurements(measurements)
+            exporter.finalize()
+
+            exporter = ExportRoadAnnotation(os.path.join(path_export, "roads.json"), map_source)
+            exporter.add_measurements(measurements)
+            exporter.finalize()
+
+        self.candidate_cache_hit_rate = annotator.roads.get_candidate_cache_hit_rate()
+        return dict(self.seconds), dict(self.items)
+
+    @staticmethod
+    def measure_startup(module):
+        """
+        Returns the wall time of running the command line tool module with --help in a new interpreter.
+        """
+        path = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(p for p in [path, os.environ.get("PYTHONPATH")] if p))
+        t = time.perf_counter()
+        subprocess.run([sys.executable, "-m", module, "--help"], env=env, stdout=subprocess.DEVNULL, check=True)
+        return time.perf_counter() - t
+
+    def run(self, repeat=3):
+        """
+        Runs all stages repeat times and returns the results, using the fastest run of each stage.
+        """
+        if not self.filenames:
+            self.prepare()
+
+        runs = [self.run_once() for _ in range(repeat)]
+
+        for name, module in STARTUP_MODULES.items():
+            for seconds, items in runs:
+                seconds[name] = self.measure_startup(module)
+                items[name] = 1
+
+        stages = {}
+        for name in STAGES + list(STARTUP_MODULES):
+            seconds = min(seconds[name] for seconds, _ in runs)
+            items = runs[0][1][name]
+            stages[name] = {
+                "seconds": seconds,
+                "items": items,
+                "items_per_second": items / seconds if seconds > 0 else None,
+            }
+            log.info("%-28s %10.3fs %10d items %12.1f items/s", name, seconds, items,
+                     stages[name]["items_per_second"] or 0.0)
+
+        return {
+            "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "commit": get_commit(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "parameters": dict(self.parameters, repeat=repeat),
+            "stages": stages,
+            "candidate_cache_hit_rate": self.candidate_cache_hit_rate,
+        }
+
+
+def get_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=os.path.dirname(__file__), capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare_results(results, baseline):
+    """
+    Compares the throughput of each stage to a baseline. Returns a dict of stage name to the relative change, where
+    positive values mean faster.
+    """
+    changes = {}
+    for name, stage in results["stages"].items():
+        if name in baseline.get("stages", {}):
+            ips = stage["items_per_second"]
+            ips_baseline = baseline["stages"][name]["items_per_second"]
+            if ips and ips_baseline:
+                changes[name] = ips / ips_baseline - 1.0
+
+    if results.get("parameters") != baseline.get("parameters"):
+        log.warning("benchmark parameters differ from the baseline, results may not be comparable")
+
+    return changes
@@ -0,0 +1,230 @@
+# Copyright (C) 2020-2021 OpenBikeSensor Contributors
+# Contact: https://openbikesensor.org
+#
+# This file is part of the OpenBikeSensor Scripts Collection.
+#
+# The OpenBikeSensor Scripts Collection is free software: you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public License as
+# published by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# The OpenBikeSensor Scripts Collection is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Lesser
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with the OpenBikeSensor Scripts Collection.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+import csv
+import datetime
+import logging
+import os
+import pickle
+
+import numpy as np
+
+from obs.face.mapping import EquirectangularFast
+from obs.face.osm.TileSource import TileSource
+
+log = logging.getLogger(__name__)
+
+CSV_HEADER_V2 = ["Date", "Time", "Millis", "Comment", "Latitude", "Longitude", "Altitude", "Course", "Speed", "HDOP",
+                 "Satellites", "BatteryLevel", "Left", "Right", "Confirmed", "Marked", "Invalid", "InsidePrivacyArea",
+                 "Factor", "Measurements"]
+
+CSV_HEADER_V1 = ["Date", "Time", "Latitude", "Longitude", "Course", "Speed", "Right", "Left", "Confirmed",
+                 "insidePrivacyArea"]
+
+# ultrasonic flight time per cm of distance, as used by the firmware
+MICROSECONDS_PER_CM = 58
+
+
+class SyntheticRoadNetwork:
+    """
+    A rectangular grid of streets centered at (lat_0, lon_0), stored as Overpass elements. Each street is split into
+    several OSM ways, each spanning a few blocks.
+    """
+
+    def __init__(self, lat_0=48.7784, lon_0=9.1800, n_streets=12, spacing=120.0, blocks_per_way=3, seed=0):
+        rng = np.random.default_rng(seed)
+
+        self.n_streets = n_streets
+        self.local_map = EquirectangularFast(lat_0, lon_0)
+
+        # intersection [i, j] is the crossing of the i-th north-south street and the j-th east-west street, slightly
+        # displaced so the streets are not perfectly straight
+        offsets = (np.arange(n_streets) - (n_streets - 1) / 2.0) * spacing
+        self.xy = np.stack(np.meshgrid(offsets, offsets, indexing="ij"), axis=-1)
+        self.xy += rng.normal(0.0, 0.02 * spacing, self.xy.shape)
+        lat, lon = self.local_map.transfer_from(self.xy[:, :, 0], self.xy[:, :, 1])
+
+        self.node_ids = np.arange(n_streets * n_streets).reshape(n_streets, n_streets) + 1
+        self.nodes = {}
+        for (i, j), node_id in np.ndenumerate(self.node_ids):
+            self.nodes[int(node_id)] = {"type": "node", "id": int(node_id),
+                                        "lat": float(lat[i, j]), "lon": float(lon[i, j])}
+
+        self.ways = {}
+        way_id = 1
+        for direction, prefix in enumerate(("North-South Street", "East-West Street")):
+            for k in range(n_streets):
+                tags = {
+                    "highway": "secondary" if k % 4 == 0 else "residential",
+                    "name": "{} {}".format(prefix, k),
+                    "zone:traffic": "DE:rural" if k % 5 == 4 else "DE:urban",
+                    "maxspeed": "50" if k % 4 == 0 else "30",
+                }
+                for start in range(0, n_streets - 1, blocks_per_way):
+                    ix = range(start, min(start + blocks_per_way, n_streets - 1) + 1)
+                    node_ids = self.node_ids[k, ix] if direction == 0 else self.node_ids[ix, k]
+                    self.ways[way_id] = {"type": "way", "id": way_id, "nodes": [int(n) for n in node_ids],
+                                         "tags": dict(tags)}
+                    way_id += 1
+
+    def get_elements(self):
+        return list(self.nodes.values()) + list(self.ways.values())
+
+    def write_tile_cache(self, cache_dir, zoom=14, margin=500.0, filter_id="default"):
+        """
+        Writes the network to the TileSource cache in cache_dir, such that no tiles are requested from the Overpass
+        API. Also covers a margin around the network with empty tiles. Returns the list of tiles written.
+        """
+        tile_source = TileSource(cache_dir=cache_dir)
+        lat = np.array([n["lat"] for n in self.nodes.values()])
+        lon = np.array([n["lon"] for n in self.nodes.values()])
+        s_lat, s_lon = EquirectangularFast.get_scale_at(np.mean(lat), np.mean(lon))
+        tiles = tile_source.get_required_tiles_bounding_box(lat, lon, zoom, tolerance_lat=s_lat * margin,
+                                                            tolerance_lon=s_lon * margin)
+
+        for tile in tiles:
+            south, west, north, east = tile_source.get_tile_bounding_box(*tile)
+            inside = (south <= lat) & (lat < north) & (west <= lon) & (lon < east)
+            node_ids_inside = set(np.array(list(self.nodes.keys()))[inside].tolist())
+
+            # like Overpass, return all ways with a node in the tile, and all nodes of these ways
+            ways = {way_id: way for way_id, way in self.ways.items()
+                    if any(n in node_ids_inside for n in way["nodes"])}
+            nodes = {n: self.nodes[n] for way in ways.values() for n in way["nodes"]}
+
+            filename = tile_source.get_cache_filename(*tile, filter_id=filter_id)
+            os.makedirs(os.path.dirname(filename), exist_ok=True)
+            with open(filename, 'wb') as outfile:
+                pickle.dump({"nodes": nodes, "ways": ways, "relations": {}}, outfile)
+
+        log.debug("wrote %s tiles with %s ways to %s", len(tiles), len(self.ways), cache_dir)
+        return tiles
+
+
+def create_track(network, n_samples, speed=5.0, gps_noise=3.0, overtaking_rate=0.05, seed=0,
+                 time_start=datetime.datetime(2021, 6, 1, 8, 0, 0), stop_probability=0.0, stop_duration=30.0):
+    """
+    Creates a track of n_samples, sampled at 1Hz, of a cyclist randomly riding along the streets of the network. The
+    GPS positions are disturbed by correlated noise with a standard deviation of gps_noise meters. In a fraction of
+    overtaking_rate of the samples, a confirmed overtaking event is recorded. At each intersection, the cyclist stops
+    with stop_probability, e.g. at traffic lights, for stop_duration seconds on average.
+    """
+    rng = np.random.default_rng(seed)
+    n = network.n_streets
+    directions = [(1, 0), (-1, 0), (0, 1), (0, -1)]
+
+    node = (int(rng.integers(n)), int(rng.integers(n)))
+    direction = None
+    node_next = None
+    s = 0.0
+    noise = rng.normal(0.0, gps_noise, 2)
+    waiting = 0
+
+    samples = []
+    for k in range(n_samples):
+        # at an intersection, pick the next street, but avoid turning around
+        while node_next is None or s >= np.linalg.norm(network.xy[node_next] - network.xy[node]):
+            if node_next is not None:
+                s -= np.linalg.norm(network.xy[node_next] - network.xy[node])
+                node = node_next
+                if stop_probability > 0 and rng.random() < stop_probability:
+                    waiting = int(rng.exponential(stop_duration))
+            options = [d for d in directions if 0 <= node[0] + d[0] < n and 0 <= node[1] + d[1] < n]
+            if direction is not None and len(options) > 1:
+                options = [d for d in options if d != (-direction[0], -direction[1])]
+            direction = options[rng.integers(len(options))]
+            node_next = (node[0] + direction[0], node[1] + direction[1])
+
+        a, b = network.xy[node], network.xy[node_next]
+        heading = (b - a) / np.linalg.norm(b - a)
+        noise = 0.9 * noise + np.sqrt(1.0 - 0.9 ** 2) * rng.normal(0.0, gps_noise, 2)
+        x, y = a + s * heading + noise
+        lat, lon = network.local_map.transfer_from(x, y)
+
+        v = max(0.0, speed * (1.0 + 0.2 * rng.normal())) if waiting == 0 else 0.0
+        waiting = max(0, waiting - 1)
+        overtaking = rng.random() < overtaking_rate
+        samples.append({
+            "time": time_start + datetime.timedelta(seconds=k),
+            "latitude": lat,
+            "longitude": lon,
+            "course": (np.degrees(np.arctan2(heading[0], heading[1])) + rng.normal(0.0, 3.0)) % 360.0,
+            "speed": v * 3.6,
+            "left": int(np.clip(rng.normal(150.0, 40.0), 30, 400)) if overtaking or rng.random() < 0.3 else None,
+            "right": int(np.clip(rng.normal(200.0, 60.0), 30, 400)) if rng.random() < 0.8 else None,
+            "confirmed": overtaking,
+        })
+
+        s += v
+
+    return samples
+
+
+def write_track_csv(filename, samples, format_version="2", raw_measurements=10, seed=0):
+    """
+    Writes the samples in the OBS CSV format, either version "2" or "1.3". For version 2, up to raw_measurements
+    raw ultrasonic measurements are written per line.
+    """
+    rng = np.random.default_rng(seed)
+
+    with open(filename, 'w', newline='') as file:
+        writer = csv.writer(file, delimiter=';')
+
+        if format_version == "2":
+            n_raw_max = max(1, raw_measurements)
+            writer.writerow(["OBSDataFormat=2&OBSFirmwareVersion=v0.8-synthetic&DeviceId=0be5&DataPerMeasurement=3"
+                             "&MaximumMeasurementsPerLine={}&OffsetLeft=30&OffsetRight=30"
+                             "&NumberOfDefinedPrivacyAreas=0&PrivacyLevelApplied=AbsolutePrivacy"
+                             "&MaximumValidFlightTimeMicroseconds=18560&TimeZone=UTC".format(n_raw_max)])
+            writer.writerow(CSV_HEADER_V2 + ["{}{}".format(label, i + 1) for i in range(n_raw_max)
+                                             for label in ("Tms", "Lus", "Rus")])
+
+            for k, sample in enumerate(samples):
+                left = sample["left"]
+                right = sample["right"]
+
+                n_raw = int(rng.integers(raw_measurements // 2, raw_measurements + 1)) if raw_measurements else 0
+                raw = []
+                for i in range(n_raw):
+                    raw += [i * 31,
+                            int(rng.normal(left, 3.0) * MICROSECONDS_PER_CM) if left is not None else "",
+                            int(rng.normal(right, 3.0) * MICROSECONDS_PER_CM) if right is not None else ""]
+
+                writer.writerow([
+                    sample["time"].strftime('%d.%m.%Y'), sample["time"].strftime('%H:%M:%S'), 5000 + k * 1000, "",
+                    "{:.6f}".format(sample["latitude"]), "{:.6f}".format(sample["longitude"]), "250.0",
+                    "{:.2f}".format(sample["course"]), "{:.2f}".format(sample["speed"]), "1.2", 8, "3.90",
+                    left if left is not None else "", right if right is not None else "",
+                    max(1, n_raw // 2) if sample["confirmed"] else 0, "", 0, 0, MICROSECONDS_PER_CM, n_raw
+                ] + raw + [""] * (3 * (n_raw_max - n_raw)))
+
+        elif format_version == "1.3":
+            writer.writerow(CSV_HEADER_V1)
+            for sample in samples:
+                writer.writerow([
+                    sample["time"].strftime('%d.%m.%Y'), sample["time"].strftime('%H:%M:%S'),
+                    "{:.6f}".format(sample["latitude"]), "{:.6f}".format(sample["longitude"]),
+                    "{:.2f}".format(sample["course"]), "{:.2f}".format(sample["speed"]),
+                    sample["right"] if sample["right"] is not None else 255,
+                    sample["left"] if sample["left"] is not None else 255,
+                    1 if sample["confirmed"] else 0, 0
+                ])
+
+        else:
+            raise ValueError("unsupported format {!r}".format(format_version))
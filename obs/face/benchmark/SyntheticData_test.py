@@ -0,0 +1,31 @@
+import os
+
+import pytest
+
+from obs.face.importer import ImportMeasurementsCsv
+from obs.face.osm import DataSource
+from .SyntheticData import SyntheticRoadNetwork, create_track, write_track_csv
+
+
+@pytest.mark.parametrize("format_version", ["2", "1.3"])
+def test_track_csv(tmp_path, format_version):
+    network = SyntheticRoadNetwork(n_streets=4)
+    samples = create_track(network, 100, overtaking_rate=0.2)
+    filename = os.path.join(str(tmp_path), "track.csv")
+    write_track_csv(filename, samples, format_version=format_version, raw_measurements=5)
+
+    measurements, statistics = ImportMeasurementsCsv().read(filename)
+    assert len(measurements) == 100
+    assert statistics["n_valid"] == 100
+    assert statistics["n_confirmed"] == sum(s["confirmed"] for s in samples)
+
+
+def test_tile_cache(tmp_path):
+    network = SyntheticRoadNetwork(n_streets=4)
+    cache_dir = str(tmp_path)
+    network.write_tile_cache(cache_dir)
+
+    nodes = network.nodes.values()
+    data_source = DataSource(cache_dir=cache_dir)
+    data_source.ensure_coverage([n["lat"] for n in nodes], [n["lon"] for n in nodes], extend=40.0)
+    assert sorted(data_source.ways.keys()) == sorted(network.ways.keys())
@@ -20,6 +20,10 @@
 import sys
 import logging
 
+import numpy as np
+
+from obs.face.instrumentation import timed
+
 from .MeasurementFilter import MeasurementFilter
 
 module_log = logging.getLogger(__name__)
@@ -29,8 +33,50 @@ class ChainFilter(MeasurementFilter):
     def __init__(self, *filters):
         self.filters = filters
 
+    @timed()
     def filter(self, measurements, log=module_log):
         for filter_ in self.filters:
             measurements = filter_.filter(measurements, log)
         log.debug("Applied %s filters.", len(self.filters))
         return measurements
+
+    def filter_iter(self, measurements, log=module_log):
+        """
+        Composes the lazy filters into a single iterator, so each measurement passes all filters before the next one
+        is read from measurements.
+        """
+        measurements = iter(measurements)
+        for filter_ in self.filters:
+            measurements = filter_.filter_iter(measurements, log)
+        return measurements
+
+    @timed()
+    def filter_columns(self, columns, log=module_log):
+        """
+        Filters measurements given as dict of equally long columns (lists or arrays). The masks of consecutive filters
+        are combined, and the columns are only selected once for all of them. Filters without mask_columns, like the
+        PrivacyFilter or filters only providing keep or mask, are applied with their own filter_columns. The number of
+        measurements removed by each filter is reported as with filter.
+        """
+        n = len(next(iter(columns.values()))) if columns else 0
+        keep = np.ones(n, dtype=bool)
+        n_kept = n
+        for filter_ in self.filters:
+            if filter_.mask_columns is not None:
+                keep &= filter_.mask_columns(columns)
+                n_kept_filter = int(np.count_nonzero(keep))
+                filter_.report(n_kept - n_kept_filter, n_kept_filter, log)
+                n_kept = n_kept_filter
+            else:
+                columns = self.select_columns(columns, keep)
+                columns = filter_.filter_columns(columns, log)
+                n_kept = len(next(iter(columns.values()))) if columns else 0
+                keep = np.ones(n_kept, dtype=bool)
+
+        log.debug("Applied %s filters.", len(self.filters))
+        return self.select_columns(columns, keep)
+
+    def select_columns(self, columns, keep):
+        if keep.all():
+            return columns
+        return {key: self.select(column, keep) for key, column in columns.items()}
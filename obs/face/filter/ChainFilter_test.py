@@ -0,0 +1,116 @@
+import logging
+
+import numpy as np
+
+from obs.face.instrumentation import instrumentation
+from .ChainFilter import ChainFilter
+from .ConfirmedFilter import ConfirmedFilter
+from .MeasurementFilter import MeasurementFilter
+from .DistanceMeasuredFilter import DistanceMeasuredFilter
+from .PrivacyFilter import PrivacyFilter
+from .PrivacyZonesFilter import PrivacyZonesFilter, PrivacyZone
+from .RequiredFieldsFilter import RequiredFieldsFilter
+
+
+def make_measurements(n=1000):
+    rng = np.random.default_rng(0)
+    return [{"time": i,
+             "latitude": 48.7 + 0.01 * rng.random() if rng.random() > 0.1 else None,
+             "longitude": 9.1 + 0.01 * rng.random(),
+             "distance_overtaker": rng.random() if rng.random() > 0.5 else None,
+             "distance_stationary": None,
+             "confirmed": bool(rng.random() > 0.3),
+             "in_privacy_zone": False}
+            for i in range(n)]
+
+
+def make_filter():
+    return ChainFilter(RequiredFieldsFilter(), DistanceMeasuredFilter(), ConfirmedFilter(),
+                       PrivacyZonesFilter([PrivacyZone(48.705, 9.105, 300.0)]), PrivacyFilter())
+
+
+class EvenTimeFilter(MeasurementFilter):
+    """
+    A filter only providing keep.
+    """
+    def filter(self, measurements, log=None):
+        return self.filter_by_mask(measurements)
+
+    def keep(self, measurement):
+        return measurement["time"] % 2 == 0
+
+
+def get_removed_counts(caplog):
+    return [r.args[0] for r in caplog.records if r.msg.startswith("Removed")]
+
+
+def test_filter_columns(caplog):
+    caplog.set_level(logging.INFO)
+    measurements = make_measurements()
+    expected = make_filter().filter(measurements)
+    removed = get_removed_counts(caplog)
+    assert len(removed) == 4 and all(n > 0 for n in removed)
+
+    caplog.clear()
+    columns = {key: [m[key] for m in measurements] for key in measurements[0]}
+    columns["latitude"] = np.array([np.nan if v is None else v for v in columns["latitude"]])
+    columns["confirmed"] = np.array(columns["confirmed"])
+    filtered = make_filter().filter_columns(columns)
+
+    # the same measurements are kept, and the same number of removed measurements is reported for each filter
+    assert get_removed_counts(caplog) == removed
+    assert list(filtered["time"]) == [m["time"] for m in expected]
+    assert "in_privacy_zone" not in filtered
+
+
+def test_filter_columns_keep():
+    measurements = make_measurements()
+    # NaN marks missing values in both filter and filter_columns
+    for m in measurements[::7]:
+        m["distance_overtaker"] = float("nan")
+    for m in measurements[::11]:
+        m["longitude"] = float("nan")
+    chain_filter = ChainFilter(RequiredFieldsFilter(), EvenTimeFilter(), DistanceMeasuredFilter())
+    expected = chain_filter.filter(measurements)
+
+    columns = {key: [m[key] for m in measurements] for key in measurements[0]}
+    filtered = chain_filter.filter_columns(columns)
+    assert list(filtered["time"]) == [m["time"] for m in expected]
+    assert all(m["time"] % 7 and m["time"] % 11 for m in expected)
+
+
+def test_filter_iter(caplog):
+    caplog.set_level(logging.INFO)
+    measurements = make_measurements()
+    expected = make_filter().filter(measurements)
+    removed = get_removed_counts(caplog)
+
+    caplog.clear()
+    n_read = []
+
+    def read():
+        for m in measurements:
+            n_read.append(m["time"])
+            yield m
+
+    chain_filter = make_filter()
+    # the privacy zones are tested in chunks
+    chain_filter.filters[3].chunk_size = 100
+    filtered = chain_filter.filter_iter(read())
+    # measurements are only read as far as needed
+    first = next(filtered)
+    assert len(n_read) < len(measurements)
+    assert [first] + list(filtered) == expected
+    assert get_removed_counts(caplog) == removed
+
+
+def test_filter_iter_timed():
+    instrumentation.reset()
+    instrumentation.enable()
+    try:
+        list(PrivacyFilter().filter_iter(make_measurements()))
+        state = instrumentation.pop_state()
+    finally:
+        instrumentation.enable(False)
+
+    assert state["timers"]["PrivacyFilter.filter_iter"]["calls"] == 1
@@ -20,20 +20,27 @@
 import sys
 import logging
 
+import numpy as np
+
+from obs.face.instrumentation import timed
+
 from .MeasurementFilter import MeasurementFilter
 
 module_log = logging.getLogger(__name__)
 
 
 class ConfirmedFilter(MeasurementFilter):
+    report_message = "Removed %s unconfirmed measurements, kept %s confirmed."
+
+    @timed()
     def filter(self, measurements, log=module_log):
-        input_size = len(measurements)
-        result = [
-            measurement for measurement in measurements if measurement.get("confirmed")
-        ]
-        log.info(
-            "Removed %s unconfirmed measurements, kept %s confirmed.",
-            input_size - len(result),
-            len(result),
-        )
-        return result
+        return self.filter_by_mask(measurements, log)
+
+    def keep(self, measurement):
+        return bool(measurement.get("confirmed"))
+
+    def mask_columns(self, columns):
+        confirmed = columns.get("confirmed")
+        if confirmed is None:
+            return np.zeros(len(next(iter(columns.values()))), dtype=bool)
+        return np.fromiter((bool(v) for v in confirmed), dtype=bool, count=len(confirmed))
@@ -20,23 +20,30 @@
 import sys
 import logging
 
+import numpy as np
+
+from obs.face.instrumentation import timed
+
 from .MeasurementFilter import MeasurementFilter
 
 module_log = logging.getLogger(__name__)
 
 
 class DistanceMeasuredFilter(MeasurementFilter):
+    report_message = "Removed %s measurements without distance, kept %s confirmed."
+
+    @timed()
     def filter(self, measurements, log=module_log):
-        input_size = len(measurements)
-        result = [
-            measurement
-            for measurement in measurements
-            if measurement.get("distance_overtaker") is not None
-            or measurement.get("distance_stationary") is not None
-        ]
-        log.info(
-            "Removed %s measurements without distance, kept %s confirmed.",
-            input_size - len(result),
-            len(result),
-        )
-        return result
+        return self.filter_by_mask(measurements, log)
+
+    def keep(self, measurement):
+        return self.is_value_present(measurement.get("distance_overtaker")) \
+            or self.is_value_present(measurement.get("distance_stationary"))
+
+    def mask_columns(self, columns):
+        n = len(next(iter(columns.values())))
+        keep = np.zeros(n, dtype=bool)
+        for field in ("distance_overtaker", "distance_stationary"):
+            if field in columns:
+                keep |= self.is_present(columns[field])
+        return keep
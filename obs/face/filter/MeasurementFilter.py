@@ -17,15 +17,138 @@
 # along with the OpenBikeSensor Scripts Collection.  If not, see
 # <http://www.gnu.org/licenses/>.
 
+import itertools
 import sys
 import logging
 
 from abc import ABC, abstractmethod
 
+import numpy as np
+
+from obs.face.instrumentation import instrumentation, timed
+
 module_log = logging.getLogger(__name__)
 
 
 class MeasurementFilter(ABC):
+    # log message reporting the number of removed and kept measurements
+    report_message = "Removed %s measurements, kept %s."
+
+    # number of measurements passed to mask at once by filter_iter
+    chunk_size = 4096
+
+    # Optional, per filter: keep(measurement) returns whether a single measurement passes the filter, mask(measurements)
+    # returns a boolean array, which is True for the measurements of a list passing it, and mask_columns(columns) does
+    # the same for measurements given as dict of equally long columns (lists or arrays). Filters override them with
+    # methods, None means the filter does not provide them.
+    keep = None
+    mask = None
+    mask_columns = None
+
     @abstractmethod
     def filter(self, measurements, log=module_log):
         pass
+
+    @timed()
+    def filter_iter(self, measurements, log=module_log):
+        """
+        Lazy variant of filter, which takes any iterable of measurements and yields the measurements passing the
+        filter. The number of removed measurements is reported once the input is exhausted. Filters providing
+        neither keep nor mask fall back to filter, which holds all measurements in memory.
+        """
+        n = n_kept = 0
+        if self.keep is not None:
+            keep = self.keep
+            for m in measurements:
+                n += 1
+                if keep(m):
+                    n_kept += 1
+                    yield m
+        elif self.mask is not None:
+            for chunk in iter_chunks(measurements, self.chunk_size):
+                n += len(chunk)
+                for m, keep in zip(chunk, self.mask(chunk).tolist()):
+                    if keep:
+                        n_kept += 1
+                        yield m
+        else:
+            yield from self.filter(list(measurements), log)
+            return
+
+        self.report(n - n_kept, n_kept, log)
+
+    def filter_by_mask(self, measurements, log=module_log):
+        """
+        Implements filter for filters providing keep or mask, and reports the number of removed measurements.
+        """
+        if self.keep is not None:
+            keep = self.keep
+            result = [m for m in measurements if keep(m)]
+        else:
+            result = self.select(measurements, self.mask(measurements))
+        self.report(len(measurements) - len(result), len(result), log)
+        return result
+
+    def filter_columns(self, columns, log=module_log):
+        """
+        Filters measurements given as dict of equally long columns (lists or arrays), and returns the filtered columns.
+        Unless the filter provides mask_columns, the measurements are rebuilt as dicts for keep, mask or filter.
+        """
+        if self.mask_columns is not None:
+            keep = self.mask_columns(columns)
+        else:
+            keys = list(columns)
+            measurements = [dict(zip(keys, values)) for values in zip(*columns.values())]
+            if self.keep is not None:
+                keep = np.fromiter(map(self.keep, measurements), dtype=bool, count=len(measurements))
+            elif self.mask is not None:
+                keep = self.mask(measurements)
+            else:
+                measurements = self.filter(measurements, log)
+                if measurements:
+                    keys = list(measurements[0])
+                return {key: [m.get(key) for m in measurements] for key in keys}
+
+        n_kept = int(np.count_nonzero(keep))
+        self.report(len(keep) - n_kept, n_kept, log)
+        return {key: self.select(column, keep) for key, column in columns.items()}
+
+    def report(self, n_removed, n_kept, log=module_log):
+        instrumentation.count(type(self).__name__ + ".rejected", n_removed)
+        log.info(self.report_message, n_removed, n_kept)
+
+    @staticmethod
+    def select(column, keep):
+        if isinstance(column, np.ndarray):
+            return column[keep]
+        return [v for v, k in zip(column, keep.tolist()) if k]
+
+    @staticmethod
+    def is_value_present(value):
+        """
+        Returns whether a value is neither None nor NaN, which both mark missing values, as in is_present.
+        """
+        return value is not None and value == value
+
+    @staticmethod
+    def is_present(column):
+        """
+        Returns a boolean array, which is True for the values of a column that are neither None nor NaN.
+        """
+        if isinstance(column, np.ndarray) and column.dtype.kind == "f":
+            return ~np.isnan(column)
+        if isinstance(column, np.ndarray) and column.dtype.kind != "O":
+            return np.ones(len(column), dtype=bool)
+        return np.fromiter((v is not None and v == v for v in column), dtype=bool, count=len(column))
+
+
+def iter_chunks(iterable, size):
+    """
+    Yields lists of up to size consecutive items of iterable.
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
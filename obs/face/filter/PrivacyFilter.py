@@ -21,7 +21,9 @@ from enum import Enum
 import hashlib
 import logging
 
-from memoization import cached
+import numpy as np
+
+from obs.face.instrumentation import timed
 
 from .MeasurementFilter import MeasurementFilter
 
@@ -35,11 +37,15 @@ class AnonymizationMode(str, Enum):
 
 
 class PrivacyFilter(MeasurementFilter):
+    # maximum number of hashes kept; if exceeded, the cache is cleared
+    hash_cache_size = 65536
+
     def __init__(
         self,
         hash_salt=None,
         user_id_mode=AnonymizationMode.REMOVE,
         measurement_id_mode=AnonymizationMode.REMOVE,
+        pseudonym_table=None,
     ):
         self.keys_keep = [
             "time",
@@ -71,6 +77,7 @@ class PrivacyFilter(MeasurementFilter):
             "OSM_ban_on_car_passing_bike"
         ]
         # 'in_privacy_zone',  'discontinuity',
+        self.keys_keep_set = frozenset(self.keys_keep)
 
         if (
             AnonymizationMode.HASHED in [user_id_mode, measurement_id_mode]
@@ -84,53 +91,119 @@ class PrivacyFilter(MeasurementFilter):
 
         self.user_pseudonymization = {}
         self.dataset_pseudonymization = {}
+        self.hash_cache = {}
+
+        # optional persistent table of pseudonyms, so only new ids are hashed
+        self.pseudonym_table = pseudonym_table
+        if pseudonym_table is not None:
+            self.dataset_pseudonymization.update(pseudonym_table.get_datasets_by_pseudonym())
 
-    @cached
     def create_hash(self, value):
-        hash_bytes = (self.hash_salt + value).encode("utf-8")
-        hash_object = hashlib.sha512(hash_bytes)
-        hex_hash = hash_object.hexdigest()
-        return hex_hash[0::2]  # half the size
+        hex_hash = self.hash_cache.get(value)
+        if hex_hash is None:
+            hash_bytes = (self.hash_salt + value).encode("utf-8")
+            hash_object = hashlib.sha512(hash_bytes)
+            hex_hash = hash_object.hexdigest()[0::2]  # half the size
+            if len(self.hash_cache) >= self.hash_cache_size:
+                self.hash_cache.clear()
+            self.hash_cache[value] = hex_hash
+        return hex_hash
+
+    def pseudonymize_user_id(self, user_id):
+        if self.pseudonym_table is not None:
+            return self.pseudonym_table.get_pseudonym("users", user_id, self.create_user_pseudonym)
+        return self.create_user_pseudonym(user_id)
+
+    def create_user_pseudonym(self, user_id):
+        return "user_" + self.create_hash(user_id)
+
+    def pseudonymize_dataset_id(self, dataset_id):
+        if self.pseudonym_table is not None:
+            return self.pseudonym_table.get_pseudonym("datasets", dataset_id, self.create_hash)
+        return self.create_hash(dataset_id)
+
+    def pseudonymize_measurement_id(self, measurement_id):
+        ix = measurement_id.rfind(":")
+        dataset_id, line_id = (
+            (measurement_id, "")
+            if ix == -1
+            else (measurement_id[:ix], measurement_id[ix:])
+        )
+        dataset_id_pseudonym = self.pseudonymize_dataset_id(dataset_id)
+        if dataset_id_pseudonym not in self.dataset_pseudonymization:
+            self.dataset_pseudonymization[dataset_id_pseudonym] = dataset_id
+        return dataset_id_pseudonym + line_id
 
     def filter(self, measurements, log=module_log):
-        # only keep measurements which are not marked as private
-        measurements_filtered = [
-            m
-            for m in measurements
-            if ("in_privacy_zone" in m) and m["in_privacy_zone"] is not True
-        ]
-
-        # only keep selected fields
-        measurements_filtered2 = [
-            {key: value for key, value in m.items() if key in self.keys_keep}
-            for m in measurements_filtered
-        ]
-
-        # replace user_id and measurement_id by pseudonyms
-        for m in measurements_filtered2:
-            if self.user_id_mode == AnonymizationMode.HASHED and "user_id" in m:
-                user_id = m["user_id"]
-                user_id_pseudonym = "user_" + self.create_hash(m["user_id"])
-                m["user_id"] = user_id_pseudonym
+        return list(self.filter_iter(measurements, log))
+
+    @timed()
+    def filter_iter(self, measurements, log=module_log):
+        keys_keep = self.keys_keep_set
+        hash_user_id = self.user_id_mode == AnonymizationMode.HASHED
+        remove_user_id = self.user_id_mode == AnonymizationMode.REMOVE
+        hash_measurement_id = self.measurement_id_mode == AnonymizationMode.HASHED
+        remove_measurement_id = self.measurement_id_mode == AnonymizationMode.REMOVE
+
+        for m in measurements:
+            # only keep measurements which are not marked as private
+            if m.get("in_privacy_zone", True) is True:
+                continue
+
+            # only keep selected fields
+            m = {key: value for key, value in m.items() if key in keys_keep}
+
+            # replace user_id and measurement_id by pseudonyms
+            if "user_id" in m:
+                if hash_user_id:
+                    m["user_id"] = self.pseudonymize_user_id(m["user_id"])
+                elif remove_user_id:
+                    del m["user_id"]
+
+            if "measurement_id" in m:
+                if hash_measurement_id:
+                    m["measurement_id"] = self.pseudonymize_measurement_id(m["measurement_id"])
+                elif remove_measurement_id:
+                    del m["measurement_id"]
+
+            yield m
+
+    @timed()
+    def filter_columns(self, columns, log=module_log):
+        """
+        Filters measurements given as dict of equally long columns (lists or arrays) instead of a list of dicts, and
+        returns the filtered columns. Each distinct user or dataset id is hashed only once.
+        """
+        n = len(next(iter(columns.values()))) if columns else 0
+        if "in_privacy_zone" in columns:
+            in_privacy_zone = columns["in_privacy_zone"]
+            if isinstance(in_privacy_zone, np.ndarray) and in_privacy_zone.dtype == bool:
+                keep = ~in_privacy_zone
+            else:
+                keep = np.array([v is not True and v is not np.True_ for v in in_privacy_zone], dtype=bool)
+        else:
+            keep = np.zeros(n, dtype=bool)
+
+        columns_filtered = {key: self.select(column, keep) for key, column in columns.items()
+                            if key in self.keys_keep_set}
+
+        if "user_id" in columns_filtered:
+            if self.user_id_mode == AnonymizationMode.HASHED:
+                columns_filtered["user_id"] = self.map_distinct(columns_filtered["user_id"], self.pseudonymize_user_id)
             elif self.user_id_mode == AnonymizationMode.REMOVE:
-                m.pop("user_id", None)
-
-            if (
-                self.measurement_id_mode == AnonymizationMode.HASHED
-                and "measurement_id" in m
-            ):
-                measurement_id = m["measurement_id"]
-                ix = measurement_id.rfind(":")
-                dataset_id, line_id = (
-                    (measurement_id, "")
-                    if ix == -1
-                    else (measurement_id[:ix], measurement_id[ix:])
-                )
-                dataset_id_pseudonym = self.create_hash(dataset_id)
-                m["measurement_id"] = dataset_id_pseudonym + line_id
-                if dataset_id_pseudonym not in self.dataset_pseudonymization:
-                    self.dataset_pseudonymization[dataset_id_pseudonym] = dataset_id
+                del columns_filtered["user_id"]
+
+        if "measurement_id" in columns_filtered:
+            if self.measurement_id_mode == AnonymizationMode.HASHED:
+                columns_filtered["measurement_id"] = self.map_distinct(
+                    columns_filtered["measurement_id"], self.pseudonymize_measurement_id)
             elif self.measurement_id_mode == AnonymizationMode.REMOVE:
-                m.pop("measurement_id", None)
+                del columns_filtered["measurement_id"]
+
+        return columns_filtered
 
-        return measurements_filtered2
+    @staticmethod
+    def map_distinct(column, function):
+        values, inverse = np.unique(np.asarray(column, dtype=object), return_inverse=True)
+        mapped = np.array([function(v) for v in values], dtype=object)[inverse.ravel()]
+        return mapped if isinstance(column, np.ndarray) else mapped.tolist()
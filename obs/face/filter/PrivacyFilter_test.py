@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+from .PrivacyFilter import PrivacyFilter, AnonymizationMode
+from .PseudonymTable import PseudonymTable
+
+
+def make_measurements():
+    return [
+        {"time": 0, "latitude": 48.7, "longitude": 9.1, "user_id": "alice", "measurement_id": "alice/a.csv:1",
+         "in_privacy_zone": False, "private": "x"},
+        {"time": 1, "latitude": 48.7, "longitude": 9.1, "user_id": "alice", "measurement_id": "alice/a.csv:2",
+         "in_privacy_zone": True, "private": "x"},
+        {"time": 2, "latitude": 48.7, "longitude": 9.1, "user_id": "bob", "measurement_id": "bob/b.csv:1",
+         "in_privacy_zone": None},
+        {"time": 3, "latitude": 48.7, "longitude": 9.1, "user_id": "bob", "measurement_id": "bob/b.csv:2"},
+    ]
+
+
+def test_filter():
+    privacy_filter = PrivacyFilter(hash_salt="salt", user_id_mode=AnonymizationMode.HASHED,
+                                   measurement_id_mode=AnonymizationMode.HASHED)
+    filtered = privacy_filter.filter(make_measurements())
+
+    assert [m["time"] for m in filtered] == [0, 2]
+    assert all("private" not in m and "in_privacy_zone" not in m for m in filtered)
+    assert filtered[0]["user_id"] == "user_" + privacy_filter.create_hash("alice")
+    assert filtered[1]["measurement_id"] == privacy_filter.create_hash("bob/b.csv") + ":1"
+    assert set(privacy_filter.dataset_pseudonymization.values()) == {"alice/a.csv", "bob/b.csv"}
+
+    filtered = PrivacyFilter().filter(make_measurements())
+    assert all("user_id" not in m and "measurement_id" not in m for m in filtered)
+
+
+def test_filter_columns():
+    measurements = make_measurements()
+    columns = {key: [m.get(key, True) for m in measurements] for key in measurements[0]}
+    columns["time"] = np.array(columns["time"])
+
+    privacy_filter = PrivacyFilter(hash_salt="salt", user_id_mode=AnonymizationMode.HASHED,
+                                   measurement_id_mode=AnonymizationMode.KEEP)
+    filtered = privacy_filter.filter_columns(columns)
+    expected = privacy_filter.filter(measurements)
+
+    assert set(filtered) == {"time", "latitude", "longitude", "user_id", "measurement_id"}
+    assert isinstance(filtered["time"], np.ndarray)
+    for key, column in filtered.items():
+        assert list(column) == [m[key] for m in expected]
+
+
+def test_pseudonym_table(tmp_path):
+    filename = str(tmp_path / "pseudonyms.json")
+
+    privacy_filter = PrivacyFilter(hash_salt="salt", user_id_mode=AnonymizationMode.HASHED,
+                                   measurement_id_mode=AnonymizationMode.HASHED,
+                                   pseudonym_table=PseudonymTable(filename, "salt"))
+    expected = privacy_filter.filter(make_measurements())
+    privacy_filter.pseudonym_table.save()
+
+    # ids known from the table are not hashed again
+    privacy_filter = PrivacyFilter(hash_salt="salt", user_id_mode=AnonymizationMode.HASHED,
+                                   measurement_id_mode=AnonymizationMode.HASHED,
+                                   pseudonym_table=PseudonymTable(filename, "salt"))
+    assert privacy_filter.filter(make_measurements()) == expected
+    assert privacy_filter.hash_cache == {}
+    assert not privacy_filter.pseudonym_table.modified
+    assert set(privacy_filter.dataset_pseudonymization.values()) == {"alice/a.csv", "bob/b.csv"}
+
+    with pytest.raises(ValueError):
+        PseudonymTable(filename, "another salt")
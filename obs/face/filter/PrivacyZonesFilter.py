@@ -22,8 +22,9 @@ import hashlib
 import logging
 from typing import List
 
-from geopy.distance import geodesic
-from memoization import cached
+import numpy as np
+
+from obs.face.instrumentation import timed
 
 from .MeasurementFilter import MeasurementFilter
 
@@ -41,27 +42,114 @@ class PrivacyZone:
         self.radius = radius
 
     def contains(self, lat: float, lng: float) -> bool:
+        # geopy takes long to import, and is only needed for points close to a zone boundary
+        from geopy.distance import geodesic
+
         return (
             geodesic((lat, lng), (self.latitude, self.longitude)).meters <= self.radius
         )
 
 
 class PrivacyZonesFilter(MeasurementFilter):
-    def __init__(self, privacy_zones: List[PrivacyZone]):
+    # mean earth radius, as used by the haversine formula
+    earth_radius = 6371008.8
+
+    # relative deviation of the haversine distance from the geodesic distance on the WGS84 ellipsoid, which is
+    # below 0.6%; within this margin around the zone boundary, the exact geodesic distance is computed
+    haversine_tolerance = 0.006
+
+    def __init__(self, privacy_zones: List[PrivacyZone], exact=True):
+        """
+        If exact is False, zone membership is decided by the haversine distance alone, i.e. assuming a spherical earth.
+        """
         self.privacy_zones = privacy_zones
+        if not exact:
+            self.haversine_tolerance = 0.0
+
+        self.zone_lat = np.array([zone.latitude for zone in privacy_zones], dtype=float)
+        self.zone_lon = np.array([zone.longitude for zone in privacy_zones], dtype=float)
+        self.zone_radius = np.array([zone.radius for zone in privacy_zones], dtype=float)
+
+        # the zones are indexed by a regular grid in latitude and longitude, with cells about the size of the largest
+        # zone; each zone is registered in all cells overlapped by its bounding box
+        radius_max = self.zone_radius.max() * (1 + self.haversine_tolerance) if privacy_zones else 0.0
+        self.n_cells_lon = int(360.0 // max(np.degrees(2.0 * radius_max / self.earth_radius), 1e-3))
+        self.cell_size = 360.0 / self.n_cells_lon
+        self.grid = self.create_grid()
+
+    def create_grid(self):
+        cells = {}
+        r = self.zone_radius * (1 + self.haversine_tolerance) / self.earth_radius
+        d_lat = np.degrees(r)
+        cos_lat = np.cos(np.radians(np.clip(np.abs(self.zone_lat) + d_lat, 0.0, 90.0)))
+        d_lon = np.where(cos_lat > np.sin(r), np.degrees(np.arcsin(np.sin(r) / np.maximum(cos_lat, 1e-12))), 180.0)
+
+        i_min, i_max = self.get_cell(self.zone_lat - d_lat), self.get_cell(self.zone_lat + d_lat)
+        j_min, j_max = self.get_cell(self.zone_lon - d_lon), self.get_cell(self.zone_lon + d_lon)
+        for k in range(len(self.privacy_zones)):
+            for i in range(i_min[k], i_max[k] + 1):
+                for j in range(j_min[k], min(j_max[k], j_min[k] + self.n_cells_lon - 1) + 1):
+                    cells.setdefault((i, j % self.n_cells_lon), []).append(k)
+
+        return {cell: np.array(zones) for cell, zones in cells.items()}
+
+    def get_cell(self, degrees):
+        return np.floor(np.asarray(degrees) / self.cell_size).astype(np.int64)
+
+    def contains(self, lat, lon):
+        """
+        Checks for arrays of coordinates whether they are located in any privacy zone. Coordinates given as None or
+        NaN are never contained.
+        """
+        lat = np.array(lat, dtype=float)
+        lon = np.array(lon, dtype=float)
+        contained = np.zeros(len(lat), dtype=bool)
 
+        valid = np.flatnonzero(np.isfinite(lat) & np.isfinite(lon))
+        if len(valid) == 0 or not self.grid:
+            return contained
+
+        # group the coordinates by grid cell, and test each group against the zones registered in that cell only
+        cell_i = self.get_cell(lat[valid])
+        cell_j = self.get_cell(lon[valid]) % self.n_cells_lon
+        cells, cell_index = np.unique(cell_i * self.n_cells_lon + cell_j, return_inverse=True)
+        cell_index = cell_index.ravel()
+        order = np.argsort(cell_index, kind="stable")
+        bounds = np.searchsorted(cell_index[order], np.arange(len(cells) + 1))
+
+        for c, (i, j) in enumerate(zip(*np.divmod(cells, self.n_cells_lon))):
+            zones = self.grid.get((int(i), int(j)))
+            if zones is None:
+                continue
+            ix = valid[order[bounds[c]:bounds[c + 1]]]
+            d = self.haversine(lat[ix, np.newaxis], lon[ix, np.newaxis], self.zone_lat[zones], self.zone_lon[zones])
+            r = self.zone_radius[zones]
+
+            inside = d <= r * (1 - self.haversine_tolerance)
+            # exact test near the zone boundaries
+            for m, k in zip(*np.nonzero(~inside & (d <= r * (1 + self.haversine_tolerance)))):
+                inside[m, k] = self.privacy_zones[zones[k]].contains(lat[ix[m]], lon[ix[m]])
+
+            contained[ix] = inside.any(axis=1)
+
+        return contained
+
+    @classmethod
+    def haversine(cls, lat_1, lon_1, lat_2, lon_2):
+        lat_1, lon_1, lat_2, lon_2 = map(np.radians, (lat_1, lon_1, lat_2, lon_2))
+        a = np.sin(0.5 * (lat_2 - lat_1)) ** 2 + np.cos(lat_1) * np.cos(lat_2) * np.sin(0.5 * (lon_2 - lon_1)) ** 2
+        return 2.0 * cls.earth_radius * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+    report_message = "Removed %s measurements in privacy zones, kept %s."
+
+    @timed()
     def filter(self, measurements, log=module_log):
-        # This is a slow and naive implementation, but it will work for now.
         # Suggested improvements:
-        # - speed up algorithm
         # - maybe do not filter zones that are just being passed through without stop
-        def _process():
-            for measurement in measurements:
-                in_zone = any(
-                    zone.contains(measurement["latitude"], measurement["longitude"])
-                    for zone in self.privacy_zones
-                )
-                if not in_zone:
-                    yield measurement
-
-        return list(_process())
+        return self.filter_by_mask(measurements, log)
+
+    def mask(self, measurements):
+        return ~self.contains([m.get("latitude") for m in measurements], [m.get("longitude") for m in measurements])
+
+    def mask_columns(self, columns):
+        return ~self.contains(columns["latitude"], columns["longitude"])
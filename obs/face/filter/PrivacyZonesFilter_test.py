@@ -0,0 +1,35 @@
+import numpy as np
+
+from .PrivacyZonesFilter import PrivacyZonesFilter, PrivacyZone
+
+
+def test_privacy_zones_filter():
+    rng = np.random.default_rng(0)
+    zones = [PrivacyZone(48.7 + 0.1 * rng.random(), 9.1 + 0.1 * rng.random(), r)
+             for r in rng.uniform(50.0, 500.0, 20)]
+    # a zone across the antimeridian
+    zones.append(PrivacyZone(10.0, 179.999, 1000.0))
+
+    lat = np.r_[48.7 + 0.1 * rng.random(500), 10.0, 10.0]
+    lon = np.r_[9.1 + 0.1 * rng.random(500), -179.999, 179.0]
+    measurements = [{"latitude": a, "longitude": b} for a, b in zip(lat, lon)]
+    measurements.append({"latitude": None, "longitude": None})
+
+    privacy_zones_filter = PrivacyZonesFilter(zones)
+    filtered = privacy_zones_filter.filter(measurements)
+
+    # compare to testing every measurement against every zone
+    expected = [m for m in measurements
+                if m["latitude"] is None
+                or not any(zone.contains(m["latitude"], m["longitude"]) for zone in zones)]
+    assert filtered == expected
+    assert len(expected) < len(measurements) - 20
+
+    # near the zone center across the antimeridian (about 220 m), and about 110 km away on the same side
+    in_zone = privacy_zones_filter.contains(lat[-2:], lon[-2:])
+    assert in_zone.tolist() == [True, False]
+
+
+def test_no_zones():
+    measurements = [{"latitude": 48.7, "longitude": 9.1}]
+    assert PrivacyZonesFilter([]).filter(measurements) == measurements
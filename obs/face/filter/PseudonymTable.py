@@ -0,0 +1,76 @@
+# Copyright (C) 2020-2021 OpenBikeSensor Contributors
+# Contact: https://openbikesensor.org
+#
+# This file is part of the OpenBikeSensor Scripts Collection.
+#
+# The OpenBikeSensor Scripts Collection is free software: you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public License as
+# published by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# The OpenBikeSensor Scripts Collection is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Lesser
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with the OpenBikeSensor Scripts Collection.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+import hashlib
+import json
+import logging
+import os
+
+module_log = logging.getLogger(__name__)
+
+
+class PseudonymTable:
+    def __init__(self, filename, hash_salt):
+        """
+        Persistent table of the pseudonyms assigned to user and dataset ids, stored as JSON in filename. The table is
+        bound to the salt it was created with; loading it with a different salt fails, so pseudonyms stay consistent
+        across runs. Like the salt, the table must be kept secret, as it maps the pseudonyms back to the ids.
+        """
+        self.filename = filename
+        self.salt_check = hashlib.sha512(("pseudonym table" + hash_salt).encode("utf-8")).hexdigest()[0::2]
+        self.pseudonyms = {"users": {}, "datasets": {}}
+        self.modified = False
+
+        if os.path.isfile(filename):
+            self.load()
+
+    def load(self):
+        with open(self.filename, "r") as f:
+            data = json.load(f)
+
+        if data["salt_check"] != self.salt_check:
+            raise ValueError("pseudonym table {} was created with a different salt".format(self.filename))
+
+        self.pseudonyms = {"users": data["users"], "datasets": data["datasets"]}
+        module_log.info("loaded %s user and %s dataset pseudonyms from %s", len(data["users"]),
+                        len(data["datasets"]), self.filename)
+
+    def save(self):
+        if not self.modified:
+            return
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.filename)), exist_ok=True)
+        with open(self.filename, "w") as f:
+            json.dump({"salt_check": self.salt_check, **self.pseudonyms}, f, indent=1)
+        self.modified = False
+
+    def get_pseudonym(self, category, value, create_pseudonym):
+        """
+        Returns the pseudonym of value in the given category ("users" or "datasets"). Unknown values are assigned the
+        pseudonym returned by create_pseudonym(value).
+        """
+        pseudonyms = self.pseudonyms[category]
+        pseudonym = pseudonyms.get(value)
+        if pseudonym is None:
+            pseudonym = pseudonyms[value] = create_pseudonym(value)
+            self.modified = True
+        return pseudonym
+
+    def get_datasets_by_pseudonym(self):
+        return {pseudonym: dataset_id for dataset_id, pseudonym in self.pseudonyms["datasets"].items()}
@@ -19,6 +19,10 @@
 
 import logging
 
+import numpy as np
+
+from obs.face.instrumentation import timed
+
 from .MeasurementFilter import MeasurementFilter
 
 module_log = logging.getLogger(__name__)
@@ -32,12 +36,18 @@ class RequiredFieldsFilter(MeasurementFilter):
             "latitude",
         ]
 
+    report_message = "Removed %s invalid measurements, kept %s."
+
+    @timed()
     def filter(self, measurements, log=module_log):
-        input_size = len(measurements)
-        result = [
-            measurement
-            for measurement in measurements
-            if all(measurement.get(field) is not None for field in self.required_fields)
-        ]
-        log.info("Removed %s invalid measurements", input_size - len(result))
-        return result
+        return self.filter_by_mask(measurements, log)
+
+    def keep(self, measurement):
+        return all(map(self.is_value_present, map(measurement.get, self.required_fields)))
+
+    def mask_columns(self, columns):
+        n = len(next(iter(columns.values())))
+        keep = np.ones(n, dtype=bool)
+        for field in self.required_fields:
+            keep &= self.is_present(columns[field]) if field in columns else False
+        return keep
@@ -19,6 +19,7 @@
 
 from .MeasurementFilter import MeasurementFilter
 from .PrivacyFilter import PrivacyFilter, AnonymizationMode
+from .PseudonymTable import PseudonymTable
 from .ChainFilter import ChainFilter
 from .RequiredFieldsFilter import RequiredFieldsFilter
 from .DistanceMeasuredFilter import DistanceMeasuredFilter
@@ -0,0 +1,195 @@
+# Copyright (C) 2020-2021 OpenBikeSensor Contributors
+# Contact: https://openbikesensor.org
+#
+# This file is part of the OpenBikeSensor Scripts Collection.
+#
+# The OpenBikeSensor Scripts Collection is free software: you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public License as
+# published by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# The OpenBikeSensor Scripts Collection is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Lesser
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with the OpenBikeSensor Scripts Collection.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+import json
+import logging
+import math
+import os
+
+import numpy as np
+
+from .ExportMeasurements import ExportMeasurements
+from .ExportVectorTiles import lonlat_to_mercator
+
+log = logging.getLogger(__name__)
+
+# corners of a pointy-top hexagon of circumradius 1
+HEXAGON_CORNERS = np.array([[math.cos(math.radians(a)), math.sin(math.radians(a))] for a in range(30, 390, 60)])
+
+# corners of a square of edge length 1, relative to its center
+SQUARE_CORNERS = np.array([[-0.5, -0.5], [0.5, -0.5], [0.5, 0.5], [-0.5, 0.5]])
+
+
+def mercator_to_lonlat(x, y):
+    lon = np.asarray(x) * 360.0 - 180.0
+    lat = np.degrees(np.arctan(np.sinh(math.pi * (1.0 - 2.0 * np.asarray(y)))))
+    return lon, lat
+
+
+def hexagon_cells(x, y, size):
+    """
+    Assigns the points (x, y) to a grid of pointy-top hexagons with circumradius size. Returns the axial cell
+    coordinates (q, r) of each point.
+    """
+    q = (math.sqrt(3.0) / 3.0 * x - y / 3.0) / size
+    r = (2.0 / 3.0 * y) / size
+
+    # round the cube coordinates (q, r, -q-r), fixing the component with the largest rounding error
+    s = -q - r
+    q_i, r_i, s_i = np.round(q), np.round(r), np.round(s)
+    dq, dr, ds = np.abs(q_i - q), np.abs(r_i - r), np.abs(s_i - s)
+    fix_q = (dq > dr) & (dq > ds)
+    fix_r = ~fix_q & (dr > ds)
+    q_i = np.where(fix_q, -r_i - s_i, q_i)
+    r_i = np.where(fix_r, -q_i - s_i, r_i)
+
+    return q_i.astype(np.int64), r_i.astype(np.int64)
+
+
+def hexagon_centers(q, r, size):
+    return size * math.sqrt(3.0) * (q + r / 2.0), size * 1.5 * r
+
+
+def grouped_quantiles(group, values, n_groups, quantiles):
+    """
+    Computes the quantiles of values within each group, interpolating linearly like numpy.quantile. Returns an array
+    of shape (n_groups, len(quantiles)), holding NaN for groups without values.
+    """
+    order = np.lexsort((values, group))
+    group, values = group[order], values[order]
+    count = np.bincount(group, minlength=n_groups)
+    start = np.concatenate(([0], np.cumsum(count)[:-1]))
+
+    result = np.full((n_groups, len(quantiles)), np.nan)
+    has_values = count > 0
+    for k, q in enumerate(quantiles):
+        position = start[has_values] + q * (count[has_values] - 1)
+        lower = np.floor(position).astype(np.int64)
+        upper = np.ceil(position).astype(np.int64)
+        w = position - lower
+        result[has_values, k] = values[lower] * (1.0 - w) + values[upper] * w
+
+    return result
+
+
+class ExportMeasurementBins(ExportMeasurements):
+    def __init__(self, path, do_filter=True, grid="hex", zooms=(8, 10, 12, 14), raw_zoom=15, cell_size=24,
+                 quantiles=(0.1, 0.25, 0.5, 0.75, 0.9)):
+        """
+        Aggregates the measurements into hexagonal or square grid bins, for each of the given zoom levels, and writes
+        one GeoJSON file of bins per zoom level to path/{zoom}.json. The cells have a size of about cell_size screen
+        pixels at their zoom level. Each bin holds the number of measurements and the quantiles of the overtaking
+        distances.
+
+        The bins are meant to be shown below raw_zoom; path/metadata.json lists the zoom levels for the
+        visualization.
+        """
+        super().__init__(path, do_filter=do_filter, properties=["distance_overtaker"])
+        if grid not in ("hex", "square"):
+            raise ValueError("unknown grid type {!r}, use 'hex' or 'square'".format(grid))
+        self.path = path
+        self.grid = grid
+        self.zooms = sorted(zooms)
+        self.raw_zoom = raw_zoom
+        self.cell_size = cell_size
+        self.quantiles = quantiles
+
+        self.lon = []
+        self.lat = []
+        self.distance = []
+
+    def open(self):
+        pass
+
+    def write_feature(self, feature):
+        lon, lat = feature["geometry"]["coordinates"]
+        d = feature["properties"]["distance_overtaker"]
+        self.lon.append(lon)
+        self.lat.append(lat)
+        self.distance.append(d if d is not None else np.nan)
+
+    def close(self):
+        os.makedirs(self.path, exist_ok=True)
+
+        x, y = lonlat_to_mercator(self.lon, self.lat)
+        distance = np.array(self.distance, dtype=float)
+
+        n_bins = 0
+        for zoom in self.zooms:
+            features = self.get_bins(x, y, distance, zoom)
+            with open(os.path.join(self.path, "{}.json".format(zoom)), 'w') as f:
+                json.dump({"type": "FeatureCollection", "features": features}, f)
+            n_bins += len(features)
+
+        metadata = {
+            "grid": self.grid,
+            "zooms": self.zooms,
+            "rawzoom": self.raw_zoom,
+            "bounds": [min(self.lon), min(self.lat), max(self.lon), max(self.lat)] if self.lon else None,
+            "quantiles": list(self.quantiles),
+        }
+        with open(os.path.join(self.path, "metadata.json"), 'w') as f:
+            json.dump(metadata, f)
+
+        log.info("wrote %s bins of %s measurements at %s zoom levels to %s", n_bins, len(self.lon),
+                 len(self.zooms), self.path)
+
+    def get_bins(self, x, y, distance, zoom):
+        if len(x) == 0:
+            return []
+
+        # size of a cell in normalized web mercator coordinates, given 256 pixels per tile
+        size = self.cell_size / (256.0 * 2 ** zoom)
+        if self.grid == "hex":
+            size /= math.sqrt(3.0)
+            cx, cy = hexagon_cells(x, y, size)
+            corners = HEXAGON_CORNERS * size
+        else:
+            cx, cy = np.floor(x / size).astype(np.int64), np.floor(y / size).astype(np.int64)
+            corners = SQUARE_CORNERS * size
+
+        # cy is never negative, so both cell coordinates can be packed into a single key
+        keys, cell, count = np.unique(cx * (np.int64(1) << 32) + cy, return_inverse=True, return_counts=True)
+        cell = cell.ravel()
+        cx, cy = keys >> 32, keys & 0xffffffff
+
+        if self.grid == "hex":
+            center_x, center_y = hexagon_centers(cx, cy, size)
+        else:
+            center_x, center_y = (cx + 0.5) * size, (cy + 0.5) * size
+
+        valid = np.isfinite(distance)
+        n_distance = np.bincount(cell[valid], minlength=len(keys))
+        quantiles = grouped_quantiles(cell[valid], distance[valid], len(keys), self.quantiles)
+
+        # the outlines of all cells, closed and converted back to longitude and latitude
+        corners = np.concatenate((corners, corners[:1]))
+        lon, lat = mercator_to_lonlat(center_x[:, None] + corners[None, :, 0], center_y[:, None] + corners[None, :, 1])
+        rings = np.round(np.stack((lon, lat), axis=2), 6).tolist()
+
+        features = []
+        for i in range(len(keys)):
+            properties = {"count": int(count[i]), "n_distance": int(n_distance[i])}
+            for q, v in zip(self.quantiles, quantiles[i]):
+                properties["distance_overtaker_q{:02d}".format(round(q * 100))] = float(v) if n_distance[i] else None
+            features.append({"type": "Feature",
+                             "properties": properties,
+                             "geometry": {"type": "Polygon", "coordinates": [rings[i]]}})
+
+        return features
@@ -0,0 +1,60 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from .ExportMeasurementBins import ExportMeasurementBins, grouped_quantiles, hexagon_cells, hexagon_centers
+from .ExportMeasurements_test import make_measurement
+
+
+def test_grouped_quantiles():
+    rng = np.random.default_rng(0)
+    group = rng.integers(0, 5, 200)
+    values = rng.normal(size=200)
+    result = grouped_quantiles(group, values, 6, (0.1, 0.5, 0.9))
+    for g in range(5):
+        assert np.allclose(result[g], np.quantile(values[group == g], (0.1, 0.5, 0.9)))
+    assert np.all(np.isnan(result[5]))
+
+
+def test_hexagon_cells():
+    # each point is assigned to the hexagon with the nearest center
+    rng = np.random.default_rng(0)
+    x, y = rng.uniform(-10.0, 10.0, (2, 1000))
+    q, r = hexagon_cells(x, y, 1.0)
+    center_x, center_y = hexagon_centers(q, r, 1.0)
+    d = np.hypot(x - center_x, y - center_y)
+    for dq, dr in ((1, 0), (0, 1), (-1, 1), (-1, 0), (0, -1), (1, -1)):
+        neighbour_x, neighbour_y = hexagon_centers(q + dq, r + dr, 1.0)
+        assert np.all(d <= np.hypot(x - neighbour_x, y - neighbour_y) + 1e-9)
+
+
+@pytest.mark.parametrize("grid", ["hex", "square"])
+def test_export(tmp_path, grid):
+    path = str(tmp_path)
+    measurements = []
+    for i in range(20):
+        m = make_measurement(0)
+        m["longitude"] = 9.18 + (i % 2) * 1e-5
+        m["distance_overtaker"] = 1.0 + i * 0.1
+        measurements.append(m)
+
+    exporter = ExportMeasurementBins(path, grid=grid, zooms=(10, 12))
+    exporter.add_measurements(measurements)
+    exporter.finalize()
+
+    with open(os.path.join(path, "metadata.json")) as f:
+        metadata = json.load(f)
+    assert metadata["zooms"] == [10, 12] and metadata["grid"] == grid
+
+    for zoom in (10, 12):
+        with open(os.path.join(path, "{}.json".format(zoom))) as f:
+            features = json.load(f)["features"]
+        # all measurements are within a few meters, so they fall into a single bin
+        assert len(features) == 1
+        properties = features[0]["properties"]
+        assert properties["count"] == 20
+        assert properties["distance_overtaker_q50"] == pytest.approx(1.95)
+        ring = features[0]["geometry"]["coordinates"][0]
+        assert len(ring) == (7 if grid == "hex" else 5) and ring[0] == ring[-1]
@@ -22,12 +22,56 @@ import os
 import logging
 import math
 
+from obs.face.instrumentation import timed
+
 log = logging.getLogger(__name__)
 
+
+def convert_course(m):
+    course = m["course"]
+    if course is not None:
+        course = 90.0 - math.degrees(course)
+        course = course % 360.0
+    return course
+
+
 class ExportMeasurements:
-    def __init__(self, filename, do_filter=True):
+    property_getters = {
+        "time": lambda m: str(m["time"]),
+        "distance_overtaker": lambda m: m["distance_overtaker"],
+        "distance_stationary": lambda m: m["distance_stationary"],
+        "confirmed": lambda m: m["confirmed"],
+        "course": convert_course,
+        "speed": lambda m: m["speed"],
+        "user_id": lambda m: m.get("user_id"),
+        "measurement_id": lambda m: m.get("measurement_id"),
+        "egomotion_is_derived": lambda m: m["egomotion_is_derived"],
+        "latitude_GPS": lambda m: m.get("latitude_GPS"),
+        "longitude_GPS": lambda m: m.get("longitude_GPS"),
+        "latitude_projected": lambda m: m.get("latitude_projected"),
+        "longitude_projected": lambda m: m.get("longitude_projected"),
+        "has_OSM_annotations": lambda m: m["has_OSM_annotations"],
+        "OSM_way_id": lambda m: m.get("OSM_way_id"),
+        "OSM_way_orientation": lambda m: m.get("OSM_way_orientation"),
+        "OSM_zone": lambda m: m.get("OSM_zone"),
+        "OSM_maxspeed": lambda m: m.get("OSM_maxspeed"),
+        "OSM_name": lambda m: m.get("OSM_name"),
+        "OSM_oneway": lambda m: m.get("OSM_oneway"),
+        "OSM_lanes": lambda m: m.get("OSM_lanes"),
+        "OSM_highway": lambda m: m.get("OSM_highway"),
+    }
+
+    coordinate_properties = ["latitude_GPS", "longitude_GPS", "latitude_projected", "longitude_projected"]
+
+    def __init__(self, filename, do_filter=True, properties=None, coordinate_precision=None, line_delimited=False):
+        """
+        Writes measurements as GeoJSON points. Features are written to the file as soon as they are added, either as
+        one FeatureCollection, or, if line_delimited is set, as newline-delimited GeoJSON with one Feature per line.
+
+        properties optionally selects the exported feature properties (default: all), and coordinate_precision the
+        number of decimal places of all coordinates (default: full precision).
+        """
         self.filename = filename
-        self.features = None
         self.n_samples = 0
         self.n_valid = 0
         self.n_valid_latlon = 0
@@ -36,9 +80,45 @@ class ExportMeasurements:
         self.only_confirmed_measurements = do_filter
         self.only_valid_distances = do_filter
         self.show_GPS_position = False
+        self.coordinate_precision = coordinate_precision
+        self.line_delimited = line_delimited
+
+        if properties is None:
+            properties = list(self.property_getters.keys())
+        unknown = [p for p in properties if p not in self.property_getters]
+        if unknown:
+            raise ValueError("unknown measurement properties: " + ", ".join(unknown))
+        self.properties = [(p, self.property_getters[p]) for p in properties]
+        self.properties_rounded = [p for p in properties if p in self.coordinate_properties] \
+            if coordinate_precision is not None else []
+
+        self.file = None
+        self.n_written = 0
+
+    def open(self):
+        if self.file is not None:
+            return
+
+        os.makedirs(os.path.dirname(self.filename), exist_ok=True)
+
+        log.info("writing GeoJSON file %s", self.filename)
+        self.file = open(self.filename, 'w')
+        if not self.line_delimited:
+            self.file.write('{"type": "FeatureCollection", "features": [')
 
+    def write_feature(self, feature):
+        s = json.dumps(feature)
+        if self.line_delimited:
+            self.file.write(s + "\n")
+        else:
+            self.file.write(", " + s if self.n_written else s)
+        self.n_written += 1
+
+    @timed()
     def add_measurements(self, data):
-        self.features = []
+        self.open()
+
+        precision = self.coordinate_precision
 
         for m in data:
             self.n_samples += 1
@@ -52,57 +132,36 @@ class ExportMeasurements:
                 continue
             self.n_valid += 1
 
-            course = m["course"]
-            if course is not None:
-                course = 90.0 - math.degrees(course)
-                course = course % 360.0
-
             if self.show_GPS_position:
                 p_lon, p_lat = m["longitude_GPS"], m["latitude_GPS"]
             else:
                 p_lon, p_lat = m["longitude"], m["latitude"]
 
+            properties = {key: getter(m) for key, getter in self.properties}
+
+            if precision is not None:
+                p_lon, p_lat = round(p_lon, precision), round(p_lat, precision)
+                for key in self.properties_rounded:
+                    if properties[key] is not None:
+                        properties[key] = round(properties[key], precision)
+
             feature = {"type": "Feature",
-                       "properties": {"time": str(m["time"]),
-                                      "distance_overtaker": m["distance_overtaker"],
-                                      "distance_stationary": m["distance_stationary"],
-                                      "confirmed": m["confirmed"],
-                                      "course": course,
-                                      "speed": m["speed"],
-                                      "user_id": m.get("user_id"),
-                                      "measurement_id": m.get("measurement_id"),
-                                      "egomotion_is_derived": m["egomotion_is_derived"],
-                                      "latitude_GPS": m["latitude_GPS"] if "latitude_GPS" in m else None,
-                                      "longitude_GPS": m["longitude_GPS"] if "longitude_GPS" in m else None,
-                                      "latitude_projected":
-                                          m["latitude_projected"] if "latitude_projected" in m else None,
-                                      "longitude_projected":
-                                          m["longitude_projected"] if "longitude_projected" in m else None,
-                                      "has_OSM_annotations": m["has_OSM_annotations"],
-                                      "OSM_way_id": m["OSM_way_id"] if "OSM_way_id" in m else None,
-                                      "OSM_way_orientation": m[
-                                          "OSM_way_orientation"] if "OSM_way_orientation" in m else None,
-                                      "OSM_zone": m["OSM_zone"] if "OSM_zone" in m else None,
-                                      "OSM_maxspeed": m["OSM_maxspeed"] if "OSM_maxspeed" in m else None,
-                                      "OSM_name": m["OSM_name"] if "OSM_name" in m else None,
-                                      "OSM_oneway": m["OSM_oneway"] if "OSM_oneway" in m else None,
-                                      "OSM_lanes": m["OSM_lanes"] if "OSM_lanes" in m else None,
-                                      "OSM_highway": m["OSM_highway"] if "OSM_highway" in m else None
-                                      },
+                       "properties": properties,
                        "geometry": {"type": "Point", "coordinates": [p_lon, p_lat]}
                        }
 
-            self.features.append(feature)
+            self.write_feature(feature)
 
+    @timed()
     def finalize(self):
         log.info("%s samples, %s valid (%s valid lat/lon, %s valid distance, %s confirmed)",
                   self.n_samples, self.n_valid, self.n_valid_latlon, self.n_valid_dist, self.n_confirmed)
 
-        data = {"type": "FeatureCollection",
-                "features": self.features}
+        self.close()
 
-        os.makedirs(os.path.dirname(self.filename), exist_ok=True)
-
-        log.info("writing GeoJSON file %s", self.filename)
-        with open(self.filename, 'w') as f:
-            json.dump(data, f)
+    def close(self):
+        self.open()
+        if not self.line_delimited:
+            self.file.write(']}')
+        self.file.close()
+        self.file = None
@@ -0,0 +1,249 @@
+# Copyright (C) 2020-2021 OpenBikeSensor Contributors
+# Contact: https://openbikesensor.org
+#
+# This file is part of the OpenBikeSensor Scripts Collection.
+#
+# The OpenBikeSensor Scripts Collection is free software: you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public License as
+# published by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# The OpenBikeSensor Scripts Collection is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Lesser
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with the OpenBikeSensor Scripts Collection.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+import datetime
+import json
+import logging
+import os
+import struct
+
+import numpy as np
+
+from .ExportMeasurements import ExportMeasurements
+
+log = logging.getLogger(__name__)
+
+MAGIC = b"OBSM"
+VERSION = 2
+
+# columns are aligned to this number of bytes, so the web viewer can map them to typed arrays
+ALIGNMENT = 8
+
+# properties stored as integers in units of 1 / divisor, with the largest value of the type marking missing values
+QUANTIZED_PROPERTIES = {
+    "distance_overtaker": ("uint16", 100),
+    "distance_stationary": ("uint16", 100),
+    "course": ("uint16", 100),
+    "speed": ("uint16", 100),
+}
+
+COORDINATE_PROPERTIES = ["longitude", "latitude", "latitude_GPS", "longitude_GPS", "latitude_projected",
+                         "longitude_projected"]
+
+FLAG_PROPERTIES = ["confirmed", "egomotion_is_derived", "has_OSM_annotations"]
+
+# all other properties are dictionary encoded
+
+
+def to_datetime(t):
+    if isinstance(t, str):
+        t = datetime.datetime.fromisoformat(t.replace("Z", "+00:00"))
+    return t
+
+
+def to_epoch(t):
+    if t.tzinfo is None:
+        t = t.replace(tzinfo=datetime.timezone.utc)
+    return t.timestamp()
+
+
+def get_utc_offset_minutes(t):
+    """
+    Returns the UTC offset of a datetime in minutes, or None for naive datetimes.
+    """
+    offset = t.utcoffset()
+    return None if offset is None else int(offset.total_seconds() // 60)
+
+
+def to_json_value(v):
+    return v.item() if isinstance(v, np.generic) else v
+
+
+class ExportMeasurementsBinary(ExportMeasurements):
+    property_getters = dict(ExportMeasurements.property_getters, time=lambda m: m["time"])
+
+    def __init__(self, filename, do_filter=True, properties=None, coordinate_precision=6):
+        """
+        Writes measurements in a compact binary format for the web viewer, with one typed column per property instead
+        of one GeoJSON feature per measurement. Coordinates are stored as int32 with coordinate_precision decimal
+        places, distances, course and speed as uint16 in hundredths, flags as uint8, timestamps as delta-encoded
+        seconds plus milliseconds and a dictionary encoded UTC offset, and all other properties as indices into a
+        dictionary of their distinct values.
+
+        The file starts with the magic bytes "OBSM", the uint32 length of a JSON header describing the columns, and
+        the header itself. All numbers are little endian.
+        """
+        coordinate_precision = 6 if coordinate_precision is None else coordinate_precision
+        if not 0 <= coordinate_precision <= 7:
+            raise ValueError("coordinate precision must be between 0 and 7 decimal places for int32 coordinates")
+        super().__init__(filename, do_filter=do_filter, properties=properties)
+        self.coordinate_divisor = 10 ** coordinate_precision
+
+        self.columns = {name: [] for name in ["longitude", "latitude"] + [p for p, _ in self.properties]}
+
+    def open(self):
+        pass
+
+    def write_feature(self, feature):
+        lon, lat = feature["geometry"]["coordinates"]
+        self.columns["longitude"].append(lon)
+        self.columns["latitude"].append(lat)
+        for key, value in feature["properties"].items():
+            self.columns[key].append(value)
+        self.n_written += 1
+
+    def close(self):
+        n = self.n_written
+        header_columns = []
+        blocks = []
+        offset = 0
+        for name, values in self.columns.items():
+            column, arrays = self.encode_column(name, values)
+            for key, array in arrays:
+                offset += -offset % ALIGNMENT
+                column[key] = offset
+                blocks.append((offset, array.tobytes()))
+                offset += array.nbytes
+            header_columns.append(column)
+
+        header = json.dumps({"version": VERSION, "count": n, "columns": header_columns}).encode("utf-8")
+        # the column offsets are relative to the end of the padded header
+        header += b" " * (-(len(MAGIC) + 4 + len(header)) % ALIGNMENT)
+
+        os.makedirs(os.path.dirname(self.filename), exist_ok=True)
+        log.info("writing binary measurements file %s", self.filename)
+        with open(self.filename, 'wb') as f:
+            f.write(MAGIC + struct.pack("<I", len(header)) + header)
+            position = 0
+            for block_offset, data in blocks:
+                f.write(b"\0" * (block_offset - position))
+                f.write(data)
+                position = block_offset + len(data)
+
+    def encode_column(self, name, values):
+        """
+        Returns the header entry of a column and its arrays, as list of (header key of the offset, array).
+        """
+        if name in COORDINATE_PROPERTIES:
+            return self.encode_quantized(name, values, "int32", self.coordinate_divisor)
+        elif name in QUANTIZED_PROPERTIES:
+            return self.encode_quantized(name, values, *QUANTIZED_PROPERTIES[name])
+        elif name in FLAG_PROPERTIES:
+            data = np.array([255 if v is None else int(bool(v)) for v in values], dtype="<u1")
+            return {"name": name, "encoding": "flag", "type": "uint8", "missing": 255}, [("offset", data)]
+        elif name == "time":
+            return self.encode_time(name, values)
+        else:
+            return self.encode_dictionary(name, values)
+
+    @staticmethod
+    def encode_quantized(name, values, type_name, divisor):
+        dtype = np.dtype(type_name).newbyteorder("<")
+        info = np.iinfo(dtype)
+        # the largest value marks missing values, except for signed types, where it is the smallest
+        missing = info.min if info.min < 0 else info.max
+        lower, upper = (info.min + 1, info.max) if info.min < 0 else (0, info.max - 1)
+
+        v = np.array([np.nan if x is None else x for x in values], dtype=float)
+        valid = np.isfinite(v)
+        data = np.full(len(v), missing, dtype=dtype)
+        data[valid] = np.clip(np.round(v[valid] * divisor), lower, upper)
+        return {"name": name, "encoding": "quantized", "type": type_name, "divisor": divisor,
+                "missing": int(missing)}, [("offset", data)]
+
+    @staticmethod
+    def encode_time(name, values):
+        values = [None if v is None else to_datetime(v) for v in values]
+        missing = np.array([v is None for v in values], dtype=bool)
+        milliseconds = np.round(np.array([0.0 if v is None else to_epoch(v) for v in values]) * 1000.0)
+        milliseconds = milliseconds.astype(np.int64)
+        seconds = milliseconds // 1000
+
+        # seconds relative to the previous timestamp, starting from base
+        base = int(seconds[~missing][0]) if np.any(~missing) else 0
+        seconds[missing] = base
+        delta = np.diff(seconds, prepend=base).astype("<i4")
+        ms = (milliseconds % 1000).astype("<u2")
+        ms[missing] = 65535
+
+        # the UTC offsets in minutes, None for naive timestamps, so they are shown like in the GeoJSON export
+        utc_offsets = {}
+        utc_offset_index = np.array([utc_offsets.setdefault(None if v is None else get_utc_offset_minutes(v),
+                                                            len(utc_offsets)) for v in values], dtype="<u1")
+        if len(utc_offsets) > 256:
+            raise ValueError("too many distinct UTC offsets")
+
+        return {"name": name, "encoding": "time", "type": "int32", "base": base, "type_milliseconds": "uint16",
+                "missing": 65535, "type_utc_offset": "uint8", "utc_offsets": list(utc_offsets)}, \
+            [("offset", delta), ("offset_milliseconds", ms), ("offset_utc_offset", utc_offset_index)]
+
+    @staticmethod
+    def encode_dictionary(name, values):
+        dictionary = {}
+        indices = [dictionary.setdefault(json.dumps(to_json_value(v)), len(dictionary)) for v in values]
+        type_name = "uint8" if len(dictionary) <= 2 ** 8 else "uint16" if len(dictionary) <= 2 ** 16 else "uint32"
+        data = np.array(indices, dtype=np.dtype(type_name).newbyteorder("<"))
+        return {"name": name, "encoding": "dictionary", "type": type_name,
+                "dictionary": [json.loads(k) for k in dictionary]}, [("offset", data)]
+
+
+def read_measurements_binary(filename):
+    """
+    Reads a file written by ExportMeasurementsBinary, and returns a dict of column name to the list of values, with
+    None for missing values and timestamps as datetimes with their original UTC offset.
+    """
+    with open(filename, 'rb') as f:
+        data = f.read()
+    if data[:len(MAGIC)] != MAGIC:
+        raise ValueError("{} is not a binary measurements file".format(filename))
+    header_length, = struct.unpack_from("<I", data, len(MAGIC))
+    start = len(MAGIC) + 4
+    header = json.loads(data[start:start + header_length].decode("utf-8"))
+    start += header_length
+    n = header["count"]
+
+    def read_array(type_name, offset):
+        return np.frombuffer(data, dtype=np.dtype(type_name).newbyteorder("<"), count=n, offset=start + offset)
+
+    columns = {}
+    for column in header["columns"]:
+        values = read_array(column["type"], column["offset"])
+        encoding = column["encoding"]
+        if encoding == "quantized":
+            columns[column["name"]] = [None if v == column["missing"] else v / column["divisor"]
+                                       for v in values.tolist()]
+        elif encoding == "flag":
+            columns[column["name"]] = [None if v == column["missing"] else v == 1 for v in values.tolist()]
+        elif encoding == "time":
+            seconds = column["base"] + np.cumsum(values.astype(np.int64))
+            ms = read_array(column["type_milliseconds"], column["offset_milliseconds"])
+            timezones = [None if offset is None else datetime.timezone(datetime.timedelta(minutes=offset))
+                         for offset in column["utc_offsets"]]
+            utc_offset_index = read_array(column["type_utc_offset"], column["offset_utc_offset"])
+            columns[column["name"]] = [
+                None if m == column["missing"] else
+                datetime.datetime.fromtimestamp(s, tz=timezones[k] or datetime.timezone.utc).replace(
+                    microsecond=m * 1000, tzinfo=timezones[k])
+                for s, m, k in zip(seconds.tolist(), ms.tolist(), utc_offset_index.tolist())]
+        elif encoding == "dictionary":
+            columns[column["name"]] = [column["dictionary"][i] for i in values.tolist()]
+        else:
+            raise ValueError("unknown column encoding " + encoding)
+
+    return columns
@@ -0,0 +1,65 @@
+import json
+from datetime import datetime, timedelta
+from os.path import join
+
+import pytest
+import pytz
+
+from .ExportMeasurements import ExportMeasurements
+from .ExportMeasurementsBinary import ExportMeasurementsBinary, read_measurements_binary
+from .ExportMeasurements_test import make_measurement
+
+
+def make_measurements():
+    measurements = []
+    for i in range(5):
+        m = make_measurement(i)
+        m["time"] = datetime(2021, 6, 26, 14, 0, 0, tzinfo=pytz.UTC) + timedelta(days=100 * i, milliseconds=i * 7)
+        # local times are kept with their UTC offset
+        if i % 2:
+            m["time"] = m["time"].astimezone(pytz.timezone("Europe/Berlin"))
+        m["distance_overtaker"] = 1.234 + i
+        m["OSM_name"] = "Hauptstraße" if i % 2 else None
+        m["OSM_way_id"] = 1234567890 + i % 2
+        measurements.append(m)
+    return measurements
+
+
+def test_roundtrip(tmp_path):
+    filename = join(str(tmp_path), "measurements.bin")
+    exporter = ExportMeasurementsBinary(filename)
+    exporter.add_measurements(make_measurements())
+    exporter.finalize()
+
+    # compare to the GeoJSON export of the same measurements
+    filename_geojson = join(str(tmp_path), "measurements.json")
+    exporter = ExportMeasurements(filename_geojson)
+    exporter.add_measurements(make_measurements())
+    exporter.finalize()
+    with open(filename_geojson) as f:
+        features = json.load(f)["features"]
+
+    columns = read_measurements_binary(filename)
+    assert len(columns["time"]) == len(features) == 5
+    for i, feature in enumerate(features):
+        lon, lat = feature["geometry"]["coordinates"]
+        assert columns["longitude"][i] == pytest.approx(lon, abs=1e-6)
+        assert columns["latitude"][i] == pytest.approx(lat, abs=1e-6)
+        for key, value in feature["properties"].items():
+            if key == "time":
+                assert str(columns[key][i]) == value
+            elif isinstance(value, float):
+                assert columns[key][i] == pytest.approx(value, abs=0.01)
+            else:
+                assert columns[key][i] == value
+
+
+def test_size(tmp_path):
+    measurements = make_measurements() * 200
+    for name, exporter_class in (("measurements.bin", ExportMeasurementsBinary),
+                                 ("measurements.json", ExportMeasurements)):
+        exporter = exporter_class(join(str(tmp_path), name))
+        exporter.add_measurements(measurements)
+        exporter.finalize()
+
+    assert (tmp_path / "measurements.bin").stat().st_size * 5 < (tmp_path / "measurements.json").stat().st_size
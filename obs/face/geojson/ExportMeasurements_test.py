@@ -0,0 +1,54 @@
+import json
+from datetime import datetime
+from os.path import join
+
+import pytz
+
+from .ExportMeasurements import ExportMeasurements
+
+
+def make_measurement(i):
+    return {
+        "time": datetime(2021, 6, 26, 14, 0, i, tzinfo=pytz.UTC),
+        "latitude": 48.123456789,
+        "longitude": 9.123456789 + i,
+        "latitude_GPS": 48.123456789,
+        "distance_overtaker": 1.5 if i != 1 else None,
+        "distance_stationary": None,
+        "confirmed": True,
+        "course": 0.0,
+        "speed": 5.0,
+        "egomotion_is_derived": False,
+        "has_OSM_annotations": False,
+    }
+
+
+def test_feature_collection(tmp_path):
+    filename = join(str(tmp_path), "measurements.json")
+    exporter = ExportMeasurements(filename)
+    exporter.add_measurements([make_measurement(0), make_measurement(1)])
+    exporter.add_measurements([make_measurement(2)])
+    exporter.finalize()
+
+    with open(filename) as f:
+        data = json.load(f)
+
+    assert data["type"] == "FeatureCollection"
+    assert [f["geometry"]["coordinates"][0] for f in data["features"]] == [9.123456789, 11.123456789]
+    assert data["features"][0]["properties"]["course"] == 90.0
+    assert data["features"][0]["properties"]["OSM_name"] is None
+
+
+def test_line_delimited_subset(tmp_path):
+    filename = join(str(tmp_path), "measurements.json")
+    exporter = ExportMeasurements(filename, properties=["distance_overtaker", "latitude_GPS"], coordinate_precision=5,
+                                  line_delimited=True)
+    exporter.add_measurements([make_measurement(0), make_measurement(2)])
+    exporter.finalize()
+
+    with open(filename) as f:
+        features = [json.loads(line) for line in f]
+
+    assert len(features) == 2
+    assert features[0]["properties"] == {"distance_overtaker": 1.5, "latitude_GPS": 48.12346}
+    assert features[0]["geometry"]["coordinates"] == [9.12346, 48.12346]
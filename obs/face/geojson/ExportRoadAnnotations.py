@@ -22,55 +22,187 @@ import os
 import numpy as np
 import logging
 
+from obs.face.filter.MeasurementFilter import iter_chunks
 from obs.face.mapping import AzimuthalEquidistant as LocalMap
+from obs.face.instrumentation import timed
 
 log = logging.getLogger(__name__)
 
 
 class ExportRoadAnnotation:
-    def __init__(self, filename, map_source, right_hand_traffic=True):
+    # number of measurements aggregated at once by add_measurements
+    chunk_size = 65536
+
+    def __init__(self, filename, map_source, right_hand_traffic=True, geometry_cache=None):
         self.filename = filename
         self.map_source = map_source
+        self.geometry_cache = geometry_cache
         self.features = None
         self.n_samples = 0
         self.n_valid = 0
         self.n_grouped = 0
         self.way_statistics = {}
+        self.datasets = set()
         self.only_confirmed_measurements = True
         self.right_hand_traffic = right_hand_traffic
 
+    @staticmethod
+    def get_dataset_id(measurement):
+        # the measurement id is composed of the dataset id and the line number
+        return measurement["measurement_id"].rpartition(":")[0]
+
+    def add_datasets(self, dataset_ids):
+        self.datasets.update(dataset_ids)
+
+    def merge(self, other):
+        """
+        Merges the way statistics of another exporter, e.g. computed by a parallel worker, into this one.
+        """
+        for way_id, way_stats in other.way_statistics.items():
+            if way_id in self.way_statistics:
+                self.way_statistics[way_id].merge(way_stats)
+            else:
+                self.way_statistics[way_id] = way_stats
+        self.datasets.update(other.datasets)
+        self.n_samples += other.n_samples
+        self.n_valid += other.n_valid
+        self.n_grouped += other.n_grouped
+        return self
+
+    def load_statistics(self, filename):
+        """
+        Loads way statistics and the ids of the datasets they were computed from, as stored by save_statistics.
+        """
+        with open(filename, 'r') as f:
+            data = json.load(f)
+
+        self.datasets = set(data["datasets"])
+        self.way_statistics = {}
+        for way_data in data["ways"]:
+            way_stats = WayStatistics.from_dict(way_data)
+            self.way_statistics[way_stats.way_id] = way_stats
+
+        log.info("loaded statistics of %s ways from %s datasets", len(self.way_statistics), len(self.datasets))
+
+    def save_statistics(self, filename):
+        data = {"datasets": sorted(self.datasets),
+                "ways": [way_stats.to_dict() for way_stats in self.way_statistics.values()]}
+
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+
+        with open(filename, 'w') as f:
+            json.dump(data, f)
+
+    @timed()
     def add_measurements(self, measurements):
-        for sample in measurements:
-            self.n_samples += 1
-            # filter measurements
-            if sample["latitude"] is None or sample["longitude"] is None or sample["distance_overtaker"] is None \
-                    or self.only_confirmed_measurements and (sample["confirmed"] is not True) \
-                    or not sample["has_OSM_annotations"]:
-                continue
+        """
+        Adds measurements given as any iterable, e.g. the output of a lazy filter. They are aggregated in chunks of
+        chunk_size measurements, so they are never held in memory at once.
+        """
+        for chunk in iter_chunks(measurements, self.chunk_size):
+            self.add_measurements_chunk(chunk)
 
-            self.n_valid += 1
+    def add_measurements_chunk(self, measurements):
+        self.n_samples += len(measurements)
 
-            way_id = sample["OSM_way_id"]
-            value = sample["distance_overtaker"]
-            way_orientation = sample["OSM_way_orientation"]
+        # filter measurements
+        measurements = [m for m in measurements
+                        if m["latitude"] is not None and m["longitude"] is not None
+                        and m["distance_overtaker"] is not None
+                        and not (self.only_confirmed_measurements and m["confirmed"] is not True)
+                        and m["has_OSM_annotations"]]
+        self.n_valid += len(measurements)
 
-            self.map_source.ensure_coverage([sample["latitude"]], [sample["longitude"]])
+        if not measurements:
+            return
 
-            if way_id in self.way_statistics:
-                # way statistic object already created
-                self.way_statistics[way_id].add_sample(value, way_orientation)
-                self.n_grouped += 1
-            else:
-                way = self.map_source.get_way_by_id(way_id)
+        self.map_source.ensure_coverage([m["latitude"] for m in measurements], [m["longitude"] for m in measurements])
+
+        self.add_columns([m["OSM_way_id"] for m in measurements],
+                         [m["OSM_way_orientation"] for m in measurements],
+                         [m["distance_overtaker"] for m in measurements])
+
+    def add_columns(self, way_id, orientation, distance):
+        """
+        Adds overtaking distances given as arrays of equal length, together with the OSM way id and the orientation
+        relative to the way. The samples are grouped by way and direction in one go, and the aggregates of each group
+        are added to the way statistics.
+        """
+        way_id = np.asarray(way_id)
+        direction = (np.asarray(orientation) == -1).astype(np.int64)
+        distance = np.asarray(distance, dtype=float)
+
+        ways, way_index = np.unique(way_id, return_inverse=True)
+        way_index = way_index.ravel()
+
+        # look up or create the statistics of each way only once
+        way_statistics = []
+        found = np.zeros(len(ways), dtype=bool)
+        for k, w in enumerate(ways.tolist()):
+            way_stats = self.way_statistics.get(w)
+            if way_stats is None:
+                way = self.map_source.get_way_by_id(w)
                 if way:
-                    # statistic object not created, but OSM way exists
-                    self.way_statistics[way_id] = WayStatistics(way_id, way).add_sample(value, way_orientation)
-                    self.n_grouped += 1
+                    way_stats = self.way_statistics[w] = WayStatistics(w, way)
                 else:
-                    logging.warning("way not found in map")
+                    log.warning("way %s not found in map", w)
+            found[k] = way_stats is not None
+            way_statistics.append(way_stats)
+
+        keep = found[way_index]
+        self.n_grouped += int(keep.sum())
+        keep &= np.isfinite(distance)
 
+        # sort by group, i.e. (way, direction), and distance
+        group = way_index[keep] * 2 + direction[keep]
+        d = distance[keep]
+        order = np.lexsort((d, group))
+        group, d = group[order], d[order]
+        if len(group) == 0:
+            return
+
+        limit = np.array([w.d_limit if w is not None else np.nan for w in way_statistics])[group // 2]
+        bins = np.rint(d / WayStatistics.histogram_resolution).astype(np.int64)
+
+        is_start = np.r_[True, group[1:] != group[:-1]]
+        starts = np.flatnonzero(is_start)
+        ends = np.r_[starts[1:], len(group)]
+        n = ends - starts
+        total = np.add.reduceat(d, starts)
+        n_lt_limit = np.add.reduceat((d < limit).astype(np.int64), starts)
+
+        # runs of equal histogram bins within each group
+        bin_starts = np.flatnonzero(is_start | np.r_[True, bins[1:] != bins[:-1]])
+        bin_counts = np.diff(np.r_[bin_starts, len(bins)])
+        bin_group = np.searchsorted(starts, bin_starts, side="right") - 1
+        bin_ranges = np.searchsorted(bin_group, np.arange(len(starts) + 1))
+
+        for j, start in enumerate(starts.tolist()):
+            g = int(group[start])
+            histogram = dict(zip(bins[bin_starts[bin_ranges[j]:bin_ranges[j + 1]]].tolist(),
+                                 bin_counts[bin_ranges[j]:bin_ranges[j + 1]].tolist()))
+            way_statistics[g // 2].add_aggregate(g % 2, int(n[j]), float(total[j]), float(d[start]),
+                                                 int(n_lt_limit[j]), int(n[j] - n_lt_limit[j]), histogram)
+
+    @timed()
     def finalize(self):
         log.info("%s samples, %s valid", self.n_samples, self.n_valid)
+        self.write(self.create_features())
+        if self.geometry_cache is not None:
+            self.geometry_cache.save()
+
+    def ensure_way_coverage(self):
+        """
+        Loads the map around ways only known from stored statistics, so their geometry is available.
+        """
+        locations = [way_stats.location for way_stats in self.way_statistics.values()
+                     if way_stats.location is not None and not self.map_source.get_way_by_id(way_stats.way_id)]
+        if locations:
+            self.map_source.ensure_coverage([lat for lat, _ in locations], [lon for _, lon in locations])
+
+    def create_features(self):
+        self.ensure_way_coverage()
+
         features = []
         for way_stats in self.way_statistics.values():
             way_stats.finalize()
@@ -84,7 +216,12 @@ class ExportRoadAnnotation:
                 if way_osm:
                     lateral_offset = 2.0 * direction * (-1 if self.right_hand_traffic else +1)
                     reverse = i == 1
-                    coordinates = way_osm.get_way_coordinates(reverse=reverse, lateral_offset=lateral_offset)
+                    if self.geometry_cache is not None:
+                        coordinates = self.geometry_cache.get_way_coordinates(
+                            way_osm, reverse=reverse, lateral_offset=lateral_offset,
+                            right_hand_traffic=self.right_hand_traffic)
+                    else:
+                        coordinates = way_osm.get_way_coordinates(reverse=reverse, lateral_offset=lateral_offset)
                     # exchange lat and lon
                     coordinates = [(p[1], p[0]) for p in coordinates]
                 else:
@@ -98,7 +235,7 @@ class ExportRoadAnnotation:
                                           "distance_overtaker_n_below_limit": way_stats.n_lt_limit[i],
                                           "distance_overtaker_n_above_limit": way_stats.n_geq_limit[i],
                                           "distance_overtaker_limit": way_stats.d_limit,
-                                          "distance_overtaker_measurements": way_stats.samples[i],
+                                          "distance_overtaker_histogram": way_stats.get_histogram(i),
                                           "zone": way_stats.zone,
                                           "direction": direction,
                                           "name": way_stats.name,
@@ -109,6 +246,9 @@ class ExportRoadAnnotation:
 
                 features.append(feature)
 
+        return features
+
+    def write(self, features):
         data = {"type": "FeatureCollection",
                 "features": features}
 
@@ -119,9 +259,18 @@ class ExportRoadAnnotation:
 
 
 class WayStatistics:
-    def __init__(self, way_id, way):
-        self.samples = [[], []]
+    # resolution of the distance histogram in meters, which matches the resolution of the sensor
+    histogram_resolution = 0.01
+
+    def __init__(self, way_id, way=None):
+        """
+        Aggregates the overtaking distances measured on a way, separately for both directions. Only count, sum,
+        minimum, limit counts and a histogram of the distances are kept, so statistics of different sets of
+        measurements can be merged and persisted.
+        """
         self.n = [0, 0]
+        self.sum = [0.0, 0.0]
+        self.histogram = [{}, {}]
         self.n_lt_limit = [0, 0]
         self.n_geq_limit = [0, 0]
 
@@ -135,7 +284,10 @@ class WayStatistics:
         self.oneway = False
         self.name = "unknown"
 
-        tags = way.tags
+        # a point of the way, to load the map around it when the statistics are restored
+        self.location = [float(x) for x in way.points_lat_lon[0]] if way is not None else None
+
+        tags = way.tags if way is not None else {}
         if "zone:traffic" in tags:
             zone = tags["zone:traffic"]
             if zone == "DE:urban":
@@ -157,18 +309,88 @@ class WayStatistics:
     def add_sample(self, sample, orientation):
         if np.isfinite(sample):
             i = 1 if orientation == -1 else 0
-            self.samples[i].append(sample)
+            if self.n[i] == 0 or sample < self.d_minimum[i]:
+                self.d_minimum[i] = sample
+            self.n[i] += 1
+            self.sum[i] += sample
+            k = int(round(sample / self.histogram_resolution))
+            self.histogram[i][k] = self.histogram[i].get(k, 0) + 1
+            if self.d_limit is not None:
+                if sample < self.d_limit:
+                    self.n_lt_limit[i] += 1
+                else:
+                    self.n_geq_limit[i] += 1
+        return self
+
+    def add_aggregate(self, i, n, total, minimum, n_lt_limit, n_geq_limit, histogram):
+        """
+        Adds n samples for direction i, given by their sum, minimum, limit counts and histogram.
+        """
+        if n == 0:
+            return self
+        if self.n[i] == 0 or minimum < self.d_minimum[i]:
+            self.d_minimum[i] = minimum
+        self.n[i] += n
+        self.sum[i] += total
+        for k, count in histogram.items():
+            self.histogram[i][k] = self.histogram[i].get(k, 0) + count
+        self.n_lt_limit[i] += n_lt_limit
+        self.n_geq_limit[i] += n_geq_limit
+        return self
+
+    def merge(self, other):
+        for i in range(2):
+            self.add_aggregate(i, other.n[i], other.sum[i], other.d_minimum[i], other.n_lt_limit[i],
+                               other.n_geq_limit[i], other.histogram[i])
         return self
 
+    def get_histogram(self, i):
+        """
+        Returns the distances measured in direction i as sorted list of [distance, count] pairs.
+        """
+        return [[k * self.histogram_resolution, count] for k, count in sorted(self.histogram[i].items())]
+
     def finalize(self):
         for i in range(2):
-            samples = np.array(self.samples[i])
-            if len(samples) > 0:
-                self.n[i] = len(samples)
-                self.d_mean[i] = np.mean(samples)
-                self.d_median[i] = np.median(samples)
-                self.d_minimum[i] = np.min(samples)
-                if self.d_limit is not None:
-                    self.n_lt_limit[i] = int((samples < self.d_limit).sum())
-                    self.n_geq_limit[i] = int((samples >= self.d_limit).sum())
+            n = self.n[i]
+            if n > 0:
+                self.d_mean[i] = self.sum[i] / n
+
+                # the median is the mean of the two middle values (which coincide for odd n)
+                keys = sorted(self.histogram[i])
+                cumulative = np.cumsum([self.histogram[i][k] for k in keys])
+                k_lower = keys[np.searchsorted(cumulative, (n - 1) // 2, side="right")]
+                k_upper = keys[np.searchsorted(cumulative, n // 2, side="right")]
+                self.d_median[i] = 0.5 * (k_lower + k_upper) * self.histogram_resolution
+
                 self.valid[i] = True
+
+    def to_dict(self):
+        return {"way_id": self.way_id,
+                "zone": self.zone,
+                "oneway": self.oneway,
+                "name": self.name,
+                "location": self.location,
+                "d_limit": self.d_limit,
+                "n": self.n,
+                "sum": self.sum,
+                "minimum": self.d_minimum,
+                "n_lt_limit": self.n_lt_limit,
+                "n_geq_limit": self.n_geq_limit,
+                "histogram": [sorted(h.items()) for h in self.histogram]}
+
+    @staticmethod
+    def from_dict(data):
+        way_stats = WayStatistics(data["way_id"])
+        way_stats.zone = data["zone"]
+        way_stats.oneway = data["oneway"]
+        way_stats.name = data["name"]
+        way_stats.location = data.get("location")
+        way_stats.d_limit = data["d_limit"]
+        way_stats.n = data["n"]
+        way_stats.sum = data["sum"]
+        way_stats.d_minimum = data["minimum"]
+        way_stats.n_lt_limit = data["n_lt_limit"]
+        way_stats.n_geq_limit = data["n_geq_limit"]
+        way_stats.histogram = [{k: count for k, count in h} for h in data["histogram"]]
+        return way_stats
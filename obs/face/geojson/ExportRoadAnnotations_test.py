@@ -0,0 +1,115 @@
+import json
+import os
+
+import numpy as np
+
+from obs.face.benchmark.SyntheticData import SyntheticRoadNetwork
+from obs.face.osm import DataSource
+from .ExportRoadAnnotations import ExportRoadAnnotation, WayStatistics
+
+
+class Way:
+    def __init__(self, tags):
+        self.tags = tags
+        self.points_lat_lon = np.array([[48.78, 9.18], [48.79, 9.18]])
+
+
+class MapSource:
+    def ensure_coverage(self, lat, lon):
+        pass
+
+    def get_way_by_id(self, way_id):
+        return Way({"zone:traffic": "DE:rural" if way_id % 2 else "DE:urban"}) if way_id != 3 else None
+
+
+def make_way_statistics(samples, orientation=1):
+    way_stats = WayStatistics(42, Way({"zone:traffic": "DE:urban", "name": "Hauptstraße"}))
+    for sample in samples:
+        way_stats.add_sample(sample, orientation)
+    return way_stats
+
+
+def test_statistics():
+    samples = [1.23, 0.85, 2.1, 1.5, 1.49, float("nan"), 0.85]
+    way_stats = make_way_statistics(samples)
+    way_stats.finalize()
+
+    finite = np.array([s for s in samples if np.isfinite(s)])
+    assert way_stats.valid == [True, False]
+    assert way_stats.n[0] == len(finite)
+    assert np.isclose(way_stats.d_mean[0], np.mean(finite))
+    assert np.isclose(way_stats.d_median[0], np.median(finite))
+    assert way_stats.d_minimum[0] == 0.85
+    assert way_stats.n_lt_limit[0] == 4 and way_stats.n_geq_limit[0] == 2
+    assert np.allclose(way_stats.get_histogram(0), [[0.85, 2], [1.23, 1], [1.49, 1], [1.5, 1], [2.1, 1]])
+
+    # odd number of samples
+    way_stats = make_way_statistics(finite[:5])
+    way_stats.finalize()
+    assert np.isclose(way_stats.d_median[0], np.median(finite[:5]))
+
+
+def test_merge_and_persist():
+    samples = [1.23, 0.85, 2.1, 1.5, 1.49, 0.85, 3.0]
+    expected = make_way_statistics(samples)
+    expected.add_sample(1.1, -1)
+    expected.finalize()
+
+    a = make_way_statistics(samples[:3])
+    b = make_way_statistics(samples[3:])
+    b.add_sample(1.1, -1)
+    merged = WayStatistics.from_dict(json.loads(json.dumps(a.to_dict()))).merge(b)
+    merged.finalize()
+
+    assert merged.zone == "urban" and merged.name == "Hauptstraße"
+    for attribute in ["n", "valid", "d_median", "d_minimum", "n_lt_limit", "n_geq_limit"]:
+        assert getattr(merged, attribute) == getattr(expected, attribute)
+    assert np.allclose(merged.d_mean, expected.d_mean)
+    assert merged.get_histogram(0) == expected.get_histogram(0)
+
+
+def test_add_columns():
+    rng = np.random.default_rng(0)
+    way_id = rng.integers(0, 10, 1000)
+    orientation = rng.choice([-1, 0, 1], 1000)
+    distance = rng.integers(30, 300, 1000) / 100.0
+    distance[::50] = np.nan
+
+    exporter = ExportRoadAnnotation("roads.json", MapSource())
+    exporter.add_columns(way_id, orientation, distance)
+
+    # compare to adding the samples one by one
+    expected = {}
+    for w, o, d in zip(way_id.tolist(), orientation.tolist(), distance.tolist()):
+        if w != 3:
+            if w not in expected:
+                expected[w] = WayStatistics(w, MapSource().get_way_by_id(w))
+            expected[w].add_sample(d, o)
+
+    assert exporter.way_statistics.keys() == expected.keys()
+    for w, way_stats in exporter.way_statistics.items():
+        data, data_expected = way_stats.to_dict(), expected[w].to_dict()
+        assert np.allclose(data.pop("sum"), data_expected.pop("sum"))
+        assert data == data_expected
+
+
+def test_reload_statistics(tmp_path):
+    network = SyntheticRoadNetwork(n_streets=4)
+    cache_dir = os.path.join(str(tmp_path), "cache")
+    network.write_tile_cache(cache_dir)
+    nodes = network.nodes.values()
+    data_source = DataSource(cache_dir=cache_dir)
+    data_source.ensure_coverage([n["lat"] for n in nodes], [n["lon"] for n in nodes])
+
+    way_ids = sorted(network.ways)[:3]
+    exporter = ExportRoadAnnotation(os.path.join(str(tmp_path), "roads.json"), data_source)
+    exporter.add_columns(way_ids, [1, -1, 1], [1.2, 1.7, 0.9])
+    filename = os.path.join(str(tmp_path), "statistics.json")
+    exporter.save_statistics(filename)
+
+    # without any new measurements, the map is only loaded for the stored ways
+    exporter = ExportRoadAnnotation(os.path.join(str(tmp_path), "roads.json"), DataSource(cache_dir=cache_dir))
+    exporter.load_statistics(filename)
+    features = exporter.create_features()
+    assert sorted({f["properties"]["way_id"] for f in features}) == way_ids
+    assert all(len(f["geometry"]["coordinates"]) >= 2 for f in features)
@@ -0,0 +1,424 @@
+# Copyright (C) 2020-2021 OpenBikeSensor Contributors
+# Contact: https://openbikesensor.org
+#
+# This file is part of the OpenBikeSensor Scripts Collection.
+#
+# The OpenBikeSensor Scripts Collection is free software: you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public License as
+# published by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# The OpenBikeSensor Scripts Collection is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Lesser
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with the OpenBikeSensor Scripts Collection.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+import json
+import logging
+import math
+import os
+import struct
+
+import numpy as np
+
+from .ExportMeasurements import ExportMeasurements
+from .ExportRoadAnnotations import ExportRoadAnnotation
+
+log = logging.getLogger(__name__)
+
+# geometry types and commands of the Mapbox Vector Tile specification, version 2.1
+# https://github.com/mapbox/vector-tile-spec/tree/master/2.1
+MVT_POINT = 1
+MVT_LINESTRING = 2
+
+MVT_MOVE_TO = 1
+MVT_LINE_TO = 2
+
+
+def encode_varint(v):
+    out = bytearray()
+    while True:
+        b = v & 0x7f
+        v >>= 7
+        if v:
+            out.append(b | 0x80)
+        else:
+            out.append(b)
+            return bytes(out)
+
+
+def encode_zigzag(v):
+    return (v << 1) if v >= 0 else ((-v) << 1) - 1
+
+
+def encode_field_varint(field, v):
+    return encode_varint(field << 3) + encode_varint(v)
+
+
+def encode_field_bytes(field, b):
+    return encode_varint((field << 3) | 2) + encode_varint(len(b)) + b
+
+
+def encode_field_double(field, v):
+    return encode_varint((field << 3) | 1) + struct.pack('<d', v)
+
+
+def encode_field_packed(field, values):
+    return encode_field_bytes(field, b''.join(encode_varint(v) for v in values))
+
+
+def encode_value(v):
+    if isinstance(v, bool):
+        return encode_field_varint(7, int(v))
+    elif isinstance(v, int):
+        return encode_field_varint(6, encode_zigzag(v))
+    elif isinstance(v, float):
+        return encode_field_double(3, v)
+    else:
+        return encode_field_bytes(1, str(v).encode('utf-8'))
+
+
+def to_tile_value(v):
+    # MVT only knows scalar values, so everything else is stored as JSON string
+    if isinstance(v, np.generic):
+        v = v.item()
+    if isinstance(v, (list, tuple, dict, np.ndarray)):
+        v = json.dumps(v.tolist() if isinstance(v, np.ndarray) else v)
+    return v
+
+
+def encode_geometry(geometry_type, parts):
+    """
+    Encodes a list of parts, each an integer array of shape (n, 2) in tile coordinates, as MVT command sequence. For
+    points, each part holds a single point.
+    """
+    commands = []
+    cx, cy = 0, 0
+    if geometry_type == MVT_POINT:
+        commands.append(MVT_MOVE_TO | (len(parts) << 3))
+        for part in parts:
+            x, y = int(part[0][0]), int(part[0][1])
+            commands += [encode_zigzag(x - cx), encode_zigzag(y - cy)]
+            cx, cy = x, y
+    else:
+        for part in parts:
+            for i, (x, y) in enumerate(part.tolist()):
+                if i == 0:
+                    commands.append(MVT_MOVE_TO | (1 << 3))
+                elif i == 1:
+                    commands.append(MVT_LINE_TO | ((len(part) - 1) << 3))
+                commands += [encode_zigzag(x - cx), encode_zigzag(y - cy)]
+                cx, cy = x, y
+    return commands
+
+
+def encode_layer(name, features, extent):
+    keys = {}
+    values = {}
+    encoded_features = []
+    for geometry_type, parts, properties in features:
+        tags = []
+        for key, value in properties.items():
+            value = to_tile_value(value)
+            if value is None:
+                continue
+            key_ix = keys.setdefault(key, len(keys))
+            value_ix = values.setdefault((type(value), value), len(values))
+            tags += [key_ix, value_ix]
+
+        feature = encode_field_packed(2, tags) + encode_field_varint(3, geometry_type) \
+            + encode_field_packed(4, encode_geometry(geometry_type, parts))
+        encoded_features.append(encode_field_bytes(2, feature))
+
+    layer = encode_field_varint(15, 2) + encode_field_bytes(1, name.encode('utf-8')) + b''.join(encoded_features) \
+        + b''.join(encode_field_bytes(3, key.encode('utf-8')) for key in keys) \
+        + b''.join(encode_field_bytes(4, encode_value(value)) for _, value in values) \
+        + encode_field_varint(5, extent)
+
+    # a tile consisting of this single layer
+    return encode_field_bytes(3, layer)
+
+
+def lonlat_to_mercator(lon, lat):
+    # normalized web mercator coordinates, (0, 0) is the north-west corner of the world
+    lon = np.asarray(lon, dtype=float)
+    lat = np.clip(np.asarray(lat, dtype=float), -85.0511, +85.0511)
+    x = (lon + 180.0) / 360.0
+    y = (1.0 - np.arcsinh(np.tan(np.radians(lat))) / math.pi) / 2.0
+    return x, y
+
+
+def clip_line(points, a, b):
+    """
+    Clips a polyline (array of shape (n, 2)) to the axis-aligned box [a, b] and returns the list of parts inside.
+    """
+    if np.all(points >= a) and np.all(points <= b):
+        return [points]
+
+    parts = []
+    part = []
+    for p, q in zip(points[:-1], points[1:]):
+        # Liang-Barsky line clipping
+        d = q - p
+        t0, t1 = 0.0, 1.0
+        inside = True
+        for k in range(2):
+            for denominator, numerator in ((-d[k], p[k] - a[k]), (d[k], b[k] - p[k])):
+                if denominator == 0:
+                    if numerator < 0:
+                        inside = False
+                else:
+                    t = numerator / denominator
+                    if denominator < 0:
+                        t0 = max(t0, t)
+                    else:
+                        t1 = min(t1, t)
+        if not inside or t0 > t1:
+            if part:
+                parts.append(np.array(part))
+                part = []
+            continue
+
+        start, end = p + t0 * d, p + t1 * d
+        if not part or np.any(part[-1] != start):
+            if part:
+                parts.append(np.array(part))
+            part = [start]
+        part.append(end)
+
+        if t1 < 1.0:
+            parts.append(np.array(part))
+            part = []
+
+    if part:
+        parts.append(np.array(part))
+    return parts
+
+
+def simplify_line(points, tolerance):
+    """
+    Douglas-Peucker simplification of a polyline given as array of shape (n, 2).
+    """
+    n = len(points)
+    if n <= 2:
+        return points
+
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+    while stack:
+        i, j = stack.pop()
+        if j <= i + 1:
+            continue
+        p, q = points[i], points[j]
+        d = q - p
+        dd = np.inner(d, d)
+        c = points[i + 1:j] - p
+        if dd > 0:
+            dist = np.abs(c[:, 0] * d[1] - c[:, 1] * d[0]) / math.sqrt(dd)
+        else:
+            dist = np.hypot(c[:, 0], c[:, 1])
+        k = int(np.argmax(dist))
+        if dist[k] > tolerance:
+            k += i + 1
+            keep[k] = True
+            stack += [(i, k), (k, j)]
+
+    return points[keep]
+
+
+class VectorTilePyramid:
+    def __init__(self, path, layer_name, zoom_min=0, zoom_max=14, cluster_zoom_max=None, cluster_size=64,
+                 aggregate=None, extent=4096, buffer=64, tolerance=8):
+        """
+        Collects point and line features and writes them as Mapbox Vector Tiles to path/z/x/y.pbf, for all zoom levels
+        from zoom_min to zoom_max. Lines are clipped to each tile (plus buffer) and simplified with the given tolerance,
+        measured in tile units (extent per tile), so coarser zoom levels get coarser geometries.
+
+        Up to zoom level cluster_zoom_max, points are clustered on a grid of cluster_size tile units. Each cluster is
+        written as a single point with the number of points and, for the aggregate property, its mean and minimum.
+        """
+        self.path = path
+        self.layer_name = layer_name
+        self.zoom_min = zoom_min
+        self.zoom_max = zoom_max
+        self.cluster_zoom_max = cluster_zoom_max if cluster_zoom_max is not None else zoom_min - 1
+        self.cluster_size = cluster_size
+        self.aggregate = aggregate
+        self.extent = extent
+        self.buffer = buffer
+        self.tolerance = tolerance
+
+        self.points_lon = []
+        self.points_lat = []
+        self.points_properties = []
+
+        self.lines = []
+        self.lines_properties = []
+
+        self.n_tiles = 0
+
+    def add_feature(self, feature):
+        geometry = feature["geometry"]
+        if geometry["type"] == "Point":
+            lon, lat = geometry["coordinates"]
+            self.points_lon.append(lon)
+            self.points_lat.append(lat)
+            self.points_properties.append(feature["properties"])
+        elif geometry["type"] == "LineString":
+            if len(geometry["coordinates"]) < 2:
+                return
+            self.lines.append(np.array(geometry["coordinates"], dtype=float))
+            self.lines_properties.append(feature["properties"])
+        else:
+            raise ValueError("unsupported geometry type " + geometry["type"])
+
+    def get_bounds(self):
+        lon = list(self.points_lon)
+        lat = list(self.points_lat)
+        for line in self.lines:
+            lon += [line[:, 0].min(), line[:, 0].max()]
+            lat += [line[:, 1].min(), line[:, 1].max()]
+        if not lon:
+            return None
+        return [float(min(lon)), float(min(lat)), float(max(lon)), float(max(lat))]
+
+    def write(self):
+        os.makedirs(self.path, exist_ok=True)
+
+        points_x, points_y = lonlat_to_mercator(self.points_lon, self.points_lat)
+        lines_xy = [np.stack(lonlat_to_mercator(line[:, 0], line[:, 1]), axis=1) for line in self.lines]
+
+        for zoom in range(self.zoom_min, self.zoom_max + 1):
+            tiles = {}
+            scale = (2 ** zoom) * self.extent
+            if zoom <= self.cluster_zoom_max:
+                x, y, properties = self.cluster_points(points_x * scale, points_y * scale)
+            else:
+                x, y, properties = points_x * scale, points_y * scale, self.points_properties
+            self.add_points_to_tiles(tiles, x, y, properties)
+
+            for line, line_properties in zip(lines_xy, self.lines_properties):
+                self.add_line_to_tiles(tiles, line * scale, line_properties)
+
+            self.write_tiles(zoom, tiles)
+
+        metadata = {
+            "name": self.layer_name,
+            "format": "pbf",
+            "minzoom": self.zoom_min,
+            "maxzoom": self.zoom_max,
+            "bounds": self.get_bounds(),
+            "tiles": ["{z}/{x}/{y}.pbf"],
+        }
+        with open(os.path.join(self.path, "metadata.json"), 'w') as f:
+            json.dump(metadata, f)
+
+        log.info("wrote %s vector tiles to %s", self.n_tiles, self.path)
+
+    def cluster_points(self, x, y):
+        if len(x) == 0:
+            return x, y, []
+
+        cx = np.floor(x / self.cluster_size).astype(np.int64)
+        cy = np.floor(y / self.cluster_size).astype(np.int64)
+        _, cluster, count = np.unique(cx * (np.int64(1) << 32) + cy, return_inverse=True, return_counts=True)
+        cluster = cluster.ravel()
+
+        x_cluster = np.bincount(cluster, weights=x) / count
+        y_cluster = np.bincount(cluster, weights=y) / count
+        properties = [{"point_count": int(n)} for n in count]
+
+        if self.aggregate is not None:
+            values = np.array([p.get(self.aggregate) for p in self.points_properties], dtype=float)
+            valid = np.isfinite(values)
+            n_valid = np.bincount(cluster[valid], minlength=len(count))
+            total = np.bincount(cluster[valid], weights=values[valid], minlength=len(count))
+            minimum = np.full(len(count), np.inf)
+            np.minimum.at(minimum, cluster[valid], values[valid])
+            for i, p in enumerate(properties):
+                if n_valid[i] > 0:
+                    p[self.aggregate + "_mean"] = float(total[i] / n_valid[i])
+                    p[self.aggregate + "_minimum"] = float(minimum[i])
+
+        return x_cluster, y_cluster, properties
+
+    def add_points_to_tiles(self, tiles, x, y, properties):
+        e = self.extent
+        # points within the buffer of a neighbouring tile are added to that tile as well
+        ix = np.arange(len(x))
+        tx = np.concatenate([np.floor((x + dx) / e) for dx in (-self.buffer, +self.buffer) for _ in range(2)])
+        ty = np.concatenate([np.floor((y + dy) / e) for _ in range(2) for dy in (-self.buffer, +self.buffer)])
+        tile_point = np.unique(np.stack((tx.astype(np.int64), ty.astype(np.int64), np.tile(ix, 4)), axis=1), axis=0)
+
+        for tx_i, ty_i, i in tile_point.tolist():
+            p = np.array([[round(x[i] - tx_i * e), round(y[i] - ty_i * e)]], dtype=np.int64)
+            tiles.setdefault((tx_i, ty_i), []).append((MVT_POINT, [p], properties[i]))
+
+    def add_line_to_tiles(self, tiles, line, properties):
+        e = self.extent
+        b = self.buffer
+        tx_min, ty_min = np.floor((line.min(axis=0) - b) / e).astype(np.int64)
+        tx_max, ty_max = np.floor((line.max(axis=0) + b) / e).astype(np.int64)
+        for tx in range(int(tx_min), int(tx_max) + 1):
+            for ty in range(int(ty_min), int(ty_max) + 1):
+                origin = np.array([tx * e, ty * e], dtype=float)
+                parts = []
+                for part in clip_line(line - origin, np.array([-b, -b]), np.array([e + b, e + b])):
+                    part = np.round(simplify_line(part, self.tolerance)).astype(np.int64)
+                    # remove duplicate consecutive points after rounding
+                    if len(part) > 1:
+                        part = part[np.concatenate(([True], np.any(np.diff(part, axis=0) != 0, axis=1)))]
+                    if len(part) >= 2:
+                        parts.append(part)
+                if parts:
+                    tiles.setdefault((tx, ty), []).append((MVT_LINESTRING, parts, properties))
+
+    def write_tiles(self, zoom, tiles):
+        n = 2 ** zoom
+        for (tx, ty), features in tiles.items():
+            if not (0 <= tx < n and 0 <= ty < n):
+                continue
+            filename = os.path.join(self.path, str(zoom), str(tx), str(ty) + ".pbf")
+            os.makedirs(os.path.dirname(filename), exist_ok=True)
+            with open(filename, 'wb') as f:
+                f.write(encode_layer(self.layer_name, features, self.extent))
+            self.n_tiles += 1
+
+
+class ExportMeasurementTiles(ExportMeasurements):
+    def __init__(self, path, do_filter=True, properties=None, zoom_min=8, zoom_max=16, cluster_zoom_max=13):
+        """
+        Writes the measurements as pyramid of vector tiles (layer "measurements") instead of one GeoJSON file. Up to
+        zoom level cluster_zoom_max, nearby measurements are aggregated into clusters.
+        """
+        super().__init__(path, do_filter=do_filter, properties=properties)
+        self.pyramid = VectorTilePyramid(path, "measurements", zoom_min=zoom_min, zoom_max=zoom_max,
+                                         cluster_zoom_max=cluster_zoom_max, aggregate="distance_overtaker")
+
+    def open(self):
+        pass
+
+    def write_feature(self, feature):
+        self.pyramid.add_feature(feature)
+
+    def close(self):
+        self.pyramid.write()
+
+
+class ExportRoadAnnotationTiles(ExportRoadAnnotation):
+    def __init__(self, path, map_source, right_hand_traffic=True, geometry_cache=None, zoom_min=8, zoom_max=16):
+        """
+        Writes the road annotations as pyramid of vector tiles (layer "roads") instead of one GeoJSON file.
+        """
+        super().__init__(path, map_source, right_hand_traffic=right_hand_traffic, geometry_cache=geometry_cache)
+        self.pyramid = VectorTilePyramid(path, "roads", zoom_min=zoom_min, zoom_max=zoom_max)
+
+    def write(self, features):
+        for feature in features:
+            self.pyramid.add_feature(feature)
+        self.pyramid.write()
@@ -0,0 +1,52 @@
+import json
+import os
+
+import numpy as np
+
+from .ExportVectorTiles import encode_varint, encode_zigzag, clip_line, simplify_line, VectorTilePyramid
+
+
+def test_encode_varint():
+    assert encode_varint(1) == b"\x01"
+    assert encode_varint(300) == b"\xac\x02"
+    assert [encode_zigzag(v) for v in (0, -1, 1, -2)] == [0, 1, 2, 3]
+
+
+def test_clip_line():
+    line = np.array([[-1.0, 0.5], [0.5, 0.5], [0.5, 2.0]])
+    parts = clip_line(line, np.array([0.0, 0.0]), np.array([1.0, 1.0]))
+    assert len(parts) == 1
+    assert np.allclose(parts[0], [[0.0, 0.5], [0.5, 0.5], [0.5, 1.0]])
+
+    # a line leaving and re-entering the box is split
+    line = np.array([[0.5, 0.5], [2.0, 0.5], [2.0, 0.8], [0.5, 0.8]])
+    parts = clip_line(line, np.array([0.0, 0.0]), np.array([1.0, 1.0]))
+    assert len(parts) == 2
+
+
+def test_simplify_line():
+    line = np.array([[0.0, 0.0], [1.0, 0.1], [2.0, -0.1], [3.0, 5.0], [4.0, 0.0]])
+    assert np.array_equal(simplify_line(line, 1.0), line[[0, 2, 3, 4]])
+
+
+def test_pyramid(tmp_path):
+    path = str(tmp_path)
+    pyramid = VectorTilePyramid(path, "measurements", zoom_min=10, zoom_max=12, cluster_zoom_max=10,
+                                aggregate="distance_overtaker")
+    for i in range(10):
+        pyramid.add_feature({"type": "Feature",
+                             "geometry": {"type": "Point", "coordinates": [9.18 + i * 1e-5, 48.78]},
+                             "properties": {"distance_overtaker": 1.0 + i * 0.1}})
+    pyramid.write()
+
+    with open(os.path.join(path, "metadata.json")) as f:
+        metadata = json.load(f)
+    assert metadata["minzoom"] == 10 and metadata["maxzoom"] == 12
+    assert metadata["bounds"] == [9.18, 48.78, 9.18009, 48.78]
+
+    # the web mercator tile containing the points
+    for zoom in range(10, 13):
+        n = 2 ** zoom
+        x = int((9.18 + 180.0) / 360.0 * n)
+        y = int((1.0 - np.arcsinh(np.tan(np.radians(48.78))) / np.pi) / 2.0 * n)
+        assert os.path.isfile(os.path.join(path, str(zoom), str(x), "{}.pbf".format(y)))
@@ -18,4 +18,7 @@
 # <http://www.gnu.org/licenses/>.
 
 from .ExportMeasurements import ExportMeasurements
+from .ExportMeasurementBins import ExportMeasurementBins
+from .ExportMeasurementsBinary import ExportMeasurementsBinary
 from .ExportRoadAnnotations import ExportRoadAnnotation, WayStatistics
+from .ExportVectorTiles import ExportMeasurementTiles, ExportRoadAnnotationTiles, VectorTilePyramid
@@ -0,0 +1,100 @@
+# Copyright (C) 2020-2021 OpenBikeSensor Contributors
+# Contact: https://openbikesensor.org
+#
+# This file is part of the OpenBikeSensor Scripts Collection.
+#
+# The OpenBikeSensor Scripts Collection is free software: you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public License as
+# published by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# The OpenBikeSensor Scripts Collection is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Lesser
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with the OpenBikeSensor Scripts Collection.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+import bisect
+import datetime
+import logging
+import math
+
+import pytz
+
+log = logging.getLogger(__name__)
+
+
+class TimezoneResolver:
+    """
+    Resolves the timezone at a position and time. The polygon lookup is done once per grid cell of cell_size degrees,
+    and the resulting timezone is reused as long as its UTC offset does not change. The timezone polygons are only
+    loaded when the first lookup is required.
+    """
+
+    def __init__(self, cell_size=0.01, lookup=None):
+        self.cell_size = cell_size
+        self.lookup_function = lookup
+
+        self.names = {}
+        self.windows = {}
+        self.n_lookups = 0
+
+    def lookup(self, lat, lon):
+        if self.lookup_function is None:
+            log.debug("loading timezone polygons")
+            from tzwhere import tzwhere
+            self.lookup_function = tzwhere.tzwhere(forceTZ=False).tzNameAt
+
+        self.n_lookups += 1
+        return self.lookup_function(lat, lon)
+
+    def get_timezone_name(self, lat, lon):
+        cell = (math.floor(lat / self.cell_size), math.floor(lon / self.cell_size))
+        try:
+            return self.names[cell]
+        except KeyError:
+            name = self.names[cell] = self.lookup(lat, lon)
+            return name
+
+    def get_timezone(self, name, t):
+        """
+        Returns a fixed-offset datetime.timezone for the timezone name, with its UTC offset at the time t.
+        """
+        t_utc = t.astimezone(pytz.utc).replace(tzinfo=None)
+
+        window = self.windows.get(name)
+        if window is None or not window[0] <= t_utc < window[1]:
+            window = self.windows[name] = get_offset_window(name, t_utc)
+
+        return window[2]
+
+    def get_timezone_at(self, lat, lon, t):
+        """
+        Returns the timezone at (lat, lon) and time t, or None if no timezone is known for this position.
+        """
+        name = self.get_timezone_name(lat, lon)
+        return self.get_timezone(name, t) if name is not None else None
+
+
+def get_offset_window(name, t_utc):
+    """
+    Returns the interval [start, end) of naive UTC times around t_utc in which the UTC offset of the timezone name is
+    constant, and this offset as datetime.timezone.
+    """
+    tz = pytz.timezone(name)
+    offset = pytz.utc.localize(t_utc).astimezone(tz).utcoffset()
+
+    start, end = datetime.datetime.min, datetime.datetime.max
+    transitions = getattr(tz, "_utc_transition_times", None)
+    if transitions:
+        i = bisect.bisect_right(transitions, t_utc)
+        if i > 0:
+            start = transitions[i - 1]
+        if i < len(transitions):
+            end = transitions[i]
+
+    # a datetime.timezone, as pytz.timezone objects cannot be exported using jsons
+    return start, end, datetime.timezone(offset, name=name)
@@ -0,0 +1,46 @@
+import datetime
+from os.path import join
+
+import pytz
+
+from .TimezoneResolver import TimezoneResolver
+from .obscsv import ImportMeasurementsCsv
+
+
+def lookup_europe(lat, lon):
+    return "Europe/Berlin" if lat > 0 else None
+
+
+def test_cell_cache():
+    resolver = TimezoneResolver(lookup=lookup_europe)
+    t = datetime.datetime(2021, 6, 1, 12, 0, tzinfo=pytz.utc)
+    for i in range(100):
+        assert resolver.get_timezone_at(48.7801 + i * 1e-5, 9.1801, t).utcoffset(None) == datetime.timedelta(hours=2)
+    assert resolver.n_lookups == 1
+
+    assert resolver.get_timezone_at(-10.0, 9.18, t) is None
+    assert resolver.n_lookups == 2
+
+
+def test_daylight_saving_time():
+    resolver = TimezoneResolver(lookup=lookup_europe)
+    # the clocks in Berlin were set forward at 2021-03-28 01:00 UTC
+    t = datetime.datetime(2021, 3, 28, 0, 59, 59, tzinfo=pytz.utc)
+    assert resolver.get_timezone("Europe/Berlin", t).utcoffset(None) == datetime.timedelta(hours=1)
+    t += datetime.timedelta(seconds=1)
+    assert resolver.get_timezone("Europe/Berlin", t).utcoffset(None) == datetime.timedelta(hours=2)
+
+    start, end, _ = resolver.windows["Europe/Berlin"]
+    assert start == datetime.datetime(2021, 3, 28, 1, 0)
+    assert end == datetime.datetime(2021, 10, 31, 1, 0)
+
+
+def test_import(test_data_dir):
+    importer = ImportMeasurementsCsv(correct_timezone=True)
+    importer.timezone_resolver.lookup_function = lookup_europe
+    measurements, _ = importer.read(join(test_data_dir, 'gps-time.csv'), user_id="dummy", dataset_id="dummy")
+
+    t = measurements[0]["time"]
+    assert t.utcoffset() == datetime.timedelta(hours=2)
+    assert t == datetime.datetime(2021, 6, 26, 14, 39, 21, tzinfo=pytz.utc)
+    assert importer.timezone_resolver.n_lookups == 1
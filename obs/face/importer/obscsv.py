@@ -18,7 +18,6 @@
 # <http://www.gnu.org/licenses/>.
 
 import csv
-import pytz
 import datetime
 import math
 import gzip
@@ -27,14 +26,13 @@ import logging
 import textwrap
 
 import numpy as np
-from tzwhere import tzwhere
-from haversine import haversine, Unit
-import gpstime
+from haversine import haversine_vector, Unit
 
 module_log = logging.getLogger(__name__)
 
 
-from obs.face.mapping import AzimuthalEquidistant as LocalMap
+from obs.face.mapping import AzimuthalEquidistant as LocalMap, transfer_to_local_tangents
+from obs.face.instrumentation import instrumentation, timed
 
 # A magic number. When using timestamps as an intermediate format, we have to
 # subtract this, because GPS time timestamps' epoch start at some point in
@@ -42,6 +40,10 @@ from obs.face.mapping import AzimuthalEquidistant as LocalMap
 GPS_UNIX_EPOCH_OFFSET = 315964800
 
 def convert_gps_to_utc(dt):
+    # gpstime loads the leap second table on import, so only import it for files in GPS time
+    import gpstime
+    import pytz
+
     return datetime.datetime.fromtimestamp(gpstime.gps2unix(dt.timestamp() - GPS_UNIX_EPOCH_OFFSET), tz=pytz.UTC)
 
 class ImportMeasurementsCsv:
@@ -67,14 +69,17 @@ class ImportMeasurementsCsv:
                                      }
 
         if self.correct_timezone:
-            self.timezone_lookup = tzwhere.tzwhere(forceTZ=False)
+            from .TimezoneResolver import TimezoneResolver
+            self.timezone_resolver = TimezoneResolver()
 
+    @timed()
     def read(self, filename, user_id="unknown", dataset_id="unknown", log=module_log):
         log.debug("Importing: %s", filename)
 
         measurements, metadata = self.read_csv(filename, user_id, dataset_id, log)
         n = len(measurements)
         log.debug("read %s measurements", len(measurements))
+        instrumentation.count("measurements_imported", n)
 
         self.correct_gps_time(measurements, metadata)
 
@@ -188,162 +193,131 @@ class ImportMeasurementsCsv:
             lat = m["latitude"]
             lon = m["longitude"]
             if all(v is not None for v in [t, lat, lon]):
-                timezone_name = self.timezone_lookup.tzNameAt(lat, lon)
-                if timezone_name is None:
+                timezone = self.timezone_resolver.get_timezone_at(lat, lon, t)
+                if timezone is None:
                     # no timezone is found, keep UTC
                     log.error("ERROR: no timezone found for coordinates (%s, %s) in %s", lat, lon, m["measurement_id"])
                 else:
-                    timezone = pytz.timezone(timezone_name)
-                    # this timezone conversion is required, as the pytz.timezone object could not be
-                    # exported using jsons
-                    timezone2 = datetime.timezone(timezone.utcoffset(t.replace(tzinfo=None)),
-                                                  name=timezone_name)
                     # now correct the timezone
-                    m["time"] = t.astimezone(timezone2)
+                    m["time"] = t.astimezone(timezone)
 
     def derive_velocity(self, measurements, log):
         n = len(measurements)
-        l = 3  # filter window ssize must be odd
-        a = (l - 1) // 2
-        p = [(False, 0, 0)] * l
-        t_prev = None
-        n_valid = 0
 
-        n_speed_derived = 0
-        n_direction_derived = 0
-        n_derived = 0
-
-        for i in range(-a, n):
-            j = i + a
-            if j < n:
-                m = measurements[j]
-                t_j = m["time"]
-                lat_j = m["latitude"]
-                lon_j = m["longitude"]
-                if lat_j is None or lon_j is None:
-                    t_j = None
-                valid = t_prev is not None and t_j is not None and (t_j - t_prev == datetime.timedelta(seconds=1))
-
-                p_j = (valid, m["latitude"], m["longitude"])
-            else:
-                p_j = (False, 0, 0)
-                t_j = None
-
-            # remove oldest element
-            n_valid -= p[0][0]
-            p.pop(0)
-
-            # add newest element
-            p.append(p_j)
-            n_valid += p_j[0]
-
-            # keep track of old time
-            t_prev = t_j
-            # p now holds elements i-a to i+a
-
-            # write filter results
-            if i >= 0:
-                # check validity
-                if n_valid == l and (measurements[i]["course"] is None or measurements[i]["speed"] is None):
-                    # all elements are valid
-                    # transfer to a local map around middle element
-                    xy, local_map = self.to_local_tangent(p)
-                    # approximate derivative vector
-                    v = 0.5 * (xy[2] - xy[0])
-                    # compute compass direction
-                    if measurements[i]["course"] is None:
-                        measurements[i]["course"] = local_map.get_local_direction(v)
-                        n_direction_derived += 1
-                    if measurements[i]["speed"] is None:
-                        measurements[i]["speed"] = np.linalg.norm(v)
-                        n_speed_derived += 1
-                    n_derived += 1
-                    measurements[i]["egomotion_is_derived"] = True
-                else:
-                    measurements[i]["egomotion_is_derived"] = False
+        # time stamps in integer microseconds, and a mask of samples with valid time and position
+        has_position = np.array([m["time"] is not None and m["latitude"] is not None and m["longitude"] is not None
+                                 for m in measurements], dtype=bool)
+        t = np.array([round(m["time"].timestamp() * 1e6) if has_position[j] else 0
+                      for j, m in enumerate(measurements)], dtype=np.int64)
+        lat = np.array([m["latitude"] if has_position[j] else np.nan for j, m in enumerate(measurements)], dtype=float)
+        lon = np.array([m["longitude"] if has_position[j] else np.nan for j, m in enumerate(measurements)], dtype=float)
+
+        # a sample is valid if it has a position and follows a sample with position exactly one second before
+        valid = np.zeros(n, dtype=bool)
+        valid[1:] = has_position[1:] & has_position[:-1] & (np.diff(t) == 1000000)
+
+        # the filter window (size 3) around a sample must only contain valid elements
+        window_valid = np.zeros(n, dtype=bool)
+        window_valid[1:-1] = valid[:-2] & valid[1:-1] & valid[2:]
+
+        course_missing = np.array([m["course"] is None for m in measurements], dtype=bool)
+        speed_missing = np.array([m["speed"] is None for m in measurements], dtype=bool)
+        derive = window_valid & (course_missing | speed_missing)
+        ix = np.flatnonzero(derive)
+
+        # transfer neighbours to a local map around each middle element, and approximate the derivative vector
+        xy_prev = transfer_to_local_tangents(lat[ix], lon[ix], lat[ix - 1], lon[ix - 1])
+        xy_next = transfer_to_local_tangents(lat[ix], lon[ix], lat[ix + 1], lon[ix + 1])
+        v = 0.5 * (xy_next - xy_prev)
+        course = LocalMap.get_local_direction(v).tolist()
+        speed = np.hypot(v[0], v[1]).tolist()
+
+        for m in measurements:
+            m["egomotion_is_derived"] = False
+
+        for k, i in enumerate(ix.tolist()):
+            m = measurements[i]
+            if course_missing[i]:
+                m["course"] = course[k]
+            if speed_missing[i]:
+                m["speed"] = speed[k]
+            m["egomotion_is_derived"] = True
+
+        n_derived = len(ix)
+        n_direction_derived = int(course_missing[ix].sum())
+        n_speed_derived = int(speed_missing[ix].sum())
         log.info("%s measurements processed, derived values for %s measurements (speed: %s, course: %s)", len(measurements), n_derived, n_speed_derived, n_direction_derived)
 
     @staticmethod
-    def to_local_tangent(p):
-        c = (len(p) - 1) // 2
-        local_map = LocalMap(p[c][1], p[c][2])
-        r = [local_map.transfer_to(q[1], q[2]) for q in p]
-        return r, local_map
+    def compute_segments(measurements):
+        """
+        Splits the valid measurements (with time and position) into continuous segments. The track is considered
+        broken if
+        - there is a gap of 60s or more
+        - the average speed is larger than 100 km/h
+        - the time step is small (near 0), and the distance is larger than 100 km/h * 1s
+
+        Returns a list with one entry per segment, holding the (inclusive) indices of its first and last
+        measurement, the number of valid measurements, its duration in seconds and its length in meters.
+        """
+        ix = [i for i, m in enumerate(measurements)
+              if m["longitude"] is not None and m["latitude"] is not None and m["time"] is not None]
+        if not ix:
+            return []
+
+        # time stamps in integer microseconds, so durations are exact
+        t = np.array([round(measurements[i]["time"].timestamp() * 1e6) for i in ix], dtype=np.int64)
+        p = np.array([[measurements[i]["latitude"], measurements[i]["longitude"]] for i in ix])
+
+        dt = np.diff(t) * 1e-6
+        dp = haversine_vector(p[:-1], p[1:], Unit.METERS) if len(ix) > 1 else np.zeros(0)
+
+        is_break = (dt >= 60) | ((dt >= 0.5) & (dp >= np.abs(dt * 100.0/3.6))) | ((dt <= 0.5) & (dp >= 100/3.6))
+
+        # distance covered when reaching each point, zero at the start of a segment
+        d = np.zeros(len(ix))
+        d[1:] = np.where(is_break, 0.0, dp)
+
+        starts = np.concatenate(([0], np.flatnonzero(is_break) + 1))
+        ends = np.concatenate((starts[1:] - 1, [len(ix) - 1]))
+
+        durations = (np.maximum.reduceat(t, starts) - np.minimum.reduceat(t, starts)) * 1e-6
+        distances = np.add.reduceat(d, starts)
+
+        ix = np.array(ix)
+        segments = [{
+            "index_start": int(ix[a]),
+            "index_end": int(ix[b]),
+            "n": int(b - a + 1),
+            "t": float(duration),
+            "d": float(distance),
+        } for a, b, duration, distance in zip(starts, ends, durations, distances)]
+
+        return segments
 
     @staticmethod
     def compute_statistics(measurements):
-        n = 0
+        n = len(measurements)
         n_valid = 0
         n_confirmed = 0
-        t_min = None
-        t_max = None
-        t_cont = 0
-        t_cont_min = None
-        t_cont_max = None
-        d_cont = 0
-        n_cont = 0
-
-        t_prev = None
-        p_prev = None
-
         for m in measurements:
             valid = m["longitude"] is not None and m["latitude"] is not None and m["time"] is not None
-            confirmed = valid and (m["confirmed"] is True)
-            n += 1
             n_valid += valid
-            n_confirmed += confirmed
-
-            # time
-            t = m["time"]
-            if t is not None:
-                # overall minimum and maximum
-                if t_min is None or t < t_min:
-                    t_min = t
-                if t_max is None or t > t_max:
-                    t_max = t
-
-            # continuous and valid segments
-            if valid:
-                p = [m["latitude"], m["longitude"]]
-                # also find continuous trajectories
-                if t_prev is not None and p_prev is not None:
-                    dt = t - t_prev
-                    dt = dt.total_seconds()
-
-                    dp = haversine(p, p_prev, unit=Unit.METERS)
-
-                    # consider the track broken if:
-                    # - there is a gap of more than 10s
-                    # - the average speed is larger than 100 km/h
-                    # - the time step is small (near 0), and the distance is largen than 100 km/h * 1s
-                    if dt >= 60 or (dt >= 0.5 and dp >= abs(dt * 100.0/3.6)) or (dt <= 0.5 and dp >= 100/3.6):
-                        if t_cont_min is not None and t_cont_max is not None:
-                            dt = t_cont_max - t_cont_min
-                            t_cont += dt.total_seconds()
-                        t_cont_min = None
-                        t_cont_max = None
-                        n_cont += 1
-                    else:
-                        d_cont += dp
-
-                    if t_cont_min is None or t < t_cont_min:
-                        t_cont_min = t
-                    if t_cont_max is None or t > t_cont_max:
-                        t_cont_max = t
-
-                t_prev = t
-                p_prev = p
-
-        if t_min is not None and t_max is not None:
-            t_total = t_max - t_min
-            t_total = t_total.total_seconds()
-            n_cont += 1
+            n_confirmed += valid and (m["confirmed"] is True)
+
+        # overall minimum and maximum time
+        times = [m["time"] for m in measurements if m["time"] is not None]
+        if times:
+            t_min = min(times)
+            t_max = max(times)
+            t_total = (t_max - t_min).total_seconds()
         else:
+            t_min = None
+            t_max = None
             t_total = 0
 
-        if t_cont_min is not None and t_cont_max is not None:
-            dt = t_cont_max - t_cont_min
-            t_cont += dt.total_seconds()
+        # continuous and valid segments
+        segments = ImportMeasurementsCsv.compute_segments(measurements)
 
         stats = {
             "n_files": 1,
@@ -353,9 +327,10 @@ class ImportMeasurementsCsv:
             "t_min": t_min,
             "t_max": t_max,
             "t_total": t_total,
-            "n_segments": n_cont,
-            "t": t_cont,
-            "d": d_cont
+            "n_segments": len(segments),
+            "t": sum(segment["t"] for segment in segments),
+            "d": sum(segment["d"] for segment in segments),
+            "segments": segments,
         }
         return stats
 
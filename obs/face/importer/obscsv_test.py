@@ -1,6 +1,8 @@
+import logging
+import pytest
 import pytz
 from os.path import join
-from datetime import datetime
+from datetime import datetime, timedelta
 
 from .obscsv import ImportMeasurementsCsv
 
@@ -28,3 +30,49 @@ def test_read_gzipped(test_data_dir):
         dataset_id="dummy",
     )
     assert len(measurements) == 1
+
+def test_derive_velocity():
+    t0 = datetime(2021, 6, 26, 14, 0, 0, tzinfo=pytz.UTC)
+    seconds = [0, 1, 2, 3, 5, 6, 7, 8]
+    measurements = [{
+        "time": t0 + timedelta(seconds=s),
+        "latitude": 48.0,
+        "longitude": 9.0 + 1e-4 * s,
+        "course": None,
+        "speed": 3.0 if s == 7 else None,
+    } for s in seconds]
+
+    ImportMeasurementsCsv().derive_velocity(measurements, logging.getLogger())
+
+    # only samples with a complete 1s-spaced window around them are derived
+    derived = [m["egomotion_is_derived"] for m in measurements]
+    assert derived == [False, False, True, False, False, False, True, False]
+
+    # moving east at about 7.4 m/s
+    assert abs(measurements[2]["course"]) < 1e-3
+    assert measurements[2]["speed"] == pytest.approx(7.43, abs=0.01)
+
+    # existing values are kept
+    assert measurements[6]["speed"] == 3.0
+    assert abs(measurements[6]["course"]) < 1e-3
+
+def test_compute_statistics_segments():
+    t0 = datetime(2021, 6, 26, 14, 0, 0, tzinfo=pytz.UTC)
+    # two continuous segments, separated by a gap of 2 minutes, and one sample without position
+    seconds = [0, 1, 2, 3, 123, 124, 125]
+    measurements = [{
+        "time": t0 + timedelta(seconds=s),
+        "latitude": None if s == 2 else 48.0,
+        "longitude": 9.0 + 1e-4 * s,
+        "confirmed": True,
+    } for s in seconds]
+
+    stats = ImportMeasurementsCsv.compute_statistics(measurements)
+
+    assert stats["n_valid"] == 6
+    assert stats["n_segments"] == 2
+    assert [(s["index_start"], s["index_end"], s["n"]) for s in stats["segments"]] == [(0, 3, 3), (4, 6, 3)]
+    assert [s["t"] for s in stats["segments"]] == [3.0, 2.0]
+    assert stats["t"] == 5.0
+    assert stats["segments"][0]["d"] == pytest.approx(3 * 7.44, abs=0.05)
+    assert stats["d"] == pytest.approx(5 * 7.44, abs=0.05)
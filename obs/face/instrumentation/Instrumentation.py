@@ -0,0 +1,183 @@
+# Copyright (C) 2020-2021 OpenBikeSensor Contributors
+# Contact: https://openbikesensor.org
+#
+# This file is part of the OpenBikeSensor Scripts Collection.
+#
+# The OpenBikeSensor Scripts Collection is free software: you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public License as
+# published by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# The OpenBikeSensor Scripts Collection is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Lesser
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with the OpenBikeSensor Scripts Collection.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+import contextlib
+import functools
+import inspect
+import logging
+import time
+
+log = logging.getLogger(__name__)
+
+
+class Instrumentation:
+    """
+    Timers and counters for the processing stages. While disabled, timers are no-ops. The state of worker processes
+    can be collected with pop_state() and merged into the main process with merge().
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.timers = {}
+        self.counters = {}
+        self._null_timer = contextlib.nullcontext()
+
+    def enable(self, enabled=True):
+        self.enabled = enabled
+
+    def reset(self):
+        self.timers = {}
+        self.counters = {}
+
+    def timer(self, name):
+        """
+        Returns a context manager which adds the time spent inside to the timer name. Timers may be nested, so their
+        times do not add up to the total time.
+        """
+        if not self.enabled:
+            return self._null_timer
+        return _Timer(self, name)
+
+    def add_time(self, name, seconds, calls=1):
+        timer = self.timers.get(name)
+        if timer is None:
+            self.timers[name] = [calls, seconds]
+        else:
+            timer[0] += calls
+            timer[1] += seconds
+
+    def count(self, name, n=1):
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def get_state(self):
+        return {
+            "timers": {name: {"calls": calls, "seconds": seconds} for name, (calls, seconds) in self.timers.items()},
+            "counters": dict(self.counters),
+        }
+
+    def pop_state(self):
+        """
+        Returns the current state and resets it, or None if disabled.
+        """
+        if not self.enabled:
+            return None
+        state = self.get_state()
+        self.reset()
+        return state
+
+    def merge(self, state):
+        for name, timer in state["timers"].items():
+            self.add_time(name, timer["seconds"], timer["calls"])
+        for name, n in state["counters"].items():
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def get_summary(self):
+        lines = ["{:48s} {:>10s} {:>12s} {:>12s}".format("timer", "calls", "total [s]", "mean [ms]")]
+        for name, (calls, seconds) in sorted(self.timers.items(), key=lambda t: -t[1][1]):
+            lines.append("{:48s} {:10d} {:12.3f} {:12.3f}".format(name, calls, seconds, 1e3 * seconds / calls))
+
+        if self.counters:
+            lines.append("")
+            lines.append("{:48s} {:>10s}".format("counter", "value"))
+            for name, n in sorted(self.counters.items()):
+                lines.append("{:48s} {:10d}".format(name, n))
+
+        return "\n".join(lines)
+
+
+class _Timer:
+    __slots__ = ("instrumentation", "name", "t")
+
+    def __init__(self, instrumentation_, name):
+        self.instrumentation = instrumentation_
+        self.name = name
+        self.t = None
+
+    def __enter__(self):
+        self.t = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.instrumentation.add_time(self.name, time.perf_counter() - self.t)
+        return False
+
+
+# the instrumentation of this process
+instrumentation = Instrumentation()
+
+
+def timed(name=None):
+    """
+    Decorator which times each call of the function, using the qualified function name if no name is given. Methods
+    are labelled by the class of the instance, so methods inherited by several classes are timed separately. For
+    generator functions, the time spent inside the generator until it is exhausted or closed counts as one call,
+    excluding the time the consumer spends between items.
+    """
+    def decorator(f):
+        if name is None and next(iter(inspect.signature(f).parameters), None) == "self":
+            labels = {}
+
+            def get_label(args):
+                cls = type(args[0])
+                label_ = labels.get(cls)
+                if label_ is None:
+                    label_ = labels[cls] = cls.__name__ + "." + f.__name__
+                return label_
+        else:
+            label = name or f.__qualname__
+
+            def get_label(args):
+                return label
+
+        if inspect.isgeneratorfunction(f):
+            @functools.wraps(f)
+            def generator_wrapper(*args, **kwargs):
+                if not instrumentation.enabled:
+                    yield from f(*args, **kwargs)
+                    return
+
+                generator = f(*args, **kwargs)
+                seconds = 0.0
+                try:
+                    while True:
+                        t = time.perf_counter()
+                        try:
+                            item = next(generator)
+                        except StopIteration:
+                            return
+                        finally:
+                            seconds += time.perf_counter() - t
+                        yield item
+                finally:
+                    generator.close()
+                    instrumentation.add_time(get_label(args), seconds)
+
+            return generator_wrapper
+
+        @functools.wraps(f)
+        def wrapper(*args, **kwargs):
+            if not instrumentation.enabled:
+                return f(*args, **kwargs)
+            with _Timer(instrumentation, get_label(args)):
+                return f(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,84 @@
+from .Instrumentation import Instrumentation, instrumentation, timed
+
+
+@timed()
+def square(x):
+    return x * x
+
+
+@timed()
+def squares(n):
+    for x in range(n):
+        yield x * x
+
+
+class Exporter:
+    @timed()
+    def add(self, x):
+        return x
+
+
+class BinaryExporter(Exporter):
+    pass
+
+
+def test_disabled():
+    instrumentation.reset()
+    assert square(3) == 9
+    instrumentation.count("calls")
+    assert instrumentation.pop_state() is None
+    assert instrumentation.timers == {} and instrumentation.counters == {}
+
+
+def test_merge():
+    instrumentation.reset()
+    instrumentation.enable()
+    try:
+        square(2)
+        square(3)
+        instrumentation.count("items", 5)
+        state = instrumentation.pop_state()
+    finally:
+        instrumentation.enable(False)
+
+    assert state["timers"]["square"]["calls"] == 2
+    assert state["counters"] == {"items": 5}
+    assert instrumentation.timers == {}
+
+    # e.g. the states of two worker processes
+    total = Instrumentation()
+    total.merge(state)
+    total.merge(state)
+    assert total.get_state()["timers"]["square"]["calls"] == 4
+    assert total.get_state()["counters"] == {"items": 10}
+    assert "square" in total.get_summary()
+
+
+def test_timed_generator():
+    instrumentation.reset()
+    instrumentation.enable()
+    try:
+        assert list(squares(4)) == [0, 1, 4, 9]
+        assert next(squares(4)) == 0
+        state = instrumentation.pop_state()
+    finally:
+        instrumentation.enable(False)
+
+    # also a generator which is not exhausted counts once it is closed
+    assert state["timers"]["squares"]["calls"] == 2
+
+
+def test_timed_method():
+    instrumentation.reset()
+    instrumentation.enable()
+    try:
+        Exporter().add(1)
+        BinaryExporter().add(1)
+        BinaryExporter().add(2)
+        state = instrumentation.pop_state()
+    finally:
+        instrumentation.enable(False)
+
+    # inherited methods are labelled by the class of the instance
+    assert state["timers"]["Exporter.add"]["calls"] == 1
+    assert state["timers"]["BinaryExporter.add"]["calls"] == 2
@@ -0,0 +1,167 @@
+# Copyright (C) 2020-2021 OpenBikeSensor Contributors
+# Contact: https://openbikesensor.org
+#
+# This file is part of the OpenBikeSensor Scripts Collection.
+#
+# The OpenBikeSensor Scripts Collection is free software: you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public License as
+# published by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# The OpenBikeSensor Scripts Collection is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Lesser
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with the OpenBikeSensor Scripts Collection.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+import collections
+import cProfile
+import logging
+import os
+import pstats
+import sys
+import threading
+
+log = logging.getLogger(__name__)
+
+
+class SamplingProfiler:
+    """
+    Samples the stack of the thread which enabled it from a background thread, at a fixed interval. The samples are
+    written as folded stacks, as read by flamegraph.pl or speedscope. Its overhead does not depend on the number of
+    function calls, so it is suited for long runs.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self.thread_id = None
+        self.thread = None
+        self.stop = threading.Event()
+
+    def enable(self):
+        self.thread_id = threading.get_ident()
+        self.stop.clear()
+        self.thread = threading.Thread(target=self.sample, daemon=True)
+        self.thread.start()
+
+    def disable(self):
+        self.stop.set()
+        self.thread.join()
+
+    def sample(self):
+        while not self.stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.stacks[self.fold(frame)] += 1
+
+    @staticmethod
+    def fold(frame):
+        labels = []
+        while frame is not None:
+            code = frame.f_code
+            labels.append("{} ({}:{})".format(code.co_name, os.path.basename(code.co_filename), code.co_firstlineno))
+            frame = frame.f_back
+        return ";".join(reversed(labels))
+
+    def dump_stats(self, filename):
+        with open(filename, 'w') as f:
+            for stack, n in self.stacks.most_common():
+                f.write("{} {}\n".format(stack, n))
+
+
+class DatasetProfiler:
+    """
+    Profiles the processing of single datasets, either deterministically with cProfile or by sampling, and writes
+    one profile per dataset to directory.
+    """
+
+    def __init__(self, directory, sampling=False, interval=0.005):
+        self.directory = directory
+        self.sampling = sampling
+        self.interval = interval
+        self.extension = ".folded" if sampling else ".prof"
+        self.filenames = []
+
+    def get_filename(self, name):
+        return os.path.join(self.directory, "datasets", name + self.extension)
+
+    def create_profiler(self):
+        return SamplingProfiler(self.interval) if self.sampling else cProfile.Profile()
+
+    def profile(self, name, function, *args, **kwargs):
+        profiler = self.create_profiler()
+        profiler.enable()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            profiler.disable()
+
+            filename = self.get_filename(name)
+            os.makedirs(os.path.dirname(filename), exist_ok=True)
+            profiler.dump_stats(filename)
+            self.filenames.append(filename)
+
+    def merge(self, filenames, filename):
+        """
+        Merges the given profiles into a single profile, written to filename.
+        """
+        if not filenames:
+            return
+
+        os.makedirs(os.path.dirname(os.path.abspath(filename)), exist_ok=True)
+        if self.sampling:
+            stacks = collections.Counter()
+            for f in filenames:
+                stacks.update(read_folded_stacks(f))
+            with open(filename, 'w') as f:
+                for stack, n in stacks.most_common():
+                    f.write("{} {}\n".format(stack, n))
+        else:
+            stats = pstats.Stats(*filenames)
+            stats.dump_stats(filename)
+
+    def get_total_time(self, filename):
+        if self.sampling:
+            return sum(read_folded_stacks(filename).values()) * self.interval
+        return pstats.Stats(filename).total_tt
+
+    def find_profiles(self, newer_than=None):
+        """
+        Returns all dataset profiles in the directory, optionally only those written after the time newer_than.
+        """
+        filenames = []
+        for root, _, files in os.walk(os.path.join(self.directory, "datasets")):
+            for f in files:
+                filename = os.path.join(root, f)
+                if f.endswith(self.extension) and (newer_than is None or os.path.getmtime(filename) >= newer_than):
+                    filenames.append(filename)
+        return sorted(filenames)
+
+    def write_summary(self, newer_than=None, n_slowest=10):
+        """
+        Merges all dataset profiles into a profile of the whole run, and logs the slowest datasets.
+        """
+        filenames = self.find_profiles(newer_than)
+        filename_merged = os.path.join(self.directory, "all" + self.extension)
+        self.merge(filenames, filename_merged)
+        log.info("merged %s dataset profiles into %s", len(filenames), filename_merged)
+
+        times = sorted(((self.get_total_time(f), f) for f in filenames), reverse=True)
+        if times:
+            log.info("slowest datasets:")
+        for t, f in times[:n_slowest]:
+            log.info("%10.3fs  %s", t, os.path.relpath(f, os.path.join(self.directory, "datasets")))
+
+
+def read_folded_stacks(filename):
+    stacks = collections.Counter()
+    with open(filename) as f:
+        for line in f:
+            stack, _, n = line.rstrip("\n").rpartition(" ")
+            if stack:
+                stacks[stack] += int(n)
+    return stacks
@@ -0,0 +1,31 @@
+import os
+import time
+
+import pytest
+
+from .Profiler import DatasetProfiler, read_folded_stacks
+
+
+def busy_loop(seconds):
+    t = time.perf_counter() + seconds
+    while time.perf_counter() < t:
+        pass
+    return 42
+
+
+@pytest.mark.parametrize("sampling", [False, True])
+def test_dataset_profiler(tmp_path, sampling):
+    directory = str(tmp_path)
+    profiler = DatasetProfiler(directory, sampling=sampling, interval=0.001)
+    assert profiler.profile("user/track1", busy_loop, 0.08) == 42
+    assert profiler.profile("user/track2", busy_loop, 0.02) == 42
+
+    assert profiler.find_profiles() == profiler.filenames
+    profiler.write_summary()
+
+    filename = os.path.join(directory, "all" + profiler.extension)
+    assert os.path.isfile(filename)
+    if sampling:
+        stacks = read_folded_stacks(filename)
+        assert any(stack.split(";")[-1].startswith("busy_loop") for stack in stacks)
+    assert profiler.get_total_time(profiler.filenames[0]) > profiler.get_total_time(profiler.filenames[1])
@@ -31,19 +31,19 @@ class LocalMapTangential:
     def transfer_to(self, lat, lon):
         # transfer to a new taqngential coordinate system
         # first coordinate points to east, second to north
+        # lat and lon may be scalars or arrays of the same shape as the origin
         x = self.latlon2xyz(lat, lon)
 
-        x = np.array(x)
-        dx = x - self.x0
-        x_north = np.inner(self.n0_north, dx)
-        x_east = np.inner(self.n0_east, dx)
+        dx = [x[k] - self.x0[k] for k in range(3)]
+        x_north = sum(self.n0_north[k] * dx[k] for k in range(3))
+        x_east = sum(self.n0_east[k] * dx[k] for k in range(3))
 
         return np.array([x_east, x_north])
 
     def transfer_from(self, x):
         x_east = x[0]
         x_north = x[1]
-        xyz = self.x0 + x_east * self.n0_east + x_north * self.n0_north
+        xyz = [self.x0[k] + x_east * self.n0_east[k] + x_north * self.n0_north[k] for k in range(3)]
         lat, lon = self.xyz2latlon(xyz)
         return lat, lon
 
@@ -51,62 +51,63 @@ class LocalMapTangential:
     def get_local_compass_direction(x):
         # x[0] points east, x[1] points north
         # counter-clockwise, radiants, east = 0
-        phi = math.atan2(x[1], x[0])
+        phi = np.arctan2(x[1], x[0])
         # clock-wise, degrees, north = 0
-        phi = 90.0 - math.degrees(phi)
+        phi = 90.0 - np.degrees(phi)
         return phi
 
     @staticmethod
     def get_local_direction(x):
         # x[0] points east, x[1] points north
         # counter-clockwise, radiants, east = 0
-        phi = math.atan2(x[1], x[0])
+        phi = np.arctan2(x[1], x[0])
         return phi
 
     def latlon2xyz(self, lat, lon):
         r = self.r_earth
 
         # degree to radians
-        theta = math.radians(lat)
-        lambda_ = math.radians(lon)
+        theta = np.radians(lat)
+        lambda_ = np.radians(lon)
 
         # sin and cos
-        sin_theta = math.sin(theta)
-        cos_theta = math.cos(theta)
-        sin_lambda = math.sin(lambda_)
-        cos_lambda = math.cos(lambda_)
+        sin_theta = np.sin(theta)
+        cos_theta = np.cos(theta)
+        sin_lambda = np.sin(lambda_)
+        cos_lambda = np.cos(lambda_)
 
         # return r * np.array([cos_theta * cos_lambda, cos_theta * sin_lambda, sin_theta])
         return r*cos_theta * cos_lambda, r * cos_theta * sin_lambda, r * sin_theta
 
     def xyz2latlon(self, xyz):
         r = self.r_earth
-        lat = math.asin(xyz[2] / r)
-        lon = math.atan2(xyz[1], xyz[0])
+        # fix rounding errors
+        lat = np.arcsin(np.clip(xyz[2] / r, -1.0, +1.0))
+        lon = np.arctan2(xyz[1], xyz[0])
 
         # degree to radians
-        lat = math.degrees(lat)
-        lon = math.degrees(lon)
+        lat = np.degrees(lat)
+        lon = np.degrees(lon)
 
         return lat, lon
 
     @staticmethod
     def latlon_tangential(lat, lon):
         # degree to radians
-        theta = math.radians(lat)
-        lambda_ = math.radians(lon)
+        theta = np.radians(lat)
+        lambda_ = np.radians(lon)
 
         # sin and cos
-        sin_theta = math.sin(theta)
-        cos_theta = math.cos(theta)
-        sin_lambda = math.sin(lambda_)
-        cos_lambda = math.cos(lambda_)
+        sin_theta = np.sin(theta)
+        cos_theta = np.cos(theta)
+        sin_lambda = np.sin(lambda_)
+        cos_lambda = np.cos(lambda_)
 
         # the following normalized vectors span the normal plane at x0
         # https://en.wikipedia.org/wiki/Local_tangent_plane_coordinates
         # north, east, down
         n0_north = np.array([-sin_theta * cos_lambda, -sin_theta * sin_lambda, cos_theta])
-        n0_east = np.array([-sin_lambda, + cos_lambda, 0])
+        n0_east = np.array([-sin_lambda, + cos_lambda, np.zeros_like(sin_lambda)])
 
         return n0_east, n0_north
 
@@ -115,19 +116,19 @@ class LocalMapTangential:
         r = self.r_earth
 
         # degree to radians
-        theta = math.radians(lat)
-        lambda_ = math.radians(lon)
+        theta = np.radians(lat)
+        lambda_ = np.radians(lon)
 
         # sin and cos
-        sin_theta = math.sin(theta)
-        cos_theta = math.cos(theta)
-        sin_lambda = math.sin(lambda_)
-        cos_lambda = math.cos(lambda_)
+        sin_theta = np.sin(theta)
+        cos_theta = np.cos(theta)
+        sin_lambda = np.sin(lambda_)
+        cos_lambda = np.cos(lambda_)
 
         xyz = r * np.array([cos_theta * cos_lambda, cos_theta * sin_lambda, sin_theta])
 
         n_north = np.array([-sin_theta * cos_lambda, -sin_theta * sin_lambda, cos_theta])
-        n_east = np.array([-sin_lambda, + cos_lambda, 0])
+        n_east = np.array([-sin_lambda, + cos_lambda, np.zeros_like(sin_lambda)])
 
         return xyz, n_east, n_north
 
@@ -138,51 +139,51 @@ class Gnomonic:
         self.lon_0 = lon_0
 
     def transfer_to(self, lat, lon):
-        lambda_ = math.radians(lon)
-        phi = math.radians(lat)
-        lambda_0 = math.radians(self.lon_0)
-        phi_1 = math.radians(self.lat_0)
+        lambda_ = np.radians(lon)
+        phi = np.radians(lat)
+        lambda_0 = np.radians(self.lon_0)
+        phi_1 = np.radians(self.lat_0)
 
         # https://mathworld.wolfram.com/GnomonicProjection.html
-        cos_c = math.sin(phi_1) * math.sin(phi) + math.cos(phi_1) * math.cos(phi) * math.cos(lambda_ - lambda_0)
+        cos_c = np.sin(phi_1) * np.sin(phi) + np.cos(phi_1) * np.cos(phi) * np.cos(lambda_ - lambda_0)
 
-        x = math.cos(phi) * math.sin(lambda_ - lambda_0) / cos_c
-        y = (math.cos(phi_1) * math.sin(phi) - math.sin(phi_1) * math.cos(phi) * math.cos(lambda_ - lambda_0)) / cos_c
+        x = np.cos(phi) * np.sin(lambda_ - lambda_0) / cos_c
+        y = (np.cos(phi_1) * np.sin(phi) - np.sin(phi_1) * np.cos(phi) * np.cos(lambda_ - lambda_0)) / cos_c
         return np.array([x, y])
 
     def transfer_from(self, xy):
-        x = xy[0]
-        y = xy[1]
-        lambda_0 = math.radians(self.lon_0)
-        phi_1 = math.radians(self.lat_0)
+        x = np.asarray(xy[0], dtype=float)
+        y = np.asarray(xy[1], dtype=float)
+        lambda_0 = np.radians(self.lon_0)
+        phi_1 = np.radians(self.lat_0)
 
         # https: // mathworld.wolfram.com / GnomonicProjection.html
-        rho = math.sqrt(x*x + y*y)
-        c = math.atan(rho)
-        cos_c = math.cos(c)
-        sin_c = math.sin(c)
+        # with sin(c) / rho = cos(c), which stays well-defined at the origin (rho = 0)
+        rho = np.sqrt(x*x + y*y)
+        c = np.arctan(rho)
+        cos_c = np.cos(c)
 
-        phi = math.asin(cos_c * math.sin(phi_1) + y * sin_c * math.cos(phi_1)/rho )
-        lambda_ = lambda_0  + math.atan(x * sin_c / (rho * math.cos(phi_1) * math.cos_c - y * math.sin(phi_1) * sin_c ))
+        phi = np.arcsin(cos_c * np.sin(phi_1) + y * cos_c * np.cos(phi_1))
+        lambda_ = lambda_0 + np.arctan2(x, np.cos(phi_1) - y * np.sin(phi_1))
 
-        lat = math.degrees(phi)
-        lon = math.degrees(lambda_)
+        lat = np.degrees(phi)
+        lon = np.degrees(lambda_)
         return lat, lon
 
     @staticmethod
     def get_local_compass_direction(x):
         # x[0] points east, x[1] points north
         # counter-clockwise, radiants, east = 0
-        phi = math.atan2(x[1], x[0])
+        phi = np.arctan2(x[1], x[0])
         # clock-wise, degrees, north = 0
-        phi = 90.0 - math.degrees(phi)
+        phi = 90.0 - np.degrees(phi)
         return phi
 
     @staticmethod
     def get_local_direction(x):
         # x[0] points east, x[1] points north
         # counter-clockwise, radiants, east = 0
-        phi = math.atan2(x[1], x[0])
+        phi = np.arctan2(x[1], x[0])
         return phi
 
 
@@ -195,63 +196,59 @@ class AzimuthalEquidistant:
         self.lon_0 = lon_0
 
     def transfer_to(self, lat, lon):
-        lambda_ = math.radians(lon)
-        phi = math.radians(lat)
-        lambda_0 = math.radians(self.lon_0)
-        phi_1 = math.radians(self.lat_0)
+        lambda_ = np.radians(lon)
+        phi = np.radians(lat)
+        lambda_0 = np.radians(self.lon_0)
+        phi_1 = np.radians(self.lat_0)
 
         # https://mathworld.wolfram.com/AzimuthalEquidistantProjection.html
-        cos_c = math.sin(phi_1) * math.sin(phi) + math.cos(phi_1) * math.cos(phi) * math.cos(lambda_ - lambda_0)
+        cos_c = np.sin(phi_1) * np.sin(phi) + np.cos(phi_1) * np.cos(phi) * np.cos(lambda_ - lambda_0)
         # fix rounding errors
         cos_c = np.clip(cos_c, -1.0, +1.0)
-        c = math.acos(cos_c)
+        c = np.arccos(cos_c)
 
         # k_prime = c / math.sin(c)
         k_prime = 1 / np.sinc(c / math.pi)
-        x = k_prime * math.cos(phi) * math.sin(lambda_ - lambda_0)
-        y = k_prime * (math.cos(phi_1) * math.sin(phi) - math.sin(phi_1) * math.cos(phi) * math.cos(lambda_ - lambda_0))
+        x = k_prime * np.cos(phi) * np.sin(lambda_ - lambda_0)
+        y = k_prime * (np.cos(phi_1) * np.sin(phi) - np.sin(phi_1) * np.cos(phi) * np.cos(lambda_ - lambda_0))
 
         X = x * self.r_earth
         Y = y * self.r_earth
         return np.array([X, Y])
 
     def transfer_from(self, XY):
-        x = XY[0] / self.r_earth
-        y = XY[1] / self.r_earth
-        lambda_0 = math.radians(self.lon_0)
-        phi_1 = math.radians(self.lat_0)
+        x = np.asarray(XY[0], dtype=float) / self.r_earth
+        y = np.asarray(XY[1], dtype=float) / self.r_earth
+        lambda_0 = np.radians(self.lon_0)
+        phi_1 = np.radians(self.lat_0)
 
         # https://mathworld.wolfram.com/AzimuthalEquidistantProjection.html
-        c = math.sqrt(x*x + y*y)
-        cos_c = math.cos(c)
-
-        phi = math.asin(cos_c * math.sin(phi_1) + y * math.sin(c) * math.cos(phi_1) / c)
-        if phi_1 == +math.pi/2:
-            lambda_ = lambda_0 + math.atan(-x/y)
-        elif phi_1 == -math.pi/2:
-            lambda_ = lambda_0 + math.atan(x/y)
-        else:
-            lambda_ = lambda_0 + math.atan(x * math.sin(c) /
-                                           (c * math.cos(phi_1) * cos_c - y * math.sin(phi_1) * math.sin(c) ))
-
-        lat = math.degrees(phi)
-        lon = math.degrees(lambda_)
+        # sin(c) / c is expressed by sinc, so the origin (c = 0) and the poles need no special treatment
+        c = np.sqrt(x*x + y*y)
+        cos_c = np.cos(c)
+        sin_c_c = np.sinc(c / math.pi)
+
+        phi = np.arcsin(np.clip(cos_c * np.sin(phi_1) + y * sin_c_c * np.cos(phi_1), -1.0, +1.0))
+        lambda_ = lambda_0 + np.arctan2(x * sin_c_c, np.cos(phi_1) * cos_c - y * np.sin(phi_1) * sin_c_c)
+
+        lat = np.degrees(phi)
+        lon = np.degrees(lambda_)
         return lat, lon
 
     @staticmethod
     def get_local_compass_direction(x):
         # x[0] points east, x[1] points north
         # counter-clockwise, radiants, east = 0
-        phi = math.atan2(x[1], x[0])
+        phi = np.arctan2(x[1], x[0])
         # clock-wise, degrees, north = 0
-        phi = 90.0 - math.degrees(phi)
+        phi = 90.0 - np.degrees(phi)
         return phi
 
     @staticmethod
     def get_local_direction(x):
         # x[0] points east, x[1] points north
         # counter-clockwise, radiants, east = 0
-        phi = math.atan2(x[1], x[0])
+        phi = np.arctan2(x[1], x[0])
         return phi
 
 
@@ -265,26 +262,26 @@ class Equirectangular:
         self.lon_0 = lon_0
 
     def transfer_to(self, lat, lon):
-        lambda_ = math.radians(lon)
-        phi = math.radians(lat)
-        lambda_0 = math.radians(self.lon_0)
-        phi_1 = math.radians(self.lat_0)
+        lambda_ = np.radians(lon)
+        phi = np.radians(lat)
+        lambda_0 = np.radians(self.lon_0)
+        phi_1 = np.radians(self.lat_0)
 
-        x = self.r_earth * (lambda_ - lambda_0) * math.cos(phi_1)
+        x = self.r_earth * (lambda_ - lambda_0) * np.cos(phi_1)
         y = self.r_earth * (phi - phi_1)
 
         return x, y
 
     def transfer_from(self, x, y):
-        lambda_0 = math.radians(self.lon_0)
-        phi_0 = math.radians(self.lat_0)
+        lambda_0 = np.radians(self.lon_0)
+        phi_0 = np.radians(self.lat_0)
         phi_1 = phi_0
 
-        lambda_ = x / self.r_earth / math.cos(phi_1) + lambda_0
+        lambda_ = x / self.r_earth / np.cos(phi_1) + lambda_0
         phi = y / self.r_earth + phi_0
 
-        lat = math.degrees(phi)
-        lon = math.degrees(lambda_)
+        lat = np.degrees(phi)
+        lon = np.degrees(lambda_)
         return lat, lon
 
 
@@ -296,7 +293,7 @@ class EquirectangularFast:
         self.lat_a = circumference_earth_per_degree
         self.lat_b = - self.lat_a * lat_0
 
-        self.lon_a = circumference_earth_per_degree * math.cos(math.radians(lat_0))
+        self.lon_a = circumference_earth_per_degree * np.cos(np.radians(lat_0))
         self.lon_b = - self.lon_a * lon_0
 
     def transfer_to(self, lat, lon):
@@ -314,5 +311,16 @@ class EquirectangularFast:
     @staticmethod
     def get_scale_at(lat, lon):
         s_lat = 360.0 / 40000e3
-        s_lon = s_lat / math.cos(math.radians(lat))
+        s_lon = s_lat / np.cos(np.radians(lat))
         return s_lat, s_lon
+
+
+def transfer_to_local_tangents(lat_0, lon_0, lat, lon, projection=AzimuthalEquidistant):
+    """
+    Transfers each point (lat[i], lon[i]) to the local map centered at (lat_0[i], lon_0[i]). All arguments are
+    broadcast against each other, so e.g. the neighbours of every sample of a track can be projected into the local
+    tangent plane around that sample with a single call. Returns an array of shape (2, ...), the first coordinate
+    pointing east, the second north.
+    """
+    local_maps = projection(np.asarray(lat_0, dtype=float), np.asarray(lon_0, dtype=float))
+    return np.asarray(local_maps.transfer_to(np.asarray(lat, dtype=float), np.asarray(lon, dtype=float)))
@@ -0,0 +1,57 @@
+import math
+
+import numpy as np
+import pytest
+
+from .LocalMap import LocalMapTangential, Gnomonic, AzimuthalEquidistant, Equirectangular, EquirectangularFast, \
+    transfer_to_local_tangents
+
+LAT_0, LON_0 = 48.7759, 9.1798
+
+# a few points within some kilometers around the origin, including the origin itself
+LAT = np.array([48.7759, 48.7801, 48.7512, 48.8003, 48.7759])
+LON = np.array([9.1798, 9.1905, 9.1621, 9.2204, 9.1500])
+
+
+@pytest.mark.parametrize("projection", [LocalMapTangential, Gnomonic, AzimuthalEquidistant])
+def test_array_matches_scalar(projection):
+    local_map = projection(LAT_0, LON_0)
+
+    xy = local_map.transfer_to(LAT, LON)
+    assert xy.shape == (2, len(LAT))
+
+    for i in range(len(LAT)):
+        assert np.allclose(xy[:, i], local_map.transfer_to(LAT[i], LON[i]))
+
+
+@pytest.mark.parametrize("projection", [LocalMapTangential, Gnomonic, AzimuthalEquidistant])
+def test_round_trip(projection):
+    local_map = projection(LAT_0, LON_0)
+
+    lat, lon = local_map.transfer_from(local_map.transfer_to(LAT, LON))
+    assert np.allclose(lat, LAT)
+    assert np.allclose(lon, LON)
+
+    # the origin itself must not produce NaNs
+    lat_0, lon_0 = local_map.transfer_from(np.array([0.0, 0.0]))
+    assert math.isclose(lat_0, LAT_0) and math.isclose(lon_0, LON_0)
+
+
+@pytest.mark.parametrize("projection", [Equirectangular, EquirectangularFast])
+def test_round_trip_equirectangular(projection):
+    local_map = projection(LAT_0, LON_0)
+
+    x, y = local_map.transfer_to(LAT, LON)
+    lat, lon = local_map.transfer_from(x, y)
+    assert np.allclose(lat, LAT)
+    assert np.allclose(lon, LON)
+
+
+def test_transfer_to_local_tangents():
+    # project every point into the local map around its predecessor
+    xy = transfer_to_local_tangents(LAT[:-1], LON[:-1], LAT[1:], LON[1:])
+    assert xy.shape == (2, len(LAT) - 1)
+
+    for i in range(len(LAT) - 1):
+        expected = AzimuthalEquidistant(LAT[i], LON[i]).transfer_to(LAT[i + 1], LON[i + 1])
+        assert np.allclose(xy[:, i], expected)
@@ -17,16 +17,30 @@
 # along with the OpenBikeSensor Scripts Collection.  If not, see
 # <http://www.gnu.org/licenses/>.
 
+import collections
 import logging
 import math
 import numpy as np
+
+from obs.face.instrumentation import instrumentation, timed
+from .LocalMap import EquirectangularFast
+
 # from joblib import Memory
 
 
 log = logging.getLogger(__name__)
 
 class Roads:
-    def __init__(self, maps_source, d_max=10.0, d_phi_max=40.0, cache_dir='cache'):
+    def __init__(self, maps_source, d_max=10.0, d_phi_max=40.0, cache_dir='cache', candidate_cache_size=1024,
+                 candidate_cache_cell_size=16.0, candidate_cache_course_bucket=30.0):
+        """
+        Candidate ways are cached for cells of candidate_cache_cell_size meters and course buckets of
+        candidate_cache_course_bucket degrees, so near-duplicate samples, e.g. while waiting at traffic lights, reuse
+        the candidates of the previous ones. Each cell holds all ways which may be within d_max of any point in it, and
+        whose direction may match any course in the bucket; the exact distances are still computed for every sample.
+        Up to candidate_cache_size cells are kept, evicting the least recently used one. A size of 0 disables the
+        cache.
+        """
         self.d_max = d_max
         self.d_phi_max = math.radians(d_phi_max)
 
@@ -34,6 +48,14 @@ class Roads:
 
         self.map_source = maps_source
 
+        self.candidate_cache = collections.OrderedDict()
+        self.candidate_cache_size = candidate_cache_size
+        self.candidate_cache_cell_size = candidate_cache_cell_size
+        self.candidate_cache_course_bucket = math.radians(candidate_cache_course_bucket)
+        self.candidate_cache_n_ways = None
+        self.candidate_cache_hits = 0
+        self.candidate_cache_misses = 0
+
     def __del__(self):
         pass
 
@@ -76,9 +98,14 @@ class Roads:
 
         return way_id, way_orientation, lat_projected, lon_projected, distances
 
+    @timed()
     def find_near(self, lat_lon, course):
         # find candidates, exclude only those which are safe to exclude
-        ways = self.map_source.find_approximate_near_ways(lat_lon, self.d_max)
+        if self.candidate_cache_size > 0 and course is not None and math.isfinite(course):
+            ways = self.find_candidates_cached(lat_lon, course)
+        else:
+            ways = self.map_source.find_approximate_near_ways(lat_lon, self.d_max)
+        instrumentation.count("way_candidates", len(ways))
 
         # then enumerate all candidates an do precise search
         dist_x = []
@@ -93,3 +120,78 @@ class Roads:
             orientation.append(orientation_way)
         return ways, dist_x, lat_lon_projected, dist_dir, orientation
 
+    def find_candidates_cached(self, lat_lon, course):
+        # the cached candidates are outdated as soon as further map tiles were loaded
+        n_ways = len(self.map_source.ways)
+        if n_ways != self.candidate_cache_n_ways:
+            self.candidate_cache.clear()
+            self.candidate_cache_n_ways = n_ways
+
+        lat, lon = lat_lon
+        if not (math.isfinite(lat) and math.isfinite(lon)):
+            return []
+
+        # cells of about cell_size x cell_size meters, and course buckets centered at multiples of the bucket size
+        s_lat, _ = EquirectangularFast.get_scale_at(lat, lon)
+        d_lat = self.candidate_cache_cell_size * s_lat
+        i = math.floor(lat / d_lat)
+        d_lon = d_lat / max(math.cos(math.radians((i + 0.5) * d_lat)), 1e-6)
+        j = math.floor(lon / d_lon)
+        k = round(course / self.candidate_cache_course_bucket) % round(2 * math.pi / self.candidate_cache_course_bucket)
+        key = (i, j, k)
+
+        entry = self.candidate_cache.get(key)
+        if entry is not None:
+            self.candidate_cache.move_to_end(key)
+            self.candidate_cache_hits += 1
+            instrumentation.count("candidate_cache_hits")
+        else:
+            entry = self.query_candidates(i, j, k, d_lat, d_lon)
+            self.candidate_cache[key] = entry
+
+            if len(self.candidate_cache) > self.candidate_cache_size:
+                self.candidate_cache.popitem(last=False)
+
+        # keep only the ways whose bounding box is within d_max of the sample, like the uncached query
+        ways, tol_lat, tol_lon = entry
+        return [way for way in ways if way.a[0] - tol_lat < lat < way.b[0] + tol_lat
+                and way.a[1] - tol_lon < lon < way.b[1] + tol_lon]
+
+    def query_candidates(self, i, j, k, d_lat, d_lon):
+        """
+        Returns the candidates of cell (i, j) and course bucket k, and the tolerance in lat and lon to check a sample
+        against their bounding boxes.
+        """
+        self.candidate_cache_misses += 1
+        instrumentation.count("candidate_cache_misses")
+
+        # query around the cell center, extended such that the result covers the query of any point in the cell
+        center = [(i + 0.5) * d_lat, (j + 0.5) * d_lon]
+        ways = self.map_source.find_approximate_near_ways(center, self.d_max + self.candidate_cache_cell_size)
+
+        # exclude ways which do not match any course in the bucket, in either direction the bicycle may use them
+        tolerance = self.d_phi_max + 0.5 * self.candidate_cache_course_bucket
+        course_center = k * self.candidate_cache_course_bucket
+        ways = [way for way in ways if self.may_match_course(way, course_center, tolerance)]
+
+        tol_lat, tol_lon = EquirectangularFast.get_scale_at(*center)
+        return ways, float(tol_lat * self.d_max), float(tol_lon * self.d_max)
+
+    @staticmethod
+    def may_match_course(way, course, tolerance):
+        # a way usable in both directions is never off by more than 90 degrees
+        if len(way.direction) == 0 or tolerance >= math.pi \
+                or (way.directionality_bicycle == 0 and tolerance >= 0.5 * math.pi):
+            return True
+        if way.directionality_bicycle == +1:
+            d = way.distance_periodic(course, way.direction)
+        elif way.directionality_bicycle == -1:
+            d = way.distance_periodic(course + math.pi, way.direction)
+        else:
+            d = np.minimum(way.distance_periodic(course, way.direction),
+                           way.distance_periodic(course + math.pi, way.direction))
+        return bool(np.any(d <= tolerance))
+
+    def get_candidate_cache_hit_rate(self):
+        n = self.candidate_cache_hits + self.candidate_cache_misses
+        return self.candidate_cache_hits / n if n else None
@@ -0,0 +1,21 @@
+from obs.face.benchmark.SyntheticData import SyntheticRoadNetwork, create_track
+from obs.face.osm import DataSource
+from .Roads import Roads
+
+
+def test_candidate_cache(tmp_path):
+    network = SyntheticRoadNetwork(n_streets=4)
+    network.write_tile_cache(str(tmp_path))
+    samples = create_track(network, 300, stop_probability=1.0, stop_duration=30.0)
+
+    data_source = DataSource(cache_dir=str(tmp_path))
+    data_source.ensure_coverage([s["latitude"] for s in samples], [s["longitude"] for s in samples])
+
+    roads = Roads(data_source, d_max=20.0, d_phi_max=90.0)
+    roads_uncached = Roads(data_source, d_max=20.0, d_phi_max=90.0, candidate_cache_size=0)
+    for sample in samples:
+        assert roads.get_n_closest_ways_oriented(sample, 3) == roads_uncached.get_n_closest_ways_oriented(sample, 3)
+
+    # most samples are stationary, but the GPS noise still moves some of them into neighbouring cells
+    assert roads.get_candidate_cache_hit_rate() > 0.3
+    assert roads_uncached.get_candidate_cache_hit_rate() is None
@@ -17,6 +17,7 @@
 # along with the OpenBikeSensor Scripts Collection.  If not, see
 # <http://www.gnu.org/licenses/>.
 
-from .LocalMap import LocalMapTangential, Gnomonic, AzimuthalEquidistant, Equirectangular, EquirectangularFast
+from .LocalMap import LocalMapTangential, Gnomonic, AzimuthalEquidistant, Equirectangular, EquirectangularFast, \
+    transfer_to_local_tangents
 from .Roads import Roads
 
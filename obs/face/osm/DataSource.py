@@ -20,6 +20,8 @@
 import numpy as np
 import logging
 
+from obs.face.instrumentation import instrumentation, timed
+
 from .TileSource import TileSource
 from .WayContainer import WayContainerAABBTree as WayContainer
 from .Way import Way
@@ -34,7 +36,7 @@ class DataSource:
         self.way_container = WayContainer()
 
         self.loaded_tiles = []
-        self.tile_source = TileSource()
+        self.tile_source = TileSource(cache_dir=cache_dir)
         self.tile_zoom = tile_zoom
 
     def ensure_coverage(self, lat, lon, extend=0.0):
@@ -51,6 +53,7 @@ class DataSource:
     def get_local_map(self):
         return self.local_map
 
+    @timed()
     def add_tile(self, tile):
         # skip if already in tile list
         if tile in self.loaded_tiles:
@@ -71,6 +74,7 @@ class DataSource:
 
         # update tile list
         self.loaded_tiles.append(tile)
+        instrumentation.count("tiles_loaded")
 
     def get_map_center(self):
         lat = np.mean([node["lat"] for node in self.nodes.values()])
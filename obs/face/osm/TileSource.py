@@ -1,4 +1,3 @@
-import requests
 import numpy as np
 import logging
 import math
@@ -32,7 +31,7 @@ class TileSource:
         logging.debug("tile requested: zoom=%d, x=%d, y=%d, filter_id=%s", zoom, x_tile, y_tile, filter_id)
 
         # try to read from cache
-        filename_cache = os.path.join(self.cache_dir, 'TileSource', filter_id, str(zoom), str(x_tile), str(y_tile), 'tile.pickle')
+        filename_cache = self.get_cache_filename(zoom, x_tile, y_tile, filter_id)
         request_tile = True
         if self.use_cache and os.path.isfile(filename_cache):
             logging.debug("loading tile cached in %s", filename_cache)
@@ -65,7 +64,13 @@ class TileSource:
 
         return nodes, ways, relations
 
+    def get_cache_filename(self, zoom, x_tile, y_tile, filter_id="default"):
+        return os.path.join(self.cache_dir, 'TileSource', filter_id, str(zoom), str(x_tile), str(y_tile), 'tile.pickle')
+
     def request_tile(self, zoom, x_tile, y_tile, filter_id="default"):
+        # only needed if the tile is not cached
+        import requests
+
         # construct the query
         parameters = {"bbox": self.get_tile_bounding_box(zoom, x_tile, y_tile)}
         query = self.query_template[filter_id].format(**parameters)
@@ -1,3 +1,4 @@
+import hashlib
 import numpy as np
 import math
 from obs.face.mapping import EquirectangularFast as LocalMap
@@ -99,29 +100,28 @@ class Way:
             c = self.points_xy
 
             # compute normals, pointing to the left
-            n = []
-            for i in range(len(c) - 1):
-                n_i = c[i + 1] - c[i]
-                n_i = n_i / np.linalg.norm(n_i)
-                n_i = np.array([-n_i[1], +n_i[0]])
-                n.append(n_i)
-
-            # move points
-            coordinates = []
-            for i in range(len(c)):
-                # create an average normal for each node
-                n_prev = n[max(0, i - 1)]
-                n_next = n[min(len(n) - 1, i)]
-                n_i = 0.5 * (n_prev + n_next)
-                # make sure it is normalized
-                n_i = n_i / np.linalg.norm(n_i)
-                # then move the point
-                c_i = c[i] + n_i * lateral_offset
-                c_i = self.local_map.transfer_from(c_i[0], c_i[1])
-                coordinates.append([c_i[0], c_i[1]])
+            d = np.diff(c, axis=0)
+            d = d / np.linalg.norm(d, axis=1, keepdims=True)
+            n = np.stack((-d[:, 1], d[:, 0]), axis=1)
+
+            # create an average normal for each node, and make sure it is normalized
+            i = np.arange(len(c))
+            n_i = 0.5 * (n[np.maximum(0, i - 1)] + n[np.minimum(len(n) - 1, i)])
+            n_i = n_i / np.linalg.norm(n_i, axis=1, keepdims=True)
+
+            # then move the points
+            c_i = c + n_i * lateral_offset
+            lat, lon = self.local_map.transfer_from(c_i[:, 0], c_i[:, 1])
+            coordinates = np.stack((lat, lon), axis=1).tolist()
 
         return coordinates
 
+    def get_geometry_hash(self):
+        """
+        Returns a hash of the way's node coordinates, which changes whenever the geometry of the way is edited.
+        """
+        return hashlib.sha1(self.points_lat_lon.tobytes()).hexdigest()
+
     @staticmethod
     def point_line_distance(p0, d, x):
         c = x - p0
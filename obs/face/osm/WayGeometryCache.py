@@ -0,0 +1,75 @@
+# Copyright (C) 2020-2021 OpenBikeSensor Contributors
+# Contact: https://openbikesensor.org
+#
+# This file is part of the OpenBikeSensor Scripts Collection.
+#
+# The OpenBikeSensor Scripts Collection is free software: you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public License as
+# published by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# The OpenBikeSensor Scripts Collection is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Lesser
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with the OpenBikeSensor Scripts Collection.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+import logging
+import os
+import pickle
+
+log = logging.getLogger(__name__)
+
+
+class WayGeometryCache:
+    def __init__(self, cache_dir="cache"):
+        """
+        Caches the laterally offset coordinates of ways, as used for exporting the road visualization, in
+        cache_dir/WayGeometryCache. Entries are keyed by way id and a hash of the way geometry, so edited ways are
+        recomputed automatically. Entries not used since the cache was loaded are dropped when it is saved.
+        """
+        self.filename = os.path.join(cache_dir, "WayGeometryCache", "geometries.pickle")
+        self.geometries = {}
+        self.used = set()
+        self.modified = False
+        self.n_hits = 0
+        self.n_misses = 0
+
+        if os.path.isfile(self.filename):
+            try:
+                with open(self.filename, "rb") as infile:
+                    self.geometries = pickle.load(infile)
+            except (IOError, pickle.UnpicklingError, EOFError) as e:
+                log.warning("loading way geometry cache %s failed: %s", self.filename, str(e))
+
+    def get_way_coordinates(self, way, reverse=False, lateral_offset=0, right_hand_traffic=True):
+        key = (way.way_id, way.get_geometry_hash(), reverse, lateral_offset, right_hand_traffic)
+        coordinates = self.geometries.get(key)
+        self.used.add(key)
+        if coordinates is None:
+            self.n_misses += 1
+            coordinates = way.get_way_coordinates(reverse=reverse, lateral_offset=lateral_offset)
+            self.geometries[key] = coordinates
+            self.modified = True
+        else:
+            self.n_hits += 1
+        return coordinates
+
+    def save(self):
+        log.debug("way geometry cache: %s hits, %s misses", self.n_hits, self.n_misses)
+
+        # drop stale entries, e.g. of ways whose geometry changed, unless the cache was not used at all
+        if self.used and len(self.used) < len(self.geometries):
+            self.geometries = {key: self.geometries[key] for key in self.used}
+            self.modified = True
+
+        if not self.modified:
+            return
+
+        os.makedirs(os.path.dirname(self.filename), exist_ok=True)
+        with open(self.filename, "wb") as outfile:
+            pickle.dump(self.geometries, outfile)
+        self.modified = False
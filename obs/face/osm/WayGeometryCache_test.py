@@ -0,0 +1,37 @@
+from .Way import Way
+from .WayGeometryCache import WayGeometryCache
+
+
+def make_way(lon_offset=0.0):
+    nodes = {1: {"lat": 48.7759, "lon": 9.1798 + lon_offset},
+             2: {"lat": 48.7765, "lon": 9.1810},
+             3: {"lat": 48.7770, "lon": 9.1830}}
+    return Way(42, {"nodes": [1, 2, 3], "tags": {}}, nodes)
+
+
+def test_way_geometry_cache(tmp_path):
+    way = make_way()
+    expected = way.get_way_coordinates(lateral_offset=2.0)
+
+    cache = WayGeometryCache(str(tmp_path))
+    assert cache.get_way_coordinates(way, lateral_offset=2.0) == expected
+    cache.save()
+
+    # a new cache instance loads the stored geometries
+    cache = WayGeometryCache(str(tmp_path))
+    assert cache.get_way_coordinates(way, lateral_offset=2.0) == expected
+    assert cache.n_hits == 1 and cache.n_misses == 0
+
+    # a changed geometry is recomputed
+    way_changed = make_way(lon_offset=0.0001)
+    assert cache.get_way_coordinates(way_changed, lateral_offset=2.0) != expected
+    assert cache.n_misses == 1
+    cache.save()
+
+    # entries not used during a run, like the one of the previous geometry, are dropped when saving
+    cache = WayGeometryCache(str(tmp_path))
+    assert len(cache.geometries) == 2
+    cache.get_way_coordinates(way_changed, lateral_offset=2.0)
+    cache.save()
+    cache = WayGeometryCache(str(tmp_path))
+    assert len(cache.geometries) == 1
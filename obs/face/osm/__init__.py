@@ -18,3 +18,4 @@
 # <http://www.gnu.org/licenses/>.
 
 from .DataSource import DataSource
+from .WayGeometryCache import WayGeometryCache
@@ -15,6 +15,7 @@ setup(
     install_requires=requires,
     entry_points={
         "console_scripts": [
+            "obs-benchmark=obs.bin.obs_benchmark:main",
             "obs-face=obs.bin.obs_face:main",
             "obs-filter-privacy=obs.bin.obs_filter_privacy:main",
             "obs-process-track=obs.bin.obs_process_track:main",
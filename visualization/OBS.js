@@ -244,3 +244,172 @@ palettePercentageZweirat = new Palette(
   },
   [0, 0, 196, 255]
 )
+
+// Loads a pyramid of vector tiles as written by `obs-face -V --vector-tiles`,
+// e.g. from 'tiles/measurements'. Only the tiles in the visible map area are
+// fetched. The layer is passed to onLoad together with the pyramid metadata
+// (zoom range and bounds) once it was added to the map.
+function loadVectorTileLayer(map, path, style, onLoad) {
+  fetch(path + '/metadata.json')
+    .then(function (response) {
+      return response.json()
+    })
+    .then(function (metadata) {
+      var layer = new ol.layer.VectorTile({
+        source: new ol.source.VectorTile({
+          format: new ol.format.MVT(),
+          url: path + '/{z}/{x}/{y}.pbf',
+          tileGrid: ol.tilegrid.createXYZ({ minZoom: metadata.minzoom, maxZoom: metadata.maxzoom }),
+        }),
+        minZoom: metadata.minzoom,
+        style: style,
+      })
+      map.addLayer(layer)
+      onLoad(layer, metadata)
+    })
+}
+
+// Vector tiles are requested by adding `?tiles` to the URL of a visualization.
+function useVectorTiles() {
+  return new URLSearchParams(window.location.search).has('tiles')
+}
+
+// Loads the grid bins written by `obs-face -V --bins`, e.g. from 'bins/measurements'. One layer is added per zoom
+// level of the bins, visible from that zoom level up to the next one, and the last one up to metadata.rawzoom, from
+// where on the individual measurements should be shown. Only the bins of the current zoom level are fetched. The
+// layers are passed to onLoad together with the metadata (zoom levels and bounds).
+function loadBinLayers(map, path, style, onLoad) {
+  fetch(path + '/metadata.json')
+    .then(function (response) {
+      return response.json()
+    })
+    .then(function (metadata) {
+      var zooms = metadata.zooms
+      var layers = zooms.map(function (zoom, i) {
+        var layer = new ol.layer.Vector({
+          source: new ol.source.Vector({
+            format: new ol.format.GeoJSON(),
+            url: path + '/' + zoom + '.json',
+          }),
+          minZoom: i > 0 ? zoom : undefined,
+          maxZoom: i + 1 < zooms.length ? zooms[i + 1] : metadata.rawzoom,
+          style: style,
+        })
+        map.addLayer(layer)
+        return layer
+      })
+      onLoad(layers, metadata)
+    })
+}
+
+// Grid bins are requested by adding `?bins` to the URL of a visualization.
+function useBins() {
+  return new URLSearchParams(window.location.search).has('bins')
+}
+
+var BINARY_TYPES = {
+  uint8: Uint8Array,
+  uint16: Uint16Array,
+  uint32: Uint32Array,
+  int32: Int32Array,
+}
+
+// Reads the measurements written by `obs-face -V --binary` from an ArrayBuffer and returns them as features. The
+// columns are mapped to typed arrays directly, which assumes a little endian machine, as virtually all are.
+function readBinaryMeasurements(buffer) {
+  var magic = String.fromCharCode.apply(null, new Uint8Array(buffer, 0, 4))
+  if (magic != 'OBSM') {
+    throw new Error('not a binary measurements file')
+  }
+  var headerLength = new DataView(buffer).getUint32(4, true)
+  var header = JSON.parse(new TextDecoder().decode(new Uint8Array(buffer, 8, headerLength)))
+  var start = 8 + headerLength
+  var n = header.count
+
+  // one function per column, decoding the value of row i
+  var columns = header.columns.map(function (column) {
+    var values = new BINARY_TYPES[column.type](buffer, start + column.offset, n)
+    var missing = column.missing
+    var decode
+    if (column.encoding == 'quantized') {
+      var divisor = column.divisor
+      decode = (i) => (values[i] == missing ? null : values[i] / divisor)
+    } else if (column.encoding == 'flag') {
+      decode = (i) => (values[i] == missing ? null : values[i] == 1)
+    } else if (column.encoding == 'time') {
+      var ms = new BINARY_TYPES[column.type_milliseconds](buffer, start + column.offset_milliseconds, n)
+      var utcOffsetIndex = new BINARY_TYPES[column.type_utc_offset](buffer, start + column.offset_utc_offset, n)
+      var utcOffsets = column.utc_offsets
+      var time = new Float64Array(n)
+      var seconds = column.base
+      for (var i = 0; i < n; i++) {
+        seconds += values[i]
+        time[i] = seconds * 1000 + ms[i]
+      }
+      decode = (i) => (ms[i] == missing ? null : formatTime(time[i], utcOffsets[utcOffsetIndex[i]]))
+    } else {
+      var dictionary = column.dictionary
+      decode = (i) => dictionary[values[i]]
+    }
+    return { name: column.name, decode: decode }
+  })
+
+  var lon = columns.find((c) => c.name == 'longitude').decode
+  var lat = columns.find((c) => c.name == 'latitude').decode
+  var properties = columns.filter((c) => c.name != 'longitude' && c.name != 'latitude')
+
+  var names = properties.map((c) => c.name)
+  var decoders = properties.map((c) => c.decode)
+  var m = properties.length
+
+  var features = new Array(n)
+  for (var i = 0; i < n; i++) {
+    var feature = new ol.Feature(new ol.geom.Point(ol.proj.fromLonLat([lon(i), lat(i)])))
+    var row = {}
+    for (var k = 0; k < m; k++) {
+      row[names[k]] = decoders[k](i)
+    }
+    feature.setProperties(row, true)
+    features[i] = feature
+  }
+  return features
+}
+
+// Formats a timestamp given in milliseconds since the epoch like Python's str() of a datetime, i.e. as in the GeoJSON
+// export: the local time for the UTC offset given in minutes, followed by the offset, or without it if null.
+function formatTime(milliseconds, utcOffset) {
+  var pad = (v, n) => String(v).padStart(n, '0')
+  var t = new Date(milliseconds + (utcOffset || 0) * 60000)
+  var s =
+    pad(t.getUTCFullYear(), 4) + '-' + pad(t.getUTCMonth() + 1, 2) + '-' + pad(t.getUTCDate(), 2) + ' ' +
+    pad(t.getUTCHours(), 2) + ':' + pad(t.getUTCMinutes(), 2) + ':' + pad(t.getUTCSeconds(), 2)
+  if (t.getUTCMilliseconds() != 0) {
+    s += '.' + pad(t.getUTCMilliseconds() * 1000, 6)
+  }
+  if (utcOffset != null) {
+    var a = Math.abs(utcOffset)
+    s += (utcOffset < 0 ? '-' : '+') + pad(Math.floor(a / 60), 2) + ':' + pad(a % 60, 2)
+  }
+  return s
+}
+
+// A vector source with the measurements of a binary file, e.g. 'json/measurements.bin'.
+function binaryMeasurementSource(url) {
+  var source = new ol.source.Vector({
+    loader: function () {
+      fetch(url)
+        .then(function (response) {
+          return response.arrayBuffer()
+        })
+        .then(function (buffer) {
+          source.addFeatures(readBinaryMeasurements(buffer))
+        })
+    },
+  })
+  return source
+}
+
+// The binary measurements are requested by adding `?binary` to the URL of a visualization.
+function useBinaryMeasurements() {
+  return new URLSearchParams(window.location.search).has('binary')
+}